@@ -0,0 +1,263 @@
+"""합성 이미지로 훈련 처리량을 측정하는 오프라인 벤치마크 스크립트.
+
+'--bench_models' × '--bench_netG' × '--bench_netD' × '--bench_sizes'의 모든 조합에 대해 짧은 훈련을 실행하고
+이미지/초, 데이터 로딩 시간과 스텝 연산 시간(각각 분리해서 측정), 최대 메모리 사용량(RSS, CUDA)을 기록합니다.
+데이터셋을 다운로드하지 않습니다. '--dataroot' 아래에 크기별 합성 JPEG 이미지(aligned/unaligned/colorization 형식)를
+한 번 생성하고 다음 실행부터 재사용합니다. pix2pix_with_perceptual은 '--vgg_weights'가 없으면
+무작위 초기화된 VGG19 가중치를 사용합니다 (연산량은 ImageNet 가중치와 같습니다).
+
+각 조합은 별도의 프로세스에서 실행되므로 최대 RSS가 조합마다 따로 측정되고, 한 조합이 실패해도
+(예: crop 128에서 unet_256) 나머지는 계속 진행됩니다. 명령줄의 다른 훈련 옵션(--batch_size, --num_threads,
+--amp, --fused_step, --compile 등)은 모든 조합에 그대로 전달되므로, 옵션 하나의 효과를 같은 조건에서 비교할 수 있습니다.
+
+결과는 '--bench_output'(기본값: [checkpoints_dir]/[name]/benchmark.json)에 조합별로 정렬된 JSON으로 저장됩니다.
+'--bench_baseline'에 이전 결과를 주면 조합별 변화율을 출력하고, 처리량이 '--bench_tolerance'보다 많이 줄었거나
+최대 RSS가 그만큼 늘어난 조합이 있으면 종료 코드 1로 끝납니다.
+
+예시:
+    python benchmark.py --dataroot ./datasets/benchmark
+    python benchmark.py --dataroot ./datasets/benchmark --bench_models pix2pix --bench_netD basic --bench_sizes 256 --batch_size 4 --bench_output base.json
+    python benchmark.py --dataroot ./datasets/benchmark --bench_models pix2pix --bench_netD basic --bench_sizes 256 --batch_size 4 --fused_step --bench_baseline base.json
+"""
+
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import torch
+from options.benchmark_options import BenchmarkOptions  # 벤치마크 옵션 파서
+
+# 모델별 데이터셋 형식과 합성 데이터 폴더
+MODEL_DATASETS = {"pix2pix": "aligned", "cycle_gan": "unaligned", "colorization": "colorization", "pix2pix_with_perceptual": "aligned"}
+DATASET_FOLDERS = {"aligned": ["aligned/train"], "unaligned": ["unaligned/trainA", "unaligned/trainB"], "colorization": ["colorization/train"]}
+RESULT_KEYS = ("model", "netG", "netD", "crop_size")
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def make_synthetic_data(root, size, num_images):
+    """<root>/<size>/ 아래에 모든 데이터셋 형식의 합성 이미지를 생성 (이미 있는 파일은 건너뜀)
+
+    저주파 무작위 패턴을 사용하므로 JPEG 디코딩 비용이 실제 사진과 비슷합니다. 파일마다 고정된 시드를 사용해 항상 같은 이미지가 생성됩니다.
+    """
+    for folders in DATASET_FOLDERS.values():
+        for k, folder in enumerate(folders):
+            folder = Path(root) / str(size) / folder
+            folder.mkdir(parents=True, exist_ok=True)
+            width = 2 * size if folder.parent.name == "aligned" else size  # aligned: A와 B를 가로로 붙인 이미지
+            for i in range(num_images):
+                path = folder / f"{i:05d}.jpg"
+                if path.exists():
+                    continue
+                rng = np.random.default_rng([size, k, i])
+                pattern = rng.integers(0, 256, (size // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+                Image.fromarray(pattern).resize((width, size), Image.BICUBIC).save(path, quality=90)
+
+
+def make_random_vgg_weights(path):
+    """무작위 초기화된 VGG19 features 가중치 저장 (오프라인에서 perceptual loss의 연산량을 재현)"""
+    import torchvision.models as models
+
+    if not Path(path).exists():
+        torch.save(models.vgg19().features.state_dict(), path)
+    return path
+
+
+def peak_rss_mb(children=False):
+    """현재 프로세스(또는 종료된 자식 프로세스 중 최대)의 최대 RSS (MB). 측정할 수 없으면 None"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        if children:
+            return None
+        try:
+            import psutil
+
+            return psutil.Process().memory_info().peak_wset / 1024**2
+        except (ImportError, AttributeError):
+            return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024**2 if sys.platform == "darwin" else usage / 1024  # macOS는 바이트, Linux는 KB
+
+
+def summarize(times):
+    """스텝별 시간(초) 목록을 ms 단위의 평균/중앙값/p90으로 요약"""
+    times = np.array(times) * 1000
+    return {"mean": float(times.mean()), "p50": float(np.percentile(times, 50)), "p90": float(np.percentile(times, 90))}
+
+
+def run_worker(opt):
+    """조합 하나를 실행하고 결과 dict를 반환 (--bench_worker 모드)"""
+    from data import create_dataset
+    from models import create_model
+    from util.util import init_ddp
+
+    opt.device = init_ddp()
+    opt.continue_train = False
+    dataset = create_dataset(opt)
+    model = create_model(opt)
+    model.setup(opt)
+    synchronize = torch.cuda.synchronize if opt.device.type == "cuda" else (lambda: None)
+
+    # 워밍업 스텝 이후부터 데이터 대기 시간과 연산 시간(set_input + optimize_parameters)을 따로 기록
+    data_times, compute_times, num_images = [], [], 0
+    step, epoch, total_steps = 0, 1, opt.bench_warmup + opt.bench_iters
+    while step < total_steps:
+        if hasattr(dataset, "set_epoch"):
+            dataset.set_epoch(epoch)
+        data_start = time.perf_counter()
+        for data in dataset:
+            compute_start = time.perf_counter()
+            model.set_input(data)
+            model.optimize_parameters()
+            synchronize()  # CUDA 연산이 끝날 때까지 기다려야 연산 시간이 다음 스텝의 데이터 시간으로 넘어가지 않음
+            compute_end = time.perf_counter()
+            if step >= opt.bench_warmup:
+                data_times.append(compute_start - data_start)
+                compute_times.append(compute_end - compute_start)
+                num_images += data["A"].shape[0]
+            step += 1
+            if step >= total_steps:
+                break
+            data_start = time.perf_counter()
+        epoch += 1
+    del dataset  # 데이터 로더 워커를 종료해서 자식 프로세스의 최대 RSS가 집계되게 함
+
+    total_time = sum(data_times) + sum(compute_times)
+    return {
+        "model": opt.model,
+        "netG": opt.netG,
+        "netD": opt.netD,
+        "crop_size": opt.crop_size,
+        "batch_size": opt.batch_size,
+        "device": str(opt.device),
+        "steps": len(compute_times),
+        "images": num_images,
+        "images_per_sec": num_images / total_time,
+        "compute_images_per_sec": num_images / sum(compute_times),
+        "data_ms": summarize(data_times),
+        "compute_ms": summarize(compute_times),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_worker_mb": peak_rss_mb(children=True),
+        "peak_cuda_mb": torch.cuda.max_memory_allocated(opt.device) / 1024**2 if opt.device.type == "cuda" else None,
+    }
+
+
+def run_combination(opt, args, model, netG, netD, size):
+    """조합 하나를 새 프로세스에서 실행하고 결과를 반환; 실패하면 'error'에 stderr 마지막 부분을 기록"""
+    dataset_mode = MODEL_DATASETS[model]
+    dataroot = Path(opt.dataroot) / str(size) / DATASET_FOLDERS[dataset_mode][0].split("/")[0]
+    command = [sys.executable, str(Path(__file__).resolve())] + args
+    command += ["--model", model, "--netG", netG, "--netD", netD, "--load_size", str(size), "--crop_size", str(size)]
+    command += ["--dataroot", str(dataroot), "--dataset_mode", dataset_mode, "--phase", "train"]
+    if model == "pix2pix_with_perceptual":
+        command += ["--use_perceptual"]
+        if "--vgg_weights" not in args:
+            command += ["--vgg_weights", str(make_random_vgg_weights(Path(opt.dataroot) / "vgg19_random.pth"))]
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        process = subprocess.run(command + ["--bench_worker", result_path], capture_output=True, text=True)
+        if process.returncode != 0:
+            return {"model": model, "netG": netG, "netD": netD, "crop_size": size, "error": process.stderr.strip()[-2000:]}
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def compare(results, baseline, tolerance):
+    """기준 결과와 비교해 조합별 변화율을 출력하고 회귀 목록을 반환"""
+    base = {tuple(r[k] for k in RESULT_KEYS): r for r in baseline["results"]}
+    regressions = []
+    print("----------------- Comparison with the baseline ---------------")
+    for result in results:
+        key = tuple(result[k] for k in RESULT_KEYS)
+        if key not in base:
+            continue
+        before = base[key]
+        if "error" in result or "error" in before:
+            if "error" in result and "error" not in before:
+                regressions.append(key)
+                print(f"{' '.join(map(str, key))}: failed (baseline succeeded)")
+            continue
+        speed = result["images_per_sec"] / before["images_per_sec"] - 1
+        memory = result["peak_rss_mb"] / before["peak_rss_mb"] - 1 if result["peak_rss_mb"] and before["peak_rss_mb"] else 0.0
+        regressed = speed < -tolerance or memory > tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{' '.join(map(str, key))}: throughput {speed:+.1%}, peak RSS {memory:+.1%}{'  <-- regression' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    opt = BenchmarkOptions().parse()
+
+    # 워커 모드: 조합 하나를 실행하고 결과를 파일로 전달
+    if opt.bench_worker:
+        result = run_worker(opt)
+        with open(opt.bench_worker, "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    # 벤치마크 옵션을 제외한 명령줄 인자는 모든 조합에 전달
+    args, skip = [], False
+    for arg in sys.argv[1:]:
+        if skip:
+            skip = False
+        elif arg.startswith("--bench_"):
+            skip = "=" not in arg  # the value follows as the next argument
+        else:
+            args.append(arg)
+
+    models, netGs, netDs, sizes = split_list(opt.bench_models), split_list(opt.bench_netG), split_list(opt.bench_netD), [int(s) for s in split_list(opt.bench_sizes)]
+    for model in models:
+        if model not in MODEL_DATASETS:
+            raise NotImplementedError("benchmark model [%s] is not recognized; choose from %s" % (model, ", ".join(MODEL_DATASETS)))
+    for size in sizes:
+        make_synthetic_data(opt.dataroot, size, opt.bench_images)
+
+    results = []
+    for model, netG, netD, size in itertools.product(models, netGs, netDs, sizes):
+        result = run_combination(opt, args, model, netG, netD, size)
+        results.append(result)
+        name = f"{model:>24} {netG:>15} {netD:>8} {size:>5}"
+        if "error" in result:
+            print(f"{name}: failed: {result['error'].splitlines()[-1] if result['error'] else 'unknown error'}")
+        else:
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+            print(f"{name}: {result['images_per_sec']:7.2f} img/s (compute only {result['compute_images_per_sec']:.2f}), data {result['data_ms']['p50']:.1f} ms, step {result['compute_ms']['p50']:.1f} ms, peak RSS {rss}")
+
+    output = {
+        "environment": {
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        },
+        "settings": {"args": args, "iters": opt.bench_iters, "warmup": opt.bench_warmup, "images": opt.bench_images},
+        "results": sorted(results, key=lambda r: tuple(str(r[k]) for k in RESULT_KEYS)),  # 조합 순서를 고정해 diff하기 쉽게 함
+    }
+    output_path = Path(opt.bench_output or Path(opt.checkpoints_dir) / opt.name / "benchmark.json")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"results written to {output_path}")
+
+    if opt.bench_baseline:
+        with open(opt.bench_baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(output["results"], baseline, opt.bench_tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {opt.bench_tolerance:.0%}")
+            sys.exit(1)
@@ -12,6 +12,9 @@ See our template dataset class 'template_dataset.py' for more details.
 """
 
 import importlib
+import itertools
+import random
+import numpy as np
 import torch.utils.data
 from torch.utils.data.distributed import DistributedSampler
 import torch.distributed as dist
@@ -62,6 +65,66 @@ def create_dataset(opt):
     return dataset
 
 
+class ResumableSampler(DistributedSampler):
+    """A DistributedSampler (also used without DDP, as a single replica) whose next epoch can start at a given position.
+
+    The sample order only depends on (seed, epoch), so a resumed run sees exactly the batches it would have seen;
+    the skipped samples are never loaded or decoded.
+    """
+
+    def __init__(self, dataset, num_replicas=None, rank=None, shuffle=True, seed=0):
+        super(ResumableSampler, self).__init__(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle, seed=seed)
+        self.start_index = 0
+
+    def skip(self, num_samples):
+        """Start the next epoch after the first <num_samples> samples of this replica"""
+        self.start_index = num_samples
+
+    def __iter__(self):
+        indices = list(super(ResumableSampler, self).__iter__())[self.start_index :]
+        self.start_index = 0  # only the first epoch after resuming is shortened
+        return iter(indices)
+
+    def __len__(self):
+        return self.num_samples - self.start_index
+
+
+class SeededDataset(torch.utils.data.Dataset):
+    """Wrap a map-style dataset so that the random augmentation of every sample only depends on (seed, epoch, index).
+
+    The Python, NumPy and torch random generators are seeded per sample before <__getitem__>, so a sample is augmented
+    the same way whichever DataLoader worker loads it and however many samples were loaded (or skipped) before it.
+    In the main process (num_threads 0) the generator states are restored afterwards, so the training random stream
+    (e.g. dropout) is not affected.
+    """
+
+    def __init__(self, dataset, seed):
+        self.dataset = dataset
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        sample_seed = hash((self.seed, self.epoch, index)) % 2**32  # hashing a tuple of ints is not randomized across processes
+        if torch.utils.data.get_worker_info() is not None:
+            random.seed(sample_seed)
+            np.random.seed(sample_seed)
+            torch.manual_seed(sample_seed)
+            return self.dataset[index]
+        python_state, numpy_state = random.getstate(), np.random.get_state()
+        try:
+            with torch.random.fork_rng(devices=[]):
+                random.seed(sample_seed)
+                np.random.seed(sample_seed)
+                torch.manual_seed(sample_seed)
+                return self.dataset[index]
+        finally:
+            random.setstate(python_state)
+            np.random.set_state(numpy_state)
+
+
 class CustomDatasetDataLoader:
     """Wrapper class of Dataset class that performs multi-threaded data loading"""
 
@@ -76,16 +139,36 @@ class CustomDatasetDataLoader:
         self.dataset = dataset_class(opt)
         print("dataset [%s] was created" % type(self.dataset).__name__)
 
+        # seed of the per-epoch sample order; saved with the training state so that a resumed run keeps the same order
+        self.seed = int(torch.randint(0, 2**31 - 1, ()).item())
+        if dist.is_available() and dist.is_initialized():  # all ranks must share the permutation that DistributedSampler splits
+            seed = [self.seed]
+            dist.broadcast_object_list(seed, src=0)
+            self.seed = seed[0]
+        self.start_batch = 0
+
+        # the DataLoader draws the worker seeds from its own generator, re-seeded from (seed, epoch) by <set_epoch>,
+        # instead of from the global torch RNG: the resumed epoch gets the same worker seeds and the global stream is not consumed
+        self.generator = torch.Generator()
+        self.generator.manual_seed(self.seed)
+        self.loader_dataset = self.dataset
+
+        if isinstance(self.dataset, torch.utils.data.IterableDataset):
+            # streaming datasets (e.g. 'sharded') split and shuffle their shards per rank and per worker themselves
+            self.sampler = None
         # Use DistributedSampler for DDP training
-        if "LOCAL_RANK" in os.environ:
+        elif "LOCAL_RANK" in os.environ:
             print(f'create DDP sampler on rank {int(os.environ["LOCAL_RANK"])}')
-            self.sampler = DistributedSampler(self.dataset, shuffle=not opt.serial_batches)
-            shuffle = False  # DistributedSampler handles shuffling
+            self.sampler = ResumableSampler(self.dataset, shuffle=not opt.serial_batches, seed=self.seed)
         else:
-            self.sampler = None
-            shuffle = not opt.serial_batches
+            # a single-replica sampler: shuffles like RandomSampler, but the order is reproducible from (seed, epoch)
+            self.sampler = ResumableSampler(self.dataset, num_replicas=1, rank=0, shuffle=not opt.serial_batches, seed=self.seed)
+        if self.sampler is not None:
+            self.loader_dataset = SeededDataset(self.dataset, self.seed)  # augmentation reproducible per sample, e.g. after resuming
 
-        self.dataloader = torch.utils.data.DataLoader(self.dataset, batch_size=opt.batch_size, shuffle=shuffle, sampler=self.sampler, num_workers=int(opt.num_threads))
+        self.dataloader = torch.utils.data.DataLoader(
+            self.loader_dataset, batch_size=opt.batch_size, shuffle=False, sampler=self.sampler, num_workers=int(opt.num_threads), generator=self.generator
+        )
 
     def load_data(self):
         return self
@@ -96,12 +179,53 @@ class CustomDatasetDataLoader:
 
     def __iter__(self):
         """Return a batch of data"""
-        for i, data in enumerate(self.dataloader):
+        start, self.start_batch = self.start_batch, 0
+        batches = enumerate(self.dataloader, start)
+        if start > 0 and self.sampler is None and not hasattr(self.dataset, "skip_batches"):
+            print(f"Warning: {type(self.dataset).__name__} cannot skip samples; loading and discarding {start} batches")
+            batches = itertools.islice(enumerate(self.dataloader), start, None)
+        for i, data in batches:
             if i * self.opt.batch_size >= self.opt.max_dataset_size:
                 break
+            if self.opt.batch_augment:  # crop/flip/normalize the whole uint8 batch at once
+                data = self.dataset.augment_batch(data)
             yield data
+        if hasattr(self.dataset, "skip_batches"):
+            self.dataset.skip_batches(0)
 
     def set_epoch(self, epoch):
-        """Set epoch for DistributedSampler to ensure proper shuffling"""
+        """Set epoch for DistributedSampler (or a streaming dataset) to ensure proper shuffling"""
         if self.sampler is not None:
             self.sampler.set_epoch(epoch)
+        if isinstance(self.loader_dataset, SeededDataset):
+            self.loader_dataset.epoch = epoch
+        if hasattr(self.dataset, "set_epoch"):
+            self.dataset.set_epoch(epoch)
+        self.generator.manual_seed(hash((self.seed, epoch)) % 2**63)
+
+    def skip(self, num_batches):
+        """Make the next epoch start at batch <num_batches> (per rank), e.g. when resuming in the middle of an epoch.
+
+        Map-style datasets skip at the sampler level and streaming datasets skip before decoding, so skipped samples cost (almost) nothing.
+        """
+        self.start_batch = num_batches
+        if self.sampler is not None:
+            self.sampler.skip(num_batches * self.opt.batch_size)
+        elif hasattr(self.dataset, "skip_batches"):
+            self.dataset.skip_batches(num_batches)
+
+    def state_dict(self):
+        """Return the state needed to reproduce the sample order and augmentation (saved with the training state).
+
+        The DataLoader generator is re-seeded from (seed, epoch) at every <set_epoch>, so the seed also determines its state.
+        """
+        return {"seed": self.seed}
+
+    def load_state_dict(self, state):
+        """Restore the state returned by <state_dict>"""
+        self.seed = state["seed"]
+        if self.sampler is not None:
+            self.sampler.seed = self.seed
+        if isinstance(self.loader_dataset, SeededDataset):
+            self.loader_dataset.seed = self.seed
+        self.generator.manual_seed(self.seed)
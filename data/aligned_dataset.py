@@ -1,6 +1,8 @@
 import os
-from data.base_dataset import BaseDataset, get_params, get_transform
+import numpy as np
+from data.base_dataset import BaseDataset, get_params, get_transform, get_resize_transform, get_batch_params, batch_transform, to_uint8_tensor
 from data.image_folder import make_dataset
+from data.image_cache import ImageCache, cache_options
 from PIL import Image
 
 
@@ -23,6 +25,28 @@ class AlignedDataset(BaseDataset):
         assert self.opt.load_size >= self.opt.crop_size  # crop_size should be smaller than the size of loaded image
         self.input_nc = self.opt.output_nc if self.opt.direction == "BtoA" else self.opt.input_nc
         self.output_nc = self.opt.input_nc if self.opt.direction == "BtoA" else self.opt.output_nc
+        # with --batch_augment, only the deterministic resize runs per sample; crop/flip run per batch in <augment_batch>
+        self.resize_transform = get_resize_transform(opt)
+        # optional pre-decoded image cache (--image_cache_dir)
+        self.cache = None
+        if opt.image_cache_dir:
+            self.cache = ImageCache(opt.image_cache_dir, f"aligned_{opt.phase}", self.AB_paths, self.load_AB, cache_options(opt))
+
+    def load_AB(self, AB_path):
+        """Read an AB image and split it into A and B (resized if --image_cache_resized); used to build the image cache"""
+        A, B = self.split_AB(Image.open(AB_path).convert("RGB"))
+        size = A.size
+        if self.opt.image_cache_resized:
+            resize = get_resize_transform(self.opt)
+            A, B = resize(A), resize(B)
+        return [np.asarray(A), np.asarray(B)], size
+
+    @staticmethod
+    def split_AB(AB):
+        """Split an AB image into its left (A) and right (B) halves"""
+        w, h = AB.size
+        w2 = int(w / 2)
+        return AB.crop((0, 0, w2, h)), AB.crop((w2, 0, w, h))
 
     def __getitem__(self, index):
         """Return a data point and its metadata information.
@@ -38,23 +62,39 @@ class AlignedDataset(BaseDataset):
         """
         # read a image given a random integer index
         AB_path = self.AB_paths[index]
-        AB = Image.open(AB_path).convert("RGB")
-        # split AB image into A and B
-        w, h = AB.size
-        w2 = int(w / 2)
-        A = AB.crop((0, 0, w2, h))
-        B = AB.crop((w2, 0, w, h))
+        if self.cache is not None:
+            (A, B), size = self.cache.get(index)
+            A, B = Image.fromarray(A), Image.fromarray(B)
+        else:
+            AB = Image.open(AB_path).convert("RGB")
+            # split AB image into A and B
+            A, B = self.split_AB(AB)
+            size = A.size
+        resize = self.cache is None or not self.opt.image_cache_resized  # cached images may already be resized
+
+        if self.opt.batch_augment:
+            if resize:
+                A, B = self.resize_transform(A), self.resize_transform(B)
+            return {"A": to_uint8_tensor(A), "B": to_uint8_tensor(B), "A_paths": AB_path, "B_paths": AB_path}
 
         # apply the same transform to both A and B
-        transform_params = get_params(self.opt, A.size)
-        A_transform = get_transform(self.opt, transform_params, grayscale=(self.input_nc == 1))
-        B_transform = get_transform(self.opt, transform_params, grayscale=(self.output_nc == 1))
+        transform_params = get_params(self.opt, size)
+        A_transform = get_transform(self.opt, transform_params, grayscale=(self.input_nc == 1), resize=resize)
+        B_transform = get_transform(self.opt, transform_params, grayscale=(self.output_nc == 1), resize=resize)
 
         A = A_transform(A)
         B = B_transform(B)
 
         return {"A": A, "B": B, "A_paths": AB_path, "B_paths": AB_path}
 
+    def augment_batch(self, data):
+        """Crop, flip and normalize a collated uint8 batch; A and B share the same crop and flip"""
+        n, _, h, w = data["A"].shape
+        rows, cols = get_batch_params(self.opt, n, h, w)
+        data["A"] = batch_transform(data["A"], rows, cols, grayscale=(self.input_nc == 1))
+        data["B"] = batch_transform(data["B"], rows, cols, grayscale=(self.output_nc == 1))
+        return data
+
     def __len__(self):
         """Return the total number of images in the dataset."""
         return len(self.AB_paths)
@@ -5,6 +5,7 @@ It also includes common transformation functions (e.g., get_transform, __scale_w
 
 import random
 import numpy as np
+import torch
 import torch.utils.data as data
 from PIL import Image
 import torchvision.transforms as transforms
@@ -60,6 +61,17 @@ class BaseDataset(data.Dataset, ABC):
         """
         pass
 
+    def augment_batch(self, data):
+        """Apply batch-level augmentation to a collated batch (used with --batch_augment).
+
+        Parameters:
+            data (dict) -- a collated batch returned by the DataLoader
+
+        Returns:
+            the augmented batch. The default implementation returns the batch unchanged.
+        """
+        return data
+
 
 def get_params(opt, size):
     w, h = size
@@ -79,11 +91,34 @@ def get_params(opt, size):
     return {"crop_pos": (x, y), "flip": flip}
 
 
-def get_transform(opt, params=None, grayscale=False, method=transforms.InterpolationMode.BICUBIC, convert=True):
+def get_resize_transform(opt, method=transforms.InterpolationMode.BICUBIC):
+    """Return only the deterministic resizing steps of <get_transform> (resize / scale_width / make_power_2).
+
+    These steps depend on the image size only, so their output can be cached (see data/image_cache.py).
+    Use together with get_transform(..., resize=False).
+    """
+    transform_list = []
+    if "resize" in opt.preprocess:
+        osize = [opt.load_size, opt.load_size]
+        transform_list.append(transforms.Resize(osize, method))
+    elif "scale_width" in opt.preprocess:
+        transform_list.append(transforms.Lambda(lambda img: __scale_width(img, opt.load_size, opt.crop_size, method)))
+    if opt.preprocess == "none":
+        transform_list.append(transforms.Lambda(lambda img: __make_power_2(img, base=4, method=method)))
+    return transforms.Compose(transform_list)
+
+
+def get_transform(opt, params=None, grayscale=False, method=transforms.InterpolationMode.BICUBIC, convert=True, resize=True):
+    """Return the preprocessing transform.
+
+    Set resize=False when the input has already gone through <get_resize_transform> (e.g. cached images).
+    """
     transform_list = []
     if grayscale:
         transform_list.append(transforms.Grayscale(1))
-    if "resize" in opt.preprocess:
+    if not resize:
+        pass
+    elif "resize" in opt.preprocess:
         osize = [opt.load_size, opt.load_size]
         transform_list.append(transforms.Resize(osize, method))
     elif "scale_width" in opt.preprocess:
@@ -95,7 +130,7 @@ def get_transform(opt, params=None, grayscale=False, method=transforms.Interpola
         else:
             transform_list.append(transforms.Lambda(lambda img: __crop(img, params["crop_pos"], opt.crop_size)))
 
-    if opt.preprocess == "none":
+    if opt.preprocess == "none" and resize:
         transform_list.append(transforms.Lambda(lambda img: __make_power_2(img, base=4, method=method)))
 
     if not opt.no_flip:
@@ -113,6 +148,53 @@ def get_transform(opt, params=None, grayscale=False, method=transforms.Interpola
     return transforms.Compose(transform_list)
 
 
+def to_uint8_tensor(img):
+    """Convert a PIL image to a (C, H, W) uint8 tensor without normalization (used with --batch_augment)"""
+    return torch.from_numpy(np.array(img, dtype=np.uint8)).permute(2, 0, 1).contiguous()
+
+
+def get_batch_params(opt, n, h, w):
+    """Sample crop positions and flips for a batch of n images of size (h, w).
+
+    Returns (rows, cols): index tensors of shape (n, crop_h) and (n, crop_w).
+    Flipped samples get reversed column indices, so cropping and flipping become a single gather in <batch_transform>.
+    Like <get_transform>, images smaller than the crop size are not cropped.
+    """
+    if "crop" in opt.preprocess:
+        th, tw = min(opt.crop_size, h), min(opt.crop_size, w)
+        y = torch.randint(0, h - th + 1, (n,))
+        x = torch.randint(0, w - tw + 1, (n,))
+    else:
+        th, tw = h, w
+        y = x = torch.zeros(n, dtype=torch.long)
+    rows = y[:, None] + torch.arange(th)
+    offsets = torch.arange(tw).expand(n, tw)
+    if not opt.no_flip:
+        flip = torch.rand(n) > 0.5
+        offsets = torch.where(flip[:, None], tw - 1 - offsets, offsets)
+    cols = x[:, None] + offsets
+    return rows, cols
+
+
+def batch_transform(images, rows, cols, grayscale=False):
+    """Crop, flip and normalize a batch of uint8 images in one pass.
+
+    Parameters:
+        images (tensor)  -- uint8 images of shape (N, 3, H, W)
+        rows, cols       -- index tensors returned by <get_batch_params>
+        grayscale (bool) -- convert RGB to a single channel (ITU-R 601-2 luma, as PIL's 'L' mode)
+
+    Returns float images of shape (N, C, crop_h, crop_w) in [-1, 1], like ToTensor + Normalize(0.5, 0.5) in <get_transform>.
+    """
+    n = images.shape[0]
+    out = images[torch.arange(n)[:, None, None], :, rows[:, :, None], cols[:, None, :]]  # (N, crop_h, crop_w, C)
+    out = out.permute(0, 3, 1, 2).float()
+    if grayscale:
+        weights = torch.tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)
+        out = (out * weights).sum(1, keepdim=True).round_()
+    return out.div_(127.5).sub_(1.0)
+
+
 def __transforms2pil_resize(method):
     mapper = {
         transforms.InterpolationMode.BILINEAR: Image.BILINEAR,
@@ -0,0 +1,122 @@
+"""This module implements a pre-decoded image cache backed by a memory-mapped uint8 file.
+
+Datasets decode every image once (optionally after the deterministic resize step of <get_transform>),
+append the raw pixels to '<cache_dir>/<name>-<key>.bin' and record offsets/shapes in '<name>-<key>.json'.
+Later epochs (and later runs) read the pixels straight from the memory map instead of decoding PNG/JPEG files.
+The memory map is opened read-only and lazily in each DataLoader worker, so the page cache is shared between workers.
+
+The cache key covers the image paths, their mtime and size, and the preprocessing options that affect the stored pixels;
+any change produces a new cache file.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def cache_options(opt):
+    """Return the options that change the cached pixels.
+
+    Parameters:
+        opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
+    """
+    if not opt.image_cache_resized:
+        return {"resized": False}
+    return {"resized": True, "preprocess": opt.preprocess, "load_size": opt.load_size, "crop_size": opt.crop_size}
+
+
+class ImageCache:
+    """A read-only cache of decoded images stored in a single memory-mapped file.
+
+    Each entry holds one or more uint8 arrays (e.g. the A and B halves of an aligned image) plus the original
+    (width, height) of the image, which <get_params> needs to sample crop positions.
+    """
+
+    def __init__(self, cache_dir, name, paths, load_fn, options=None):
+        """Open the cache, building it first if it is missing or stale.
+
+        Parameters:
+            cache_dir (str)   -- directory that stores the cache files
+            name (str)        -- a readable prefix for the cache files (e.g. 'aligned_train')
+            paths (str list)  -- the image files, in dataset order
+            load_fn (func)    -- load_fn(path) returns (list of HxWxC uint8 numpy arrays, (width, height))
+            options (dict)    -- preprocessing options that affect the cached pixels; part of the cache key
+        """
+        self.cache_dir = Path(cache_dir)
+        self.paths = list(paths)
+        key = self._cache_key(self.paths, options or {})
+        self.data_path = self.cache_dir / f"{name}-{key}.bin"
+        self.index_path = self.cache_dir / f"{name}-{key}.json"
+        if not (self.data_path.exists() and self.index_path.exists()):
+            self._build(load_fn)
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+        self.entries = index["entries"]
+        self.sizes = [tuple(size) for size in index["sizes"]]
+        self._data = None  # opened lazily in each worker
+
+    @staticmethod
+    def _cache_key(paths, options):
+        """Hash the file list (path, mtime, size) and the preprocessing options"""
+        h = hashlib.sha1()
+        h.update(json.dumps({"version": CACHE_VERSION, "options": options}, sort_keys=True).encode())
+        for path in paths:
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+        return h.hexdigest()[:16]
+
+    def _build(self, load_fn):
+        """Decode all images once and write them to the cache files"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        print(f"building image cache {self.data_path} for {len(self.paths)} images...")
+        tmp_data = self.data_path.with_suffix(f".bin.{os.getpid()}.tmp")  # per-process names: DDP ranks may build concurrently
+        tmp_index = self.index_path.with_suffix(f".json.{os.getpid()}.tmp")
+        entries, sizes = [], []
+        offset = 0
+        with open(tmp_data, "wb") as f:
+            for i, path in enumerate(self.paths):
+                arrays, size = load_fn(path)
+                entry = []
+                for array in arrays:
+                    array = np.ascontiguousarray(array, dtype=np.uint8)
+                    f.write(array.tobytes())
+                    entry.append([offset, list(array.shape)])
+                    offset += array.nbytes
+                entries.append(entry)
+                sizes.append(list(size))
+                if (i + 1) % 1000 == 0:
+                    print(f"cached {i + 1}/{len(self.paths)} images")
+        with open(tmp_index, "w") as f:
+            json.dump({"version": CACHE_VERSION, "entries": entries, "sizes": sizes}, f)
+        # rename the data file first so that an existing index always points to a complete data file
+        os.replace(tmp_data, self.data_path)
+        os.replace(tmp_index, self.index_path)
+        print(f"image cache built: {offset / 1024 ** 2:.1f} MB")
+
+    def __getstate__(self):
+        # do not pickle the memory map into DataLoader workers; each worker re-opens it
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, index):
+        """Return (list of uint8 arrays, original (width, height)) for the given index.
+
+        The arrays are read-only views into the memory map.
+        """
+        if self._data is None:
+            if self.data_path.stat().st_size == 0:  # np.memmap cannot map empty files
+                self._data = np.zeros(0, dtype=np.uint8)
+            else:
+                self._data = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        arrays = []
+        for offset, shape in self.entries[index]:
+            arrays.append(self._data[offset : offset + int(np.prod(shape))].reshape(shape))
+        return arrays, self.sizes[index]
@@ -0,0 +1,213 @@
+"""This module implements a streaming dataset over tar shards written by 'datasets/pack_shards.py'.
+
+Use '--dataset_mode sharded --dataroot /path/to/shards'; the directory must contain the index '<phase>.json'.
+The index records the layout of the packed dataset (aligned, unaligned or single), so one dataset mode covers all three.
+
+Instead of random access to individual files, each DataLoader worker reads whole shards sequentially:
+    -- every epoch the shard order is shuffled (the same permutation on every rank, seeded by the epoch),
+    -- the shards are split between all (rank, worker) pairs; with fewer shards than readers,
+       every reader scans the shards and keeps every n-th sample instead,
+    -- samples pass through a small shuffle buffer (--shard_shuffle_buffer) to mix neighbouring samples.
+Under DDP every rank yields the same number of samples (ceil(len / world_size), like DistributedSampler),
+re-reading its shards if needed, so all ranks run the same number of iterations.
+"""
+
+import io
+import json
+import math
+import os
+import random
+import tarfile
+import torch.distributed as dist
+import torch.utils.data
+from data.base_dataset import BaseDataset, get_params, get_transform, get_resize_transform, get_batch_params, batch_transform, to_uint8_tensor
+from data.aligned_dataset import AlignedDataset
+from PIL import Image
+
+
+class ShardedDataset(BaseDataset, torch.utils.data.IterableDataset):
+    """A streaming dataset class for aligned/unaligned/single datasets packed into tar shards."""
+
+    @staticmethod
+    def modify_commandline_options(parser, is_train):
+        """Add new dataset-specific options.
+
+        Parameters:
+            parser          -- original option parser
+            is_train (bool) -- whether training phase or test phase.
+
+        Returns:
+            the modified parser.
+        """
+        parser.add_argument("--shard_shuffle_buffer", type=int, default=256, help="number of samples in the per-worker shuffle buffer; 0 disables sample shuffling within shards")
+        return parser
+
+    def __init__(self, opt):
+        """Initialize this dataset class.
+
+        Parameters:
+            opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
+        """
+        BaseDataset.__init__(self, opt)
+        index_path = os.path.join(opt.dataroot, f"{opt.phase}.json")
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        self.mode = index["mode"]
+        self.shards = {domain: [(os.path.join(opt.dataroot, s["file"]), s["count"]) for s in shards] for domain, shards in index["domains"].items()}
+        self.sizes = {domain: sum(count for _, count in shards) for domain, shards in self.shards.items()}
+        if self.mode == "unaligned":
+            self.size = max(self.sizes["A"], self.sizes["B"])
+        else:
+            self.size = self.sizes["AB" if self.mode == "aligned" else "A"]
+        self.epoch = 0
+        self.start_batches = 0
+        # read on the main process: with the spawn start method (Windows, macOS) DataLoader workers have no process group
+        self.rank, self.world_size = (dist.get_rank(), dist.get_world_size()) if dist.is_available() and dist.is_initialized() else (0, 1)
+
+        btoA = self.opt.direction == "BtoA"
+        self.input_nc = self.opt.output_nc if btoA else self.opt.input_nc
+        self.output_nc = self.opt.input_nc if btoA else self.opt.output_nc
+        if self.mode == "aligned":
+            assert self.opt.load_size >= self.opt.crop_size  # crop_size should be smaller than the size of loaded image
+        elif self.mode == "unaligned":
+            self.transform_A = get_transform(self.opt, grayscale=(self.input_nc == 1))
+            self.transform_B = get_transform(self.opt, grayscale=(self.output_nc == 1))
+        else:
+            self.transform_A = get_transform(self.opt, grayscale=(self.input_nc == 1))
+        self.resize_transform = get_resize_transform(opt)
+
+    def set_epoch(self, epoch):
+        """Set the epoch that seeds the shard order; called by CustomDatasetDataLoader.set_epoch"""
+        self.epoch = epoch
+
+    def skip_batches(self, num_batches):
+        """Make the next epoch start after <num_batches> batches per rank; called by CustomDatasetDataLoader.skip.
+
+        The DataLoader takes batches from its workers in turn, so every worker drops its share of the first batches.
+        Skipped samples are read from the shards but not decoded.
+        """
+        self.start_batches = num_batches
+
+    def _reader(self):
+        """Return (reader id, number of readers, world size) over all DDP ranks and DataLoader workers"""
+        worker = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        return self.rank * num_workers + worker_id, self.world_size * num_workers, self.world_size
+
+    def _samples(self, domain, reader, num_readers, cycle):
+        """Yield (path, encoded bytes) of this reader's share of one domain, reading shards sequentially.
+
+        With cycle=True the shards are read again (in a new order) when exhausted.
+        """
+        shards = [path for path, _ in self.shards[domain]]
+        rounds = 0
+        while True:
+            order = list(shards)
+            if not self.opt.serial_batches:  # same permutation on every reader so that the split below is disjoint
+                random.Random(f"{domain}-{self.epoch}-{rounds}").shuffle(order)
+            if len(order) >= num_readers:
+                order, stride, offset = order[reader::num_readers], 1, 0
+            else:  # fewer shards than readers: every reader scans all shards and keeps every n-th sample
+                stride, offset = num_readers, reader
+            i = found = 0
+            for shard in order:
+                with tarfile.open(shard, "r|") as tar:  # stream mode: strictly sequential reads
+                    for member in tar:
+                        if not member.isfile():
+                            continue
+                        if i % stride == offset:
+                            yield os.path.join(shard, member.name), tar.extractfile(member).read()
+                            found += 1
+                        i += 1
+            if not cycle or found == 0:  # a reader with no samples of this domain must not spin forever
+                return
+            rounds += 1
+
+    def _shuffled(self, samples, rng):
+        """Shuffle a sample stream with a bounded buffer"""
+        buffer_size = 0 if self.opt.serial_batches else self.opt.shard_shuffle_buffer
+        if buffer_size <= 1:
+            yield from samples
+            return
+        buffer = []
+        for sample in samples:
+            if len(buffer) < buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(buffer_size)
+            yield buffer[i]
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    @staticmethod
+    def _decode(data):
+        return Image.open(io.BytesIO(data)).convert("RGB")
+
+    def __iter__(self):
+        """Yield data points in the same format as the aligned/unaligned/single datasets"""
+        reader, num_readers, world_size = self._reader()
+        rng = random.Random(f"{self.epoch}-{reader}")
+        readers_per_rank = num_readers // world_size
+        skip = len(range(reader % readers_per_rank, self.start_batches, readers_per_rank)) * self.opt.batch_size
+        # unaligned domains have different lengths and DDP ranks need equal lengths: draw a fixed number of samples, cycling the shards
+        cycle = self.mode == "unaligned" or world_size > 1
+        limit = None
+        if cycle:
+            per_rank = math.ceil(self.size / world_size)
+            limit = per_rank // readers_per_rank + (1 if reader % readers_per_rank < per_rank % readers_per_rank else 0)
+
+        if self.mode == "unaligned":
+            samples = zip(self._shuffled(self._samples("A", reader, num_readers, cycle), rng), self._shuffled(self._samples("B", reader, num_readers, cycle), rng))
+        else:
+            samples = self._shuffled(self._samples("AB" if self.mode == "aligned" else "A", reader, num_readers, cycle), rng)
+
+        for n, sample in enumerate(samples):
+            if limit is not None and n >= limit:
+                return
+            if n < skip:  # resuming in the middle of an epoch
+                continue
+            yield self._make_item(sample)
+
+    def _make_item(self, sample):
+        if self.mode == "aligned":
+            AB_path, data = sample
+            A, B = AlignedDataset.split_AB(self._decode(data))
+            if self.opt.batch_augment:
+                return {"A": to_uint8_tensor(self.resize_transform(A)), "B": to_uint8_tensor(self.resize_transform(B)), "A_paths": AB_path, "B_paths": AB_path}
+            # apply the same transform to both A and B
+            transform_params = get_params(self.opt, A.size)
+            A = get_transform(self.opt, transform_params, grayscale=(self.input_nc == 1))(A)
+            B = get_transform(self.opt, transform_params, grayscale=(self.output_nc == 1))(B)
+            return {"A": A, "B": B, "A_paths": AB_path, "B_paths": AB_path}
+
+        if self.mode == "unaligned":
+            (A_path, A_data), (B_path, B_data) = sample
+            A_img, B_img = self._decode(A_data), self._decode(B_data)
+            if self.opt.batch_augment:
+                return {"A": to_uint8_tensor(self.resize_transform(A_img)), "B": to_uint8_tensor(self.resize_transform(B_img)), "A_paths": A_path, "B_paths": B_path}
+            return {"A": self.transform_A(A_img), "B": self.transform_B(B_img), "A_paths": A_path, "B_paths": B_path}
+
+        A_path, data = sample
+        return {"A": self.transform_A(self._decode(data)), "A_paths": A_path}
+
+    def augment_batch(self, data):
+        """Crop, flip and normalize a collated uint8 batch (see AlignedDataset/UnalignedDataset.augment_batch)"""
+        if self.mode == "aligned":
+            n, _, h, w = data["A"].shape
+            rows, cols = get_batch_params(self.opt, n, h, w)
+            data["A"] = batch_transform(data["A"], rows, cols, grayscale=(self.input_nc == 1))
+            data["B"] = batch_transform(data["B"], rows, cols, grayscale=(self.output_nc == 1))
+        elif self.mode == "unaligned":
+            for key, nc in (("A", self.input_nc), ("B", self.output_nc)):
+                n, _, h, w = data[key].shape
+                rows, cols = get_batch_params(self.opt, n, h, w)
+                data[key] = batch_transform(data[key], rows, cols, grayscale=(nc == 1))
+        return data
+
+    def __getitem__(self, index):
+        raise TypeError("ShardedDataset is a streaming dataset and does not support random access")
+
+    def __len__(self):
+        """Return the total number of images in the dataset (the larger domain for unaligned datasets)."""
+        return self.size
@@ -1,7 +1,9 @@
 import os
-from data.base_dataset import BaseDataset, get_transform
+from data.base_dataset import BaseDataset, get_transform, get_resize_transform, get_batch_params, batch_transform, to_uint8_tensor
 from data.image_folder import make_dataset
+from data.image_cache import ImageCache, cache_options
 from PIL import Image
+import numpy as np
 import random
 
 
@@ -33,8 +35,25 @@ class UnalignedDataset(BaseDataset):
         btoA = self.opt.direction == "BtoA"
         input_nc = self.opt.output_nc if btoA else self.opt.input_nc  # get the number of channels of input image
         output_nc = self.opt.input_nc if btoA else self.opt.output_nc  # get the number of channels of output image
-        self.transform_A = get_transform(self.opt, grayscale=(input_nc == 1))
-        self.transform_B = get_transform(self.opt, grayscale=(output_nc == 1))
+        # optional pre-decoded image cache (--image_cache_dir); cached images may already be resized
+        self.cache_A = self.cache_B = None
+        if opt.image_cache_dir:
+            self.cache_A = ImageCache(opt.image_cache_dir, f"unaligned_{opt.phase}A", self.A_paths, self.load_image, cache_options(opt))
+            self.cache_B = ImageCache(opt.image_cache_dir, f"unaligned_{opt.phase}B", self.B_paths, self.load_image, cache_options(opt))
+        resize = not (opt.image_cache_dir and opt.image_cache_resized)
+        self.transform_A = get_transform(self.opt, grayscale=(input_nc == 1), resize=resize)
+        self.transform_B = get_transform(self.opt, grayscale=(output_nc == 1), resize=resize)
+        # with --batch_augment, only the deterministic resize runs per sample; crop/flip run per batch in <augment_batch>
+        self.resize_transform = get_resize_transform(opt) if resize else None
+        self.input_nc, self.output_nc = input_nc, output_nc
+
+    def load_image(self, path):
+        """Read an image (resized if --image_cache_resized); used to build the image cache"""
+        img = Image.open(path).convert("RGB")
+        size = img.size
+        if self.opt.image_cache_resized:
+            img = get_resize_transform(self.opt)(img)
+        return [np.asarray(img)], size
 
     def __getitem__(self, index):
         """Return a data point and its metadata information.
@@ -54,14 +73,31 @@ class UnalignedDataset(BaseDataset):
         else:  # randomize the index for domain B to avoid fixed pairs.
             index_B = random.randint(0, self.B_size - 1)
         B_path = self.B_paths[index_B]
-        A_img = Image.open(A_path).convert("RGB")
-        B_img = Image.open(B_path).convert("RGB")
+        if self.cache_A is not None:
+            A_img = Image.fromarray(self.cache_A.get(index % self.A_size)[0][0])
+            B_img = Image.fromarray(self.cache_B.get(index_B)[0][0])
+        else:
+            A_img = Image.open(A_path).convert("RGB")
+            B_img = Image.open(B_path).convert("RGB")
+        if self.opt.batch_augment:
+            if self.resize_transform is not None:
+                A_img, B_img = self.resize_transform(A_img), self.resize_transform(B_img)
+            return {"A": to_uint8_tensor(A_img), "B": to_uint8_tensor(B_img), "A_paths": A_path, "B_paths": B_path}
+
         # apply image transformation
         A = self.transform_A(A_img)
         B = self.transform_B(B_img)
 
         return {"A": A, "B": B, "A_paths": A_path, "B_paths": B_path}
 
+    def augment_batch(self, data):
+        """Crop, flip and normalize a collated uint8 batch; A and B are augmented independently"""
+        for key, nc in (("A", self.input_nc), ("B", self.output_nc)):
+            n, _, h, w = data[key].shape
+            rows, cols = get_batch_params(self.opt, n, h, w)
+            data[key] = batch_transform(data[key], rows, cols, grayscale=(nc == 1))
+        return data
+
     def __len__(self):
         """Return the total number of images in the dataset.
 
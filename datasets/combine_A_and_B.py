@@ -1,40 +1,6 @@
-import os
-import numpy as np
-import cv2
 import argparse
-from multiprocessing import Pool
 from pathlib import Path
-
-
-def image_write(path_A, path_B, path_AB):
-    """Combine two images side by side."""
-    try:
-        im_A = cv2.imread(str(path_A), cv2.IMREAD_COLOR)
-        im_B = cv2.imread(str(path_B), cv2.IMREAD_COLOR)
-        
-        if im_A is None:
-            print(f"Warning: Could not read image {path_A}")
-            return False
-        if im_B is None:
-            print(f"Warning: Could not read image {path_B}")
-            return False
-        
-        # Ensure both images have the same height
-        h_A, w_A = im_A.shape[:2]
-        h_B, w_B = im_B.shape[:2]
-        
-        if h_A != h_B:
-            # Resize to match the smaller height
-            target_h = min(h_A, h_B)
-            im_A = cv2.resize(im_A, (int(w_A * target_h / h_A), target_h))
-            im_B = cv2.resize(im_B, (int(w_B * target_h / h_B), target_h))
-        
-        im_AB = np.concatenate([im_A, im_B], 1)
-        cv2.imwrite(str(path_AB), im_AB)
-        return True
-    except Exception as e:
-        print(f"Error processing {path_A} and {path_B}: {e}")
-        return False
+from pair_builder import CODEC_SUFFIXES, build_pairs
 
 
 def main():
@@ -45,6 +11,12 @@ def main():
     parser.add_argument('--num_imgs', dest='num_imgs', help='number of images', type=int, default=1000000)
     parser.add_argument('--use_AB', dest='use_AB', help='if true: (0001_A, 0001_B) to (0001_AB)', action='store_true')
     parser.add_argument('--no_multiprocessing', dest='no_multiprocessing', help='If used, chooses single CPU execution instead of parallel execution', action='store_true', default=False)
+    parser.add_argument('--num_workers', type=int, default=None, help='number of worker processes (default: all CPUs)')
+    parser.add_argument('--load_size', type=int, default=0, help='if > 0, resize A and B to load_size x load_size (as --preprocess resize_and_crop does at training time)')
+    parser.add_argument('--codec', type=str, default='same', choices=['same'] + list(CODEC_SUFFIXES), help='output format; same keeps the extension of image A')
+    parser.add_argument('--quality', type=int, default=95, help='jpg/webp quality (0-100)')
+    parser.add_argument('--png_compression', type=int, default=3, help='png compression level (0-9)')
+    parser.add_argument('--prune', action='store_true', help='delete previously built pairs whose source images are gone')
     args = parser.parse_args()
 
     for arg in vars(args):
@@ -64,28 +36,17 @@ def main():
 
     # Get subdirectories or use root if no subdirectories
     splits = [p.name for p in fold_A.iterdir() if p.is_dir()]
-    
+
     # If no subdirectories, treat the root as a single split
     if not splits:
         splits = ['.']
         print("No subdirectories found. Processing images directly in A and B folders.")
 
-    pool = None
-    if not args.no_multiprocessing:
-        pool = Pool()
-
-    total_processed = 0
-    total_errors = 0
-
+    total = {'written': 0, 'skipped': 0, 'errors': 0}
     for sp in splits:
-        if sp == '.':
-            img_fold_A = fold_A
-            img_fold_B = fold_B
-            img_fold_AB = fold_AB
-        else:
-            img_fold_A = fold_A / sp
-            img_fold_B = fold_B / sp
-            img_fold_AB = fold_AB / sp
+        img_fold_A = fold_A / sp
+        img_fold_B = fold_B / sp
+        img_fold_AB = fold_AB / sp
 
         if not img_fold_A.exists():
             print(f"Warning: {img_fold_A} does not exist. Skipping...")
@@ -95,10 +56,8 @@ def main():
             continue
 
         # Get image files
-        img_list = []
-        for ext in ['*.jpg', '*.jpeg', '*.png', '*.JPG', '*.JPEG', '*.PNG']:
-            img_list.extend([p.name for p in img_fold_A.glob(ext) if p.is_file()])
-        
+        img_list = sorted(p.name for p in img_fold_A.iterdir() if p.is_file() and p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+
         if args.use_AB:
             img_list = [img_path for img_path in img_list if '_A.' in img_path]
 
@@ -108,56 +67,21 @@ def main():
 
         num_imgs = min(args.num_imgs, len(img_list))
         print(f'split = {sp}, use {num_imgs}/{len(img_list)} images')
-        
-        img_fold_AB.mkdir(parents=True, exist_ok=True)
-        print(f'split = {sp}, number of images = {num_imgs}')
-
-        tasks = []
-        for n in range(num_imgs):
-            name_A = img_list[n]
-            path_A = img_fold_A / name_A
-            if args.use_AB:
-                name_B = name_A.replace('_A.', '_B.')
-            else:
-                name_B = name_A
-            path_B = img_fold_B / name_B
-            
-            if not path_A.is_file():
-                print(f"Warning: {path_A} is not a file. Skipping...")
-                total_errors += 1
-                continue
-            if not path_B.is_file():
-                print(f"Warning: {path_B} is not a file. Skipping...")
-                total_errors += 1
-                continue
-
-            name_AB = name_A
-            if args.use_AB:
-                name_AB = name_AB.replace('_A.', '.')  # remove _A
-            path_AB = img_fold_AB / name_AB
-
-            if not args.no_multiprocessing:
-                tasks.append((path_A, path_B, path_AB))
-            else:
-                if image_write(path_A, path_B, path_AB):
-                    total_processed += 1
-                else:
-                    total_errors += 1
-
-        # Process tasks in parallel if multiprocessing is enabled
-        if not args.no_multiprocessing and tasks:
-            results = [pool.apply_async(image_write, args=task) for task in tasks]
-            for result in results:
-                if result.get():
-                    total_processed += 1
-                else:
-                    total_errors += 1
-
-    if pool:
-        pool.close()
-        pool.join()
-
-    print(f"\nCompleted! Processed: {total_processed}, Errors: {total_errors}")
+
+        pairs = []
+        for name_A in img_list[:num_imgs]:
+            name_B = name_A.replace('_A.', '_B.') if args.use_AB else name_A
+            name_AB = name_A.replace('_A.', '.') if args.use_AB else name_A  # remove _A
+            pairs.append((img_fold_A / name_A, img_fold_B / name_B, name_AB))
+        # --prune only deletes outputs whose source is gone, not the ones beyond --num_imgs
+        source_names = [name_A.replace('_A.', '.') if args.use_AB else name_A for name_A in img_list]
+
+        counts = build_pairs(pairs, img_fold_AB, args.load_size, args.codec, args.quality, args.png_compression,
+                             num_workers=0 if args.no_multiprocessing else args.num_workers, prune=args.prune, label=f'[{sp}] ', source_names=source_names)
+        for k in total:
+            total[k] += counts[k]
+
+    print(f"\nCompleted! Processed: {total['written']}, Up to date: {total['skipped']}, Errors: {total['errors']}")
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 import os
 
-from PIL import Image
+from pair_builder import CODEC_SUFFIXES, build_pairs
 
 
 def get_file_paths(folder):
@@ -17,19 +17,14 @@ def get_file_paths(folder):
     return image_file_paths
 
 
-def align_images(a_file_paths, b_file_paths, target_path):
-    if not os.path.exists(target_path):
-        os.makedirs(target_path)
+def align_images(a_file_paths, b_file_paths, target_path, **build_options):
+    """Pair the i-th A image with the i-th B image into '<target_path>/<i:04d>.jpg'; see <pair_builder.build_pairs> for the options.
 
-    for i in range(len(a_file_paths)):
-        img_a = Image.open(a_file_paths[i])
-        img_b = Image.open(b_file_paths[i])
-        assert(img_a.size == img_b.size)
-
-        aligned_image = Image.new("RGB", (img_a.size[0] * 2, img_a.size[1]))
-        aligned_image.paste(img_a, (0, 0))
-        aligned_image.paste(img_b, (img_a.size[0], 0))
-        aligned_image.save(os.path.join(target_path, '{:04d}.jpg'.format(i)))
+    A and B of a pair must have the same size; mismatched pairs are reported as errors and not written.
+    """
+    pairs = [(a, b, '{:04d}.jpg'.format(i)) for i, (a, b) in enumerate(zip(a_file_paths, b_file_paths))]
+    counts = build_pairs(pairs, target_path, label=f'[{os.path.basename(target_path)}] ', same_size=True, **build_options)
+    print(f"{target_path}: processed {counts['written']}, up to date {counts['skipped']}, errors {counts['errors']}")
 
 
 if __name__ == '__main__':
@@ -40,7 +35,15 @@ if __name__ == '__main__':
         dest='dataset_path',
         help='Which folder to process (it should have subfolders testA, testB, trainA and trainB'
     )
+    parser.add_argument('--num_workers', type=int, default=None, help='number of worker processes (default: all CPUs; 0 runs in a single process)')
+    parser.add_argument('--load_size', type=int, default=0, help='if > 0, resize A and B to load_size x load_size (as --preprocess resize_and_crop does at training time)')
+    parser.add_argument('--codec', type=str, default='same', choices=['same'] + list(CODEC_SUFFIXES), help='output format; same writes jpg')
+    parser.add_argument('--quality', type=int, default=75, help='jpg/webp quality (0-100); 75 is what this script wrote with PIL')
+    parser.add_argument('--png_compression', type=int, default=3, help='png compression level (0-9)')
+    parser.add_argument('--prune', action='store_true', help='delete previously built pairs that no longer have source images')
     args = parser.parse_args()
+    build_options = {'load_size': args.load_size, 'codec': args.codec, 'quality': args.quality,
+                     'png_compression': args.png_compression, 'num_workers': args.num_workers, 'prune': args.prune}
 
     dataset_folder = args.dataset_path
     print(dataset_folder)
@@ -59,5 +62,5 @@ if __name__ == '__main__':
     assert(len(train_a_file_paths) == len(train_b_file_paths))
     train_path = os.path.join(dataset_folder, 'train')
 
-    align_images(test_a_file_paths, test_b_file_paths, test_path)
-    align_images(train_a_file_paths, train_b_file_paths, train_path)
+    align_images(test_a_file_paths, test_b_file_paths, test_path, **build_options)
+    align_images(train_a_file_paths, train_b_file_paths, train_path, **build_options)
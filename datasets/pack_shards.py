@@ -0,0 +1,115 @@
+"""Pack an image dataset into sharded tar archives for '--dataset_mode sharded'.
+
+Images are stored as their original encoded bytes (no re-encoding), a fixed number of samples per shard,
+and an index '<out_dir>/<phase>.json' lists the shards of every domain with their sample counts.
+Training then streams whole shards sequentially instead of scanning the directory tree and reading small files.
+
+Layouts (same as the folder-based dataset modes):
+    aligned   -- '<dataroot>/<phase>' holds AB images             -> domain 'AB'
+    unaligned -- '<dataroot>/<phase>A' and '<dataroot>/<phase>B'  -> domains 'A' and 'B'
+    single    -- '<dataroot>' holds the images                    -> domain 'A'
+
+Example:
+    python datasets/pack_shards.py --dataroot ./datasets/facades --mode aligned --phase train --out_dir ./datasets/facades_shards
+    python train.py --dataroot ./datasets/facades_shards --dataset_mode sharded --model pix2pix --direction BtoA
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tarfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from data.image_folder import is_image_file  # the same extensions as the folder-based dataset modes
+
+INDEX_VERSION = 1
+
+
+def list_images(root):
+    """Return the image files under root (recursively) as sorted paths relative to root"""
+    root = Path(root)
+    if not root.is_dir():
+        raise FileNotFoundError(f"{root} is not a valid directory")
+    images = []
+    for dirpath, _, filenames in os.walk(root):  # os.walk uses scandir and avoids a stat() per file
+        for filename in filenames:
+            if is_image_file(filename):
+                images.append((Path(dirpath) / filename).relative_to(root).as_posix())
+    return sorted(images)
+
+
+def write_shard(path, root, names):
+    """Write one shard: each member is an image file named by its path relative to root"""
+    tmp_path = path.with_suffix(f".tar.{os.getpid()}.tmp")
+    with tarfile.open(tmp_path, "w") as tar:
+        for name in names:
+            data = (Path(root) / name).read_bytes()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o444
+            tar.addfile(info, io.BytesIO(data))
+    os.replace(tmp_path, path)
+
+
+def pack_domain(root, out_dir, prefix, shard_size, shuffle, seed, max_images):
+    """Pack all images under root into '<prefix>-NNNNNN.tar' shards and return their index entries"""
+    names = list_images(root)
+    if shuffle:  # spread similar (neighbouring) files over different shards
+        random.Random(seed).shuffle(names)
+    names = names[:max_images]
+    if not names:
+        raise RuntimeError(f"Found 0 images in: {root}")
+    shards = []
+    for start in range(0, len(names), shard_size):
+        chunk = names[start : start + shard_size]
+        filename = f"{prefix}-{len(shards):06d}.tar"
+        write_shard(Path(out_dir) / filename, root, chunk)
+        shards.append({"file": filename, "count": len(chunk)})
+        print(f"[{prefix}] wrote {filename} ({start + len(chunk)}/{len(names)} images)")
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser("pack an image dataset into tar shards")
+    parser.add_argument("--dataroot", type=str, required=True, help="dataset root, laid out as for --dataset_mode [aligned | unaligned | single]")
+    parser.add_argument("--mode", type=str, default="aligned", choices=["aligned", "unaligned", "single"], help="layout of the source dataset")
+    parser.add_argument("--phase", type=str, default="train", help="train, val, test, etc; names the index file <out_dir>/<phase>.json")
+    parser.add_argument("--out_dir", type=str, required=True, help="output directory for the shards and the index")
+    parser.add_argument("--shard_size", type=int, default=1000, help="number of images per shard")
+    parser.add_argument("--shuffle", action="store_true", help="shuffle the images before packing so that each shard holds a random subset")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for --shuffle")
+    parser.add_argument("--max_images", type=int, default=None, help="maximum number of images to pack per domain")
+    args = parser.parse_args()
+
+    for arg in vars(args):
+        print("[%s] = " % arg, getattr(args, arg))
+
+    dataroot = Path(args.dataroot)
+    if args.mode == "aligned":
+        sources = {"AB": dataroot / args.phase}
+    elif args.mode == "unaligned":
+        sources = {"A": dataroot / (args.phase + "A"), "B": dataroot / (args.phase + "B")}
+    else:
+        sources = {"A": dataroot}
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    domains = {}
+    for domain, root in sources.items():
+        domains[domain] = pack_domain(root, out_dir, f"{args.phase}-{domain}", max(1, args.shard_size), args.shuffle, args.seed, args.max_images)
+
+    index = {"version": INDEX_VERSION, "mode": args.mode, "domains": domains}
+    index_path = out_dir / f"{args.phase}.json"
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    counts = ", ".join(f"{domain}: {sum(s['count'] for s in shards)} images in {len(shards)} shards" for domain, shards in domains.items())
+    print(f"\nCompleted! {counts}; index written to {index_path}")
+
+
+if __name__ == "__main__":
+    main()
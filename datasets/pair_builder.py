@@ -0,0 +1,200 @@
+"""Build aligned AB images (A and B side by side) for '--dataset_mode aligned'; used by combine_A_and_B.py and make_dataset_aligned.py.
+
+The pairs are processed by a pool of worker processes in chunks, with a progress line every few seconds.
+A manifest '<out_dir>/.pairs_manifest.json' records, for every output image, the size, mtime and SHA-1 of its two
+source images and the build parameters. A re-run only processes pairs that are new or whose sources or parameters changed:
+    - size and mtime unchanged            -> skipped without reading the sources
+    - mtime changed but same content      -> skipped after hashing (e.g. the files were copied or touched)
+    - content or build parameters changed -> rebuilt
+The manifest is saved periodically, so an interrupted run resumes where it stopped. Outputs are written atomically.
+
+Optionally, A and B are resized to <load_size> x <load_size> at prepare time (what '--preprocess resize_and_crop' does at every
+epoch), and the output codec (jpg | png | webp) and quality can be chosen.
+
+Example:
+    from pair_builder import build_pairs
+    build_pairs([("A/1.jpg", "B/1.jpg", "1.jpg"), ...], "AB/train", load_size=286, codec="jpg", quality=90)
+"""
+
+import hashlib
+import json
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+import cv2
+import numpy as np
+
+MANIFEST_FILE = ".pairs_manifest.json"
+MANIFEST_VERSION = 1
+CODEC_SUFFIXES = {"jpg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+def output_name(name_AB, codec):
+    """Return the output file name for a pair: <name_AB> with the extension of <codec> ('same' keeps the extension)"""
+    return name_AB if codec == "same" else str(Path(name_AB).with_suffix(CODEC_SUFFIXES[codec]))
+
+
+def encode_params(path, quality, png_compression):
+    """Return the cv2.imencode parameters for the codec given by the extension of <path>"""
+    suffix = Path(path).suffix.lower()
+    if suffix in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if suffix == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if suffix == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    return []
+
+
+def combine(im_A, im_B, load_size=0):
+    """Put two images side by side: both are resized to load_size x load_size if load_size > 0, otherwise to the smaller height"""
+    if load_size > 0:
+        im_A, im_B = (cv2.resize(im, (load_size, load_size), interpolation=cv2.INTER_AREA if min(im.shape[:2]) > load_size else cv2.INTER_CUBIC) for im in (im_A, im_B))
+    elif im_A.shape[0] != im_B.shape[0]:
+        target_h = min(im_A.shape[0], im_B.shape[0])
+        im_A, im_B = (cv2.resize(im, (int(im.shape[1] * target_h / im.shape[0]), target_h)) for im in (im_A, im_B))
+    return np.concatenate([im_A, im_B], 1)
+
+
+def source_state(path, data=None):
+    """Return [size, mtime_ns, sha1] of a source file; the hash is None unless the file content <data> is given"""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, hashlib.sha1(data).hexdigest() if data is not None else None]
+
+
+def make_pair(job):
+    """Build one AB image (runs in a worker process).
+
+    job: (path_A, path_B, path_AB, params, known) where <known> holds the manifest's source hashes of this output (or None).
+    Returns (path_AB, entry or None, status, message) with status 'written' | 'unchanged' | 'error'.
+    """
+    path_A, path_B, path_AB, params, known = job
+    try:
+        data_A, data_B = Path(path_A).read_bytes(), Path(path_B).read_bytes()
+        entry = {"A": source_state(path_A, data_A), "B": source_state(path_B, data_B), "params": params}
+        if known is not None and known[0] == entry["A"][2] and known[1] == entry["B"][2] and Path(path_AB).exists():
+            return path_AB, entry, "unchanged", None  # same content, e.g. the sources were copied; nothing to rebuild
+        # decode from memory: cv2.imread cannot open non-ASCII paths on Windows
+        im_A = cv2.imdecode(np.frombuffer(data_A, np.uint8), cv2.IMREAD_COLOR)
+        im_B = cv2.imdecode(np.frombuffer(data_B, np.uint8), cv2.IMREAD_COLOR)
+        if im_A is None or im_B is None:
+            return path_AB, None, "error", f"Could not read image {path_A if im_A is None else path_B}"
+        if params["same_size"] and im_A.shape[:2] != im_B.shape[:2]:
+            return path_AB, None, "error", f"{path_A} ({im_A.shape[1]}x{im_A.shape[0]}) and {path_B} ({im_B.shape[1]}x{im_B.shape[0]}) differ in size"
+        ok, encoded = cv2.imencode(Path(path_AB).suffix, combine(im_A, im_B, params["load_size"]), encode_params(path_AB, params["quality"], params["png_compression"]))
+        if not ok:
+            return path_AB, None, "error", f"Could not encode {path_AB}"
+        tmp_path = Path(path_AB).with_name(f".{Path(path_AB).name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(encoded.tobytes())
+        os.replace(tmp_path, path_AB)
+        return path_AB, entry, "written", None
+    except Exception as e:
+        return path_AB, None, "error", f"Error processing {path_A} and {path_B}: {e}"
+
+
+def load_manifest(out_dir):
+    path = Path(out_dir) / MANIFEST_FILE
+    if path.exists():
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest["entries"]
+    return {}
+
+
+def save_manifest(out_dir, entries):
+    path = Path(out_dir) / MANIFEST_FILE
+    tmp_path = path.with_name(f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "entries": entries}, f)
+    os.replace(tmp_path, path)
+
+
+def build_pairs(pairs, out_dir, load_size=0, codec="same", quality=95, png_compression=3, num_workers=None, prune=False, label="", same_size=False, source_names=None):
+    """Build the AB images of <pairs> in <out_dir>, skipping pairs that are up to date.
+
+    Parameters:
+        pairs (list)          -- (path_A, path_B, name_AB) tuples; name_AB is the output file name in out_dir
+        out_dir (str)         -- output directory; also holds the manifest
+        load_size (int)       -- if > 0, resize A and B to load_size x load_size; otherwise match their heights
+        codec (str)           -- same (extension of name_AB) | jpg | png | webp
+        quality (int)         -- jpg/webp quality (0-100)
+        png_compression (int) -- png compression level (0-9)
+        num_workers (int)     -- number of worker processes; None uses all CPUs, 0 runs in this process
+        prune (bool)          -- delete outputs in the manifest whose pair is not in <source_names> any more
+        label (str)           -- prefix of the progress messages
+        same_size (bool)      -- report pairs whose A and B differ in size as errors instead of rescaling them
+        source_names (list)   -- with prune: name_AB of every pair whose sources exist, when <pairs> is only a subset
+                                 (e.g. the first --num_imgs); default: the names in <pairs>
+
+    Returns a dict with the number of 'written', 'skipped' and 'errors' pairs.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    params = {"load_size": load_size, "quality": quality, "png_compression": png_compression, "same_size": same_size}
+    entries = load_manifest(out_dir)
+    counts = {"written": 0, "skipped": 0, "errors": 0}
+
+    # decide which pairs need work: unchanged size/mtime and parameters -> skip without reading the sources
+    jobs, names = [], set()
+    for path_A, path_B, name_AB in pairs:
+        name = Path(output_name(name_AB, codec)).as_posix()  # manifest key: the path relative to out_dir
+        names.add(name)
+        entry = entries.get(name)
+        try:
+            state_A, state_B = source_state(path_A), source_state(path_B)
+        except OSError as e:
+            print(f"{label}Warning: {e}. Skipping...")
+            counts["errors"] += 1
+            continue
+        if entry is not None and entry["params"] == params and (out_dir / name).exists():
+            if entry["A"][:2] == state_A[:2] and entry["B"][:2] == state_B[:2]:
+                counts["skipped"] += 1
+                continue
+            known = (entry["A"][2], entry["B"][2])
+        else:
+            known = None
+        jobs.append((str(path_A), str(path_B), str(out_dir / name), params, known))
+
+    if prune:
+        if source_names is not None:
+            names = {Path(output_name(name_AB, codec)).as_posix() for name_AB in source_names}
+        for name in sorted(set(entries) - names):
+            (out_dir / name).unlink(missing_ok=True)
+            del entries[name]
+            print(f"{label}removed {name} (its sources are gone)")
+    print(f"{label}{len(jobs)} pairs to process, {counts['skipped']} up to date")
+
+    workers = (num_workers or os.cpu_count() or 1) if num_workers != 0 and len(jobs) > 1 else 1
+    pool = Pool(workers) if workers > 1 else None
+    chunksize = max(1, min(64, len(jobs) // (4 * workers)))  # large enough to amortize the IPC, small enough to balance the load
+    results = pool.imap_unordered(make_pair, jobs, chunksize) if pool is not None else map(make_pair, jobs)
+    start = last_report = last_save = time.time()
+    completed = False
+    try:
+        for done, (path_AB, entry, status, message) in enumerate(results, 1):
+            if status == "error":
+                print(f"{label}Warning: {message}")
+                counts["errors"] += 1
+            else:
+                entries[Path(path_AB).relative_to(out_dir).as_posix()] = entry
+                counts["written" if status == "written" else "skipped"] += 1
+            now = time.time()
+            if now - last_report >= 5 or done == len(jobs):
+                rate = done / max(now - start, 1e-6)
+                print(f"{label}{done}/{len(jobs)} pairs ({rate:.1f}/s, {(len(jobs) - done) / rate:.0f}s left)")
+                last_report = now
+            if now - last_save >= 30:  # an interrupted run resumes from the last saved manifest
+                save_manifest(out_dir, entries)
+                last_save = now
+        completed = True
+    finally:
+        if pool is not None:
+            if completed:
+                pool.close()
+            else:  # error or Ctrl-C: do not wait for the queued chunks; the manifest below records what is done
+                pool.terminate()
+            pool.join()
+        save_manifest(out_dir, entries)
+    return counts
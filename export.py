@@ -0,0 +1,47 @@
+"""학습된 generator를 독립 실행 가능한 추론 아티팩트로 내보내는 스크립트.
+
+test.py와 같은 방식으로 '--checkpoints_dir'에서 netG를 로드한 뒤, TorchScript 또는 torch.export 아티팩트로 저장합니다.
+아티팩트에는 그래프, 가중치, 전처리 정보(메타데이터)가 함께 들어 있어서
+웹 백엔드(Pix2PixInference)가 create_model과 옵션 파싱 없이 바로 로드할 수 있습니다.
+
+정규화 모드는 내보낼 때 고정됩니다:
+    --eval 지정 시: batchnorm은 running 통계를 사용하고 dropout은 꺼짐 (TorchScript는 freeze로 BN을 conv에 합침)
+    --eval 미지정 시: test.py 기본 동작과 같은 학습 모드 정규화 (TorchScript만 지원)
+
+예시:
+    pix2pix generator를 TorchScript로 내보내기:
+        python export.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA --eval
+
+    torch.export 프로그램(.pt2)으로 내보내기:
+        python export.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA --eval --export_format export
+
+    CycleGAN의 한 방향 generator 내보내기:
+        python export.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --eval
+
+'--dataroot'는 공통 옵션이라 필요하지만 데이터셋은 생성하지 않습니다.
+"""
+
+from options.export_options import ExportOptions  # 내보내기 옵션 파서
+from models import create_model  # 모델 생성 함수
+from models.inference import artifact_metadata, artifact_path, export_generator
+import torch
+
+
+if __name__ == "__main__":
+    # 내보내기 옵션 파싱
+    opt = ExportOptions().parse()
+
+    # 아티팩트는 CPU에서 만들고, 로드할 때 원하는 디바이스로 옮김
+    opt.device = torch.device("cpu")
+    opt.compile = False  # 컴파일된 래퍼가 아닌 원본 모듈을 내보냄
+    opt.tile_size = 0  # 타일 추론은 로드하는 쪽에서 적용
+
+    # 옵션에 따라 모델 생성 후 netG 로드
+    model = create_model(opt)
+    model.setup(opt)
+
+    metadata = artifact_metadata(opt, model.netG)
+    path = opt.export_path or artifact_path(model.save_dir, opt.epoch, opt.export_format)
+    print(f"exporting netG ({opt.netG}, eval={metadata['eval']}) as {opt.export_format} to {path}")
+    export_generator(model.netG, path, metadata, opt.export_format, opt.export_size or opt.crop_size)
+    print("done")
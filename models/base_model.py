@@ -1,10 +1,14 @@
 import os
+import contextlib
 import torch
 import torch.distributed as dist
 from pathlib import Path
 from collections import OrderedDict
 from abc import ABC, abstractmethod
 from . import networks
+from .inference import load_generator_artifact, optimize_generator, verify_generator
+from util.checkpoint import CheckpointWriter, rng_state, set_rng_state
+from util.profiler import StepTimer
 
 
 class BaseModel(ABC):
@@ -30,6 +34,7 @@ class BaseModel(ABC):
             -- self.model_names (str list):         define networks used in our training.
             -- self.visual_names (str list):        specify the images that you want to display and save.
             -- self.optimizers (optimizer list):    define and initialize optimizers. You can define one optimizer for each network. If two networks are updated at the same time, you can use itertools.chain to group them. See cycle_gan_model.py for an example.
+        Optionally, self.pool_names (str list) lists image pools (attributes '<name>_pool') that are saved with the checkpoints.
         """
         self.opt = opt
         self.isTrain = opt.isTrain
@@ -42,8 +47,17 @@ class BaseModel(ABC):
         self.model_names = []
         self.visual_names = []
         self.optimizers = []
+        self.pool_names = []
         self.image_paths = []
         self.metric = 0  # used for learning rate policy 'plateau'
+        # mixed precision (--amp): forward passes and losses run under <autocast>; fp16 gradients are scaled per optimizer
+        self.use_amp = getattr(opt, "amp", False)
+        self.amp_dtype = self.get_amp_dtype(getattr(opt, "amp_dtype", "auto")) if self.use_amp else None
+        self.grad_scalers = []  # one GradScaler per optimizer (fp16 only); created in <setup>
+        self.checkpoint_writer = None  # created by the first <save_networks> call
+        self.training_state = None  # training position restored by <load_training_state> (--continue_train)
+        # per-phase step timing (--profile_phases); <optimize_parameters> wraps its phases in self.timer.phase(name)
+        self.timer = StepTimer(self.device, enabled=getattr(opt, "profile_phases", False), window=getattr(opt, "profile_window", 100))
 
     @staticmethod
     def modify_commandline_options(parser, is_train):
@@ -86,6 +100,18 @@ class BaseModel(ABC):
         # Initialize all networks and load if needed
         for name in self.model_names:
             if isinstance(name, str):
+                # use an exported generator instead of the checkpoint (--netG_artifact)
+                if not self.isTrain and getattr(opt, "netG_artifact", "") and name.startswith("G"):
+                    if sum(1 for n in self.model_names if isinstance(n, str) and n.startswith("G")) > 1:
+                        raise ValueError("--netG_artifact needs a model with a single generator (e.g. --model test or pix2pix)")
+                    print(f"loading the generator artifact from {opt.netG_artifact}")
+                    original = getattr(self, "net" + name)
+                    net, _ = load_generator_artifact(opt.netG_artifact, self.device)
+                    for attr in ("net" + name, "netG"):  # TestModel keeps the generator under both names
+                        if getattr(self, attr, None) is original:
+                            setattr(self, attr, net)
+                    continue
+
                 net = getattr(self, "net" + name)
                 net = networks.init_net(net, opt.init_type, opt.init_gain)
 
@@ -117,9 +143,22 @@ class BaseModel(ABC):
                         self.__patch_instance_norm_state_dict(state_dict, net, key.split("."))
                     net.load_state_dict(state_dict)
 
+                # fold batch norms and drop Dropout/Identity layers of eval-mode generators (--optimize_inference)
+                if not self.isTrain and getattr(opt, "optimize_inference", False) and name.startswith("G"):
+                    if not opt.eval:
+                        raise ValueError("--optimize_inference requires --eval: folding uses the batch norm running statistics and removes dropout")
+                    optimized = optimize_generator(net)
+                    diff = verify_generator(net, optimized, min(opt.crop_size, 256), opt.optimize_tolerance)
+                    print(f"verified the optimized generator against the original: max abs diff {diff:.2e}")
+                    net = optimized
+
                 # Move network to device
                 net.to(self.device)
 
+                # Compile after loading so that the checkpoint keys carry no '_orig_mod.' prefix (--compile)
+                if getattr(opt, "compile", False):
+                    net = networks.compile_net(net, opt.compile_mode, opt.compile_cache_dir or str(Path(opt.checkpoints_dir) / "compile_cache"))
+
                 # Wrap networks with DDP after loading
                 if dist.is_initialized():
                     # Check if using syncbatch normalization for DDP
@@ -132,10 +171,55 @@ class BaseModel(ABC):
 
                 setattr(self, "net" + name, net)
 
+        # run generators tile by tile at test time (--tile_size)
+        if not self.isTrain and getattr(opt, "tile_size", 0) > 0:
+            for name in self.model_names:
+                if isinstance(name, str) and name.startswith("G"):
+                    net = getattr(self, "net" + name)
+                    setattr(self, "net" + name, networks.TiledGenerator(net, opt.tile_size, opt.tile_overlap, opt.tile_batch_size))
+
         self.print_networks(opt.verbose)
 
         if self.isTrain:
             self.schedulers = [networks.get_scheduler(optimizer, opt) for optimizer in self.optimizers]
+            if self.amp_dtype == torch.float16:  # bf16 has the fp32 exponent range and needs no loss scaling
+                self.grad_scalers = [torch.amp.GradScaler(torch.device(self.device).type) for _ in self.optimizers]
+                if opt.continue_train:
+                    self.load_grad_scalers(f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch)
+            if opt.continue_train:
+                self.load_image_pools(f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch)
+                self.training_state = self.load_training_state(f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch)
+            if self.use_amp:
+                print(f"mixed precision training with {self.amp_dtype} (gradient scaling: {bool(self.grad_scalers)})")
+
+    def get_amp_dtype(self, name):
+        """Return the autocast dtype for --amp_dtype; 'auto' selects fp16 on CUDA and bf16 elsewhere (e.g. CPU)"""
+        if name == "auto":
+            name = "fp16" if torch.device(self.device).type == "cuda" else "bf16"
+        if name not in ("bf16", "fp16"):
+            raise NotImplementedError("amp dtype [%s] is not recognized" % name)
+        return torch.bfloat16 if name == "bf16" else torch.float16
+
+    def autocast(self):
+        """Return the context that forward passes and loss computations run in; a no-op without --amp"""
+        if not self.use_amp:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=torch.device(self.device).type, dtype=self.amp_dtype)
+
+    def backward_loss(self, loss, optimizer):
+        """Backpropagate a loss whose gradients are applied by <optimizer>; scales the loss when fp16 gradient scaling is on"""
+        if self.grad_scalers:
+            loss = self.grad_scalers[self.optimizers.index(optimizer)].scale(loss)
+        loss.backward()
+
+    def optimizer_step(self, optimizer):
+        """Update weights with <optimizer>; with gradient scaling, unscale first and skip steps with inf/NaN gradients"""
+        if self.grad_scalers:
+            scaler = self.grad_scalers[self.optimizers.index(optimizer)]
+            scaler.step(optimizer)
+            scaler.update()
+        else:
+            optimizer.step()
 
     def eval(self):
         """Make models eval mode during test time"""
@@ -182,23 +266,46 @@ class BaseModel(ABC):
                 visual_ret[name] = getattr(self, name)
         return visual_ret
 
-    def get_current_losses(self):
-        """Return traning losses / errors. train.py will print out these errors on console, and save them to a file"""
+    def get_current_losses(self, as_tensors=False):
+        """Return traning losses / errors. train.py will print out these errors on console, and save them to a file
+
+        Parameters:
+            as_tensors (bool) -- return detached loss tensors (left on the device, no synchronization) instead of floats
+        """
         errors_ret = OrderedDict()
         for name in self.loss_names:
             if isinstance(name, str):
-                errors_ret[name] = float(getattr(self, "loss_" + name))  # float(...) works for both scalar tensor and float number
+                loss = getattr(self, "loss_" + name)
+                if as_tensors and isinstance(loss, torch.Tensor):
+                    errors_ret[name] = loss.detach()
+                else:
+                    errors_ret[name] = float(loss)  # float(...) works for both scalar tensor and float number
         return errors_ret
 
-    def save_networks(self, epoch):
-        """Save all the networks to the disk, unwrapping them first."""
+    def save_networks(self, epoch, training_state=None):
+        """Save all the networks to the disk, unwrapping them first.
+
+        Parameters:
+            epoch (int/str/list)  -- checkpoint tag(s), e.g. 'latest', 5 or ['latest', 5]; extra tags share the files written for the first one
+            training_state (dict) -- if given (e.g. {'epoch': 5, 'epoch_iter': 0, 'total_iters': 12000}), '<tag>_training_state.pth' stores it
+                                     together with the optimizer, scheduler and RNG states so that training can resume exactly
+
+        The state dicts are copied to CPU memory before this function returns; the files are written atomically by a
+        <CheckpointWriter>, in a background thread with --async_save.
+        """
+        tags = list(epoch) if isinstance(epoch, (list, tuple)) else [epoch]
+        rng_states = None
+        if training_state is not None:
+            rng_states = [rng_state()]
+            if dist.is_initialized():  # every rank has its own random streams (e.g. data augmentation)
+                rng_states = [None] * dist.get_world_size()
+                dist.all_gather_object(rng_states, rng_state())
 
         # Only allow the main process (rank 0) to save the checkpoint
         if not dist.is_initialized() or dist.get_rank() == 0:
+            files = {}
             for name in self.model_names:
                 if isinstance(name, str):
-                    save_filename = f"{epoch}_net_{name}.pth"
-                    save_path = self.save_dir / save_filename
                     net = getattr(self, "net" + name)
 
                     # 1. First, unwrap from DDP if it exists
@@ -212,7 +319,72 @@ class BaseModel(ABC):
                         model_to_save = model_to_save._orig_mod
 
                     # 3. Save the final, clean state_dict
-                    torch.save(model_to_save.state_dict(), save_path)
+                    files[f"net_{name}.pth"] = model_to_save.state_dict()
+
+            if self.grad_scalers:
+                files["amp_scalers.pth"] = [scaler.state_dict() for scaler in self.grad_scalers]
+
+            if self.pool_names:
+                files["image_pools.pth"] = {name: getattr(self, name + "_pool").state_dict() for name in self.pool_names}
+
+            if training_state is not None:
+                files["training_state.pth"] = dict(
+                    training_state,
+                    optimizers=[optimizer.state_dict() for optimizer in self.optimizers],
+                    schedulers=[scheduler.state_dict() for scheduler in getattr(self, "schedulers", [])],
+                    rng=rng_states,
+                )
+
+            if self.checkpoint_writer is None:
+                self.checkpoint_writer = CheckpointWriter(self.save_dir, getattr(self.opt, "async_save", False), getattr(self.opt, "keep_last", 0), getattr(self.opt, "keep_every", 0))
+            self.checkpoint_writer.save(tags, files)
+
+    def flush_checkpoints(self):
+        """Wait until all checkpoints passed to <save_networks> are written; call before the training script exits"""
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
+
+    def load_image_pools(self, epoch):
+        """Restore the image pool contents saved by <save_networks> (if any)"""
+        load_path = self.save_dir / f"{epoch}_image_pools.pth"
+        if not self.pool_names or not load_path.exists():
+            return
+        print(f"loading the image pools from {load_path}")
+        states = torch.load(load_path, weights_only=True)
+        for name in self.pool_names:
+            if name in states:
+                getattr(self, name + "_pool").load_state_dict(states[name])
+
+    def load_training_state(self, epoch):
+        """Restore the optimizer, scheduler and RNG states saved by <save_networks> (if any).
+
+        Returns the saved training position (e.g. {'epoch': 5, 'epoch_iter': 400, 'total_iters': 12400, 'data': {...}}),
+        or None if the checkpoint has no training state.
+        """
+        load_path = self.save_dir / f"{epoch}_training_state.pth"
+        if not load_path.exists():
+            return None
+        print(f"loading the training state from {load_path}")
+        state = torch.load(load_path, map_location="cpu", weights_only=True)
+        for optimizer, optimizer_state in zip(self.optimizers, state["optimizers"]):
+            optimizer.load_state_dict(optimizer_state)  # moves the moments to the parameters' device
+        for scheduler, scheduler_state in zip(self.schedulers, state["schedulers"]):
+            scheduler.load_state_dict(scheduler_state)
+        if state.get("rng"):
+            rank = dist.get_rank() if dist.is_initialized() else 0
+            set_rng_state(state["rng"][rank % len(state["rng"])])
+        return {key: value for key, value in state.items() if key not in ("optimizers", "schedulers", "rng")}
+
+    def load_grad_scalers(self, epoch):
+        """Restore the GradScaler states saved by <save_networks> (if any)"""
+        load_path = self.save_dir / f"{epoch}_amp_scalers.pth"
+        if not self.grad_scalers or not load_path.exists():
+            return
+        print(f"loading the gradient scalers from {load_path}")
+        states = torch.load(load_path, weights_only=True)
+        for scaler, state in zip(self.grad_scalers, states):
+            scaler.load_state_dict(state)
 
     def __patch_instance_norm_state_dict(self, state_dict, module, keys, i=0):
         """Fix InstanceNorm checkpoints incompatibility (prior to 0.4)"""
@@ -233,7 +405,10 @@ class BaseModel(ABC):
                 pass
 
     def load_networks(self, epoch):
-        """Load all networks from the disk for DDP."""
+        """Load all networks from the disk for DDP.
+
+        Only the networks are loaded; with --continue_train, <setup> restores the image pools, gradient scalers and training state.
+        """
 
         for name in self.model_names:
             if isinstance(name, str):
@@ -243,6 +418,8 @@ class BaseModel(ABC):
 
                 if isinstance(net, torch.nn.parallel.DistributedDataParallel):
                     net = net.module
+                if hasattr(net, "_orig_mod"):  # compiled with --compile; load into the original module
+                    net = net._orig_mod
                 print(f"loading the model from {load_path}")
 
                 state_dict = torch.load(load_path, map_location=str(self.device), weights_only=True)
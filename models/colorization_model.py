@@ -53,14 +53,13 @@ class ColorizationModel(Pix2PixModel):
             AB (2-channel tensor array):  ab channel images (range: [-1, 1], torch tensor array)
 
         Returns:
-            rgb (RGB numpy image): rgb output images  (range: [0, 255], numpy array)
+            rgb (RGB numpy images): rgb output images of every sample in the batch (N x H x W x 3, range: [0, 255], numpy array)
         """
         AB2 = AB * 110.0
         L2 = (L + 1.0) * 50.0
         Lab = torch.cat([L2, AB2], dim=1)
-        Lab = Lab[0].data.cpu().float().numpy()
-        Lab = np.transpose(Lab.astype(np.float64), (1, 2, 0))
-        rgb = color.lab2rgb(Lab) * 255
+        Lab = np.transpose(Lab.data.cpu().float().numpy().astype(np.float64), (0, 2, 3, 1))
+        rgb = np.stack([color.lab2rgb(lab) for lab in Lab]) * 255
         return rgb
 
     def compute_visuals(self):
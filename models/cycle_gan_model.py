@@ -76,8 +76,8 @@ class CycleGANModel(BaseModel):
         # define networks (both Generators and discriminators)
         # The naming is different from those used in the paper.
         # Code (vs. paper): G_A (G), G_B (F), D_A (D_Y), D_B (D_X)
-        self.netG_A = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain)
-        self.netG_B = networks.define_G(opt.output_nc, opt.input_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain)
+        self.netG_A = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain, getattr(opt, "grad_checkpoint", ""))
+        self.netG_B = networks.define_G(opt.output_nc, opt.input_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain, getattr(opt, "grad_checkpoint", ""))
 
         if self.isTrain:  # define discriminators
             self.netD_A = networks.define_D(opt.output_nc, opt.ndf, opt.netD, opt.n_layers_D, opt.norm, opt.init_type, opt.init_gain)
@@ -86,8 +86,9 @@ class CycleGANModel(BaseModel):
         if self.isTrain:
             if opt.lambda_identity > 0.0:  # only works when input and output images have the same number of channels
                 assert opt.input_nc == opt.output_nc
-            self.fake_A_pool = ImagePool(opt.pool_size)  # create image buffer to store previously generated images
-            self.fake_B_pool = ImagePool(opt.pool_size)  # create image buffer to store previously generated images
+            self.fake_A_pool = ImagePool(opt.pool_size, opt.pool_storage)  # create image buffer to store previously generated images
+            self.fake_B_pool = ImagePool(opt.pool_size, opt.pool_storage)  # create image buffer to store previously generated images
+            self.pool_names = ["fake_A", "fake_B"]  # saved with the checkpoints so that resumed runs keep their history
             # define loss functions
             self.criterionGAN = networks.GANLoss(opt.gan_mode).to(self.device)  # define GAN loss.
             self.criterionCycle = torch.nn.L1Loss()
@@ -118,6 +119,27 @@ class CycleGANModel(BaseModel):
         self.fake_A = self.netG_B(self.real_B)  # G_B(B)
         self.rec_B = self.netG_A(self.fake_A)  # G_A(G_B(B))
 
+    def forward_fused(self):
+        """Training forward pass with fewer, larger generator calls (--fused_step).
+
+        G_B runs once on [B, A] (fake_A and idt_B), G_A once on [A, B, fake_A] (fake_B, idt_A and rec_B),
+        and G_B once more on fake_B (rec_A): three generator calls instead of six.
+        The identity mappings are skipped when lambda_identity is 0.
+
+        Batch norm keeps per-chunk statistics (see <networks.fused_forward>), so the outputs and losses of every step
+        are the same as with <forward>. The chunks reach each generator in a different order than the six separate calls,
+        though, so batch norm running statistics (used at test time with --eval) are updated in a different order,
+        and dropout masks (only with dropout enabled) are drawn in a different order.
+        """
+        idt = self.opt.lambda_identity > 0
+        if idt:
+            self.fake_A, self.idt_B = networks.fused_forward(self.netG_B, [self.real_B, self.real_A])  # G_B(B), G_B(A)
+            self.fake_B, self.idt_A, self.rec_B = networks.fused_forward(self.netG_A, [self.real_A, self.real_B, self.fake_A])  # G_A(A), G_A(B), G_A(G_B(B))
+        else:
+            self.fake_A = self.netG_B(self.real_B)  # G_B(B)
+            self.fake_B, self.rec_B = networks.fused_forward(self.netG_A, [self.real_A, self.fake_A])  # G_A(A), G_A(G_B(B))
+        self.rec_A = self.netG_B(self.fake_B)  # G_B(G_A(A))
+
     def backward_D_basic(self, netD, real, fake):
         """Calculate GAN loss for the discriminator
 
@@ -129,15 +151,20 @@ class CycleGANModel(BaseModel):
         Return the discriminator loss.
         We also call loss_D.backward() to calculate the gradients.
         """
-        # Real
-        pred_real = netD(real)
-        loss_D_real = self.criterionGAN(pred_real, True)
-        # Fake
-        pred_fake = netD(fake.detach())
-        loss_D_fake = self.criterionGAN(pred_fake, False)
-        # Combined loss and calculate gradients
-        loss_D = (loss_D_real + loss_D_fake) * 0.5
-        loss_D.backward()
+        with self.autocast():
+            if self.opt.fused_step:  # one netD forward over [real; fake], with per-half batch norm statistics
+                pred_real, pred_fake = networks.fused_forward(netD, [real, fake.detach()])
+            else:
+                pred_real = netD(real)
+                pred_fake = netD(fake.detach())
+            # Real
+            loss_D_real = self.criterionGAN(pred_real, True)
+            # Fake
+            loss_D_fake = self.criterionGAN(pred_fake, False)
+            # Combined loss
+            loss_D = (loss_D_real + loss_D_fake) * 0.5
+        # calculate gradients
+        self.backward_loss(loss_D, self.optimizer_D)
         return loss_D
 
     def backward_D_A(self):
@@ -155,42 +182,54 @@ class CycleGANModel(BaseModel):
         lambda_idt = self.opt.lambda_identity
         lambda_A = self.opt.lambda_A
         lambda_B = self.opt.lambda_B
-        # Identity loss
-        if lambda_idt > 0:
-            # G_A should be identity if real_B is fed: ||G_A(B) - B||
-            self.idt_A = self.netG_A(self.real_B)
-            self.loss_idt_A = self.criterionIdt(self.idt_A, self.real_B) * lambda_B * lambda_idt
-            # G_B should be identity if real_A is fed: ||G_B(A) - A||
-            self.idt_B = self.netG_B(self.real_A)
-            self.loss_idt_B = self.criterionIdt(self.idt_B, self.real_A) * lambda_A * lambda_idt
-        else:
-            self.loss_idt_A = 0
-            self.loss_idt_B = 0
-
-        # GAN loss D_A(G_A(A))
-        self.loss_G_A = self.criterionGAN(self.netD_A(self.fake_B), True)
-        # GAN loss D_B(G_B(B))
-        self.loss_G_B = self.criterionGAN(self.netD_B(self.fake_A), True)
-        # Forward cycle loss || G_B(G_A(A)) - A||
-        self.loss_cycle_A = self.criterionCycle(self.rec_A, self.real_A) * lambda_A
-        # Backward cycle loss || G_A(G_B(B)) - B||
-        self.loss_cycle_B = self.criterionCycle(self.rec_B, self.real_B) * lambda_B
-        # combined loss and calculate gradients
-        self.loss_G = self.loss_G_A + self.loss_G_B + self.loss_cycle_A + self.loss_cycle_B + self.loss_idt_A + self.loss_idt_B
-        self.loss_G.backward()
+        with self.autocast():
+            # Identity loss
+            if lambda_idt > 0:
+                # G_A should be identity if real_B is fed: ||G_A(B) - B|| (with --fused_step, idt_A and idt_B come from <forward_fused>)
+                if not self.opt.fused_step:
+                    self.idt_A = self.netG_A(self.real_B)
+                self.loss_idt_A = self.criterionIdt(self.idt_A.float(), self.real_B) * lambda_B * lambda_idt
+                # G_B should be identity if real_A is fed: ||G_B(A) - A||
+                if not self.opt.fused_step:
+                    self.idt_B = self.netG_B(self.real_A)
+                self.loss_idt_B = self.criterionIdt(self.idt_B.float(), self.real_A) * lambda_A * lambda_idt
+            else:
+                self.loss_idt_A = 0
+                self.loss_idt_B = 0
+
+            # GAN loss D_A(G_A(A))
+            self.loss_G_A = self.criterionGAN(self.netD_A(self.fake_B), True)
+            # GAN loss D_B(G_B(B))
+            self.loss_G_B = self.criterionGAN(self.netD_B(self.fake_A), True)
+            # Forward cycle loss || G_B(G_A(A)) - A||
+            self.loss_cycle_A = self.criterionCycle(self.rec_A.float(), self.real_A) * lambda_A
+            # Backward cycle loss || G_A(G_B(B)) - B||
+            self.loss_cycle_B = self.criterionCycle(self.rec_B.float(), self.real_B) * lambda_B
+            # combined loss
+            self.loss_G = self.loss_G_A + self.loss_G_B + self.loss_cycle_A + self.loss_cycle_B + self.loss_idt_A + self.loss_idt_B
+        # calculate gradients
+        self.backward_loss(self.loss_G, self.optimizer_G)
 
     def optimize_parameters(self):
         """Calculate losses, gradients, and update network weights; called in every training iteration"""
         # forward
-        self.forward()  # compute fake images and reconstruction images.
+        with self.timer.phase("forward"), self.autocast():
+            if self.opt.fused_step:
+                self.forward_fused()  # compute fake, reconstruction and identity images with batched generator calls
+            else:
+                self.forward()  # compute fake images and reconstruction images.
         # G_A and G_B
         self.set_requires_grad([self.netD_A, self.netD_B], False)  # Ds require no gradients when optimizing Gs
         self.optimizer_G.zero_grad()  # set G_A and G_B's gradients to zero
-        self.backward_G()  # calculate gradients for G_A and G_B
-        self.optimizer_G.step()  # update G_A and G_B's weights
+        with self.timer.phase("backward_G"):
+            self.backward_G()  # calculate gradients for G_A and G_B
+        with self.timer.phase("step_G"):
+            self.optimizer_step(self.optimizer_G)  # update G_A and G_B's weights
         # D_A and D_B
         self.set_requires_grad([self.netD_A, self.netD_B], True)
         self.optimizer_D.zero_grad()  # set D_A and D_B's gradients to zero
-        self.backward_D_A()  # calculate gradients for D_A
-        self.backward_D_B()  # calculate graidents for D_B
-        self.optimizer_D.step()  # update D_A and D_B's weights
+        with self.timer.phase("backward_D"):
+            self.backward_D_A()  # calculate gradients for D_A
+            self.backward_D_B()  # calculate graidents for D_B
+        with self.timer.phase("step_D"):
+            self.optimizer_step(self.optimizer_D)  # update D_A and D_B's weights
@@ -0,0 +1,277 @@
+"""This module exports trained generators as standalone inference artifacts and loads them back.
+
+An artifact holds the generator graph and weights (TorchScript or torch.export) plus a small JSON metadata record
+(architecture, channels, preprocessing, normalization mode) embedded in the same file. Loading an artifact needs
+neither the model classes nor the option parser, so servers can start from the artifact alone:
+
+    netG, metadata = load_generator_artifact("checkpoints/facades_pix2pix/latest_net_G.torchscript.pt", device)
+    fake = netG(real)
+
+The normalization mode is fixed at export time: with --eval, batch norm uses its running statistics and dropout is
+disabled; without it, the artifact keeps the training-mode behaviour that test.py uses by default for pix2pix.
+
+<quantize_generator> produces int8 generators for CPU inference (see quantize.py); they are saved as TorchScript artifacts
+with a 'quantization' metadata entry and load the same way.
+"""
+
+import copy
+import json
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from . import networks
+
+ARTIFACT_VERSION = 1
+METADATA_FILE = "metadata.json"
+FORMAT_SUFFIXES = {"torchscript": ".torchscript.pt", "export": ".pt2"}
+
+
+def unwrap_generator(net):
+    """Return the plain generator inside DDP / torch.compile / TiledGenerator wrappers"""
+    while hasattr(net, "module") or hasattr(net, "_orig_mod"):
+        net = net.module if hasattr(net, "module") else net._orig_mod
+    return net
+
+
+def artifact_metadata(opt, net):
+    """Return the metadata stored with an exported generator.
+
+    Parameters:
+        opt (Option class) -- the options the generator was created with
+        net (network)      -- the generator
+
+    The preprocessing fields are what <get_transform> needs to prepare inputs without the option parser.
+    """
+    input_nc = opt.output_nc if opt.direction == "BtoA" else opt.input_nc
+    return {
+        "version": ARTIFACT_VERSION,
+        "name": opt.name,
+        "epoch": opt.epoch,
+        "netG": opt.netG,
+        "norm": opt.norm,
+        "in_channels": opt.input_nc,
+        "input_nc": input_nc,
+        "direction": opt.direction,
+        "preprocess": opt.preprocess,
+        "load_size": opt.load_size,
+        "crop_size": opt.crop_size,
+        "eval": bool(getattr(opt, "eval", False)),
+        "stride": networks.get_generator_stride(net),
+    }
+
+
+def artifact_path(save_dir, epoch, format="torchscript"):
+    """Return the default artifact path '<save_dir>/<epoch>_net_G<suffix>' for an export format"""
+    if format not in FORMAT_SUFFIXES:
+        raise NotImplementedError("export format [%s] is not recognized" % format)
+    return Path(save_dir) / f"{epoch}_net_G{FORMAT_SUFFIXES[format]}"
+
+
+def export_generator(net, path, metadata, format="torchscript", example_size=256):
+    """Export a generator to a standalone inference artifact.
+
+    Parameters:
+        net (network)       -- the generator (wrappers are removed); a CPU copy is exported, <net> itself is not modified
+        path (str)          -- output file
+        metadata (dict)     -- see <artifact_metadata>; 'eval' selects the normalization mode that is frozen into the graph
+        format (str)        -- torchscript (traced and frozen) | export (torch.export program with dynamic batch and image size)
+        example_size (int)  -- height/width of the example input used for tracing; rounded up to a multiple of the generator stride
+
+    The artifact accepts any input whose height and width are multiples of metadata['stride'].
+    """
+    net = copy.deepcopy(unwrap_generator(net)).cpu()  # keep the caller's device, train/eval mode and batch norm statistics
+    net.train(not metadata["eval"])
+    stride = metadata["stride"]
+    size = stride * max(2, -(-example_size // stride))  # >= 2 strides: torch.export specializes dimensions of size 1
+    example = torch.randn(2, metadata["in_channels"], size, size)
+    extra_files = {METADATA_FILE: json.dumps(dict(metadata, format=format))}
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    with torch.no_grad():
+        if format == "torchscript":
+            module = torch.jit.trace(net, example)
+            if metadata["eval"]:
+                module = torch.jit.freeze(module)  # inline the weights as constants and fold batch norm into the convolutions
+            torch.jit.save(module, str(tmp_path), _extra_files=extra_files)
+        elif format == "export":
+            if not metadata["eval"]:
+                raise ValueError("torch.export artifacts require --eval (batch norm with running statistics, no dropout)")
+            batch = torch.export.Dim("batch", min=1, max=1024)
+            height, width = torch.export.Dim("height", min=1, max=65536 // stride), torch.export.Dim("width", min=1, max=65536 // stride)
+            program = torch.export.export(net, (example,), dynamic_shapes=({0: batch, 2: stride * height, 3: stride * width},))
+            torch.export.save(program, str(tmp_path), extra_files=extra_files)
+        else:
+            raise NotImplementedError("export format [%s] is not recognized" % format)
+    tmp_path.replace(path)
+    return path
+
+
+def read_artifact_metadata(path):
+    """Return the metadata embedded in an artifact without loading the generator"""
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if name.endswith("/" + METADATA_FILE) and "extra" in name:
+                return json.loads(archive.read(name))
+    return {}
+
+
+class ExportedGenerator(nn.Module):
+    """Wrap a loaded artifact so that it can stand in for netG (e.g. in test.py or behind TiledGenerator).
+
+    train()/eval() do not touch the artifact: its normalization mode was fixed at export time
+    (and torch.export modules refuse mode changes).
+    """
+
+    def __init__(self, module, metadata):
+        super(ExportedGenerator, self).__init__()
+        self.module = module
+        self.metadata = metadata
+        self.generator_stride = metadata.get("stride", 1)
+
+    def train(self, mode=True):
+        return self
+
+    def forward(self, input):
+        return self.module(input)
+
+
+def load_generator_artifact(path, device="cpu"):
+    """Load an artifact written by <export_generator> or <quantize_generator>.
+
+    Parameters:
+        path (str)     -- the artifact file (*.torchscript.pt or *.pt2)
+        device         -- device to run the generator on; int8 artifacts always run on the CPU
+
+    Returns (generator, metadata), where generator is an <ExportedGenerator> ready for inference.
+    """
+    path = Path(path)
+    metadata = read_artifact_metadata(path)
+    if metadata.get("quantization"):
+        device = "cpu"  # quantized kernels are CPU-only
+    if path.suffix == ".pt2":
+        module = torch.export.load(str(path)).module().to(device)
+    else:
+        module = torch.jit.load(str(path), map_location=device)
+    return ExportedGenerator(module, metadata), metadata
+
+
+def fold_batch_norm(net):
+    """Fold every eval-mode BatchNorm2d that directly follows a Conv2d/ConvTranspose2d (in the same nn.Sequential) into that convolution.
+
+    The folded BatchNorm is replaced by Identity. Modifies <net> in place and returns the number of folded layers.
+    """
+    folded = 0
+    for module in list(net.modules()):
+        if not isinstance(module, nn.Sequential):
+            continue
+        layers = list(module)
+        for i in range(len(layers) - 1):
+            conv, bn = layers[i], layers[i + 1]
+            if isinstance(conv, (nn.Conv2d, nn.ConvTranspose2d)) and isinstance(bn, nn.BatchNorm2d) and bn.track_running_stats:
+                module[i] = fuse_conv_bn_eval(conv.eval(), bn.eval(), transpose=isinstance(conv, nn.ConvTranspose2d))
+                module[i + 1] = networks.Identity()
+                layers[i + 1] = module[i + 1]
+                folded += 1
+    return folded
+
+
+def strip_inference_layers(net):
+    """Remove layers that do nothing in eval mode: Dropout and Identity (e.g. folded batch norms or '--norm none').
+
+    Dropout layers outside nn.Sequential containers are replaced by Identity. Modifies <net> in place and returns the number of removed layers.
+    """
+    for module in list(net.modules()):
+        for name, child in module.named_children():
+            if isinstance(child, nn.modules.dropout._DropoutNd):
+                setattr(module, name, networks.Identity())
+    removed = 0
+    for module in list(net.modules()):
+        if isinstance(module, nn.Sequential):
+            keep = [(name, child) for name, child in module.named_children() if not isinstance(child, (nn.Identity, networks.Identity))]
+            if keep and len(keep) < len(module):
+                removed += len(module) - len(keep)
+                module._modules = OrderedDict(keep)  # Sequential runs its children in insertion order; the keys may have gaps
+    return removed
+
+
+def optimize_generator(net):
+    """Return an eval-mode copy of a generator with batch norms folded into the convolutions and Dropout/Identity layers removed.
+
+    The copy computes the same function as net.eval() and has no mode-dependent layers left, so it can replace netG at test time.
+    Its state_dict no longer matches the checkpoint layout; keep saving and loading the original generator.
+    """
+    net = copy.deepcopy(unwrap_generator(net)).eval()
+    folded = fold_batch_norm(net)
+    removed = strip_inference_layers(net)
+    print(f"optimized generator for inference: {folded} batch norm layers folded, {removed} layers removed")
+    return net
+
+
+def verify_generator(reference, optimized, size, atol=1e-4, batch_size=2):
+    """Check that <optimized> matches reference.eval() on random inputs and return the max absolute difference.
+
+    Parameters:
+        reference (network) -- the original generator (not modified; an eval-mode copy is used)
+        optimized (network) -- e.g. the output of <optimize_generator>
+        size (int)          -- height/width of the test input; rounded up to a multiple of the generator stride
+        atol (float)        -- maximum allowed absolute difference of the outputs (in [-1, 1])
+
+    Both networks run in fp32 on the CPU, where convolutions do not use reduced-precision (TF32) math.
+    Raises RuntimeError if the difference exceeds <atol>.
+    """
+    reference = copy.deepcopy(unwrap_generator(reference)).float().cpu().eval()
+    optimized = copy.deepcopy(optimized).float().cpu()
+    stride = networks.get_generator_stride(reference)
+    size = stride * max(1, -(-size // stride))
+    in_channels = next(m for m in reference.modules() if isinstance(m, nn.Conv2d)).in_channels
+    input = torch.rand(batch_size, in_channels, size, size, generator=torch.Generator().manual_seed(0)) * 2 - 1
+    with torch.no_grad():
+        diff = (reference(input) - optimized(input)).abs().max().item()
+    if diff > atol:
+        raise RuntimeError(f"optimized generator differs from the original by {diff:.2e} (tolerance {atol:.0e})")
+    return diff
+
+
+def quantize_generator(net, mode="static", calibration=(), backend="x86"):
+    """Quantize a generator to int8 for CPU inference.
+
+    Parameters:
+        net (network)              -- the fp32 generator (wrappers are removed); put into eval mode on the CPU
+        mode (str)                 -- static: int8 weights and activations, with activation ranges calibrated on <calibration> |
+                                      dynamic: int8 weights, activations quantized on the fly per batch (no calibration)
+        calibration (tensor list)  -- input batches in [-1, 1] for static quantization
+        backend (str)              -- quantized engine: x86 | fbgemm | qnnpack
+
+    Returns (quantized generator, number of BatchNorm layers fused into convolutions).
+    Static mode uses FX graph mode quantization, which fuses Conv+BatchNorm(+ReLU) and ConvTranspose+BatchNorm before observing.
+    """
+    from torch.ao.quantization import default_dynamic_qconfig, get_default_qconfig_mapping, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    import torch.ao.nn.quantized.dynamic as nnqd
+
+    torch.backends.quantized.engine = backend
+    net = copy.deepcopy(unwrap_generator(net)).cpu().eval()
+    if mode == "dynamic":
+        fused = fold_batch_norm(net)
+        qconfig_spec = {nn.Conv2d: default_dynamic_qconfig, nn.ConvTranspose2d: default_dynamic_qconfig}
+        mapping = {nn.Conv2d: nnqd.Conv2d, nn.ConvTranspose2d: nnqd.ConvTranspose2d}
+        return quantize_dynamic(net, qconfig_spec, mapping=mapping), fused
+    if mode != "static":
+        raise NotImplementedError("quantization mode [%s] is not recognized" % mode)
+    if not calibration:
+        raise ValueError("static quantization needs calibration batches")
+
+    def count_norms(module):
+        return sum(1 for m in module.modules() if isinstance(m, nn.BatchNorm2d))
+
+    prepared = prepare_fx(net, get_default_qconfig_mapping(backend), example_inputs=(calibration[0],))
+    fused = count_norms(net) - count_norms(prepared)  # in eval mode the fused batch norms are folded into the convolution weights
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch.cpu())
+    return convert_fx(prepared), fused
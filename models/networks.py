@@ -1,8 +1,11 @@
+import os
 import torch
 import torch.nn as nn
 from torch.nn import init
+import contextlib
 import functools
 from torch.optim import lr_scheduler
+from torch.utils.checkpoint import checkpoint
 
 
 ###############################################################################
@@ -129,7 +132,7 @@ def init_net(net, init_type="normal", init_gain=0.02):
     return net
 
 
-def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, init_type="normal", init_gain=0.02):
+def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, init_type="normal", init_gain=0.02, grad_checkpoint=""):
     """Create a generator
 
     Parameters:
@@ -141,6 +144,7 @@ def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, in
         use_dropout (bool) -- if use dropout layers.
         init_type (str)    -- the name of our initialization method.
         init_gain (float)  -- scaling factor for normal, xavier and orthogonal.
+        grad_checkpoint (str) -- blocks whose activations are recomputed during backward (see <set_grad_checkpoint>)
 
     Returns a generator
     """
@@ -157,9 +161,252 @@ def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, in
         net = UnetGenerator(input_nc, output_nc, 8, ngf, norm_layer=norm_layer, use_dropout=use_dropout)
     else:
         raise NotImplementedError("Generator model name [%s] is not recognized" % netG)
+    if grad_checkpoint:
+        set_grad_checkpoint(net, grad_checkpoint)
     return net
 
 
+def parse_grad_checkpoint(spec, n):
+    """Return the sorted block indices selected by a --grad_checkpoint spec.
+
+    Parameters:
+        spec (str) -- 'all' | 'every_<k>' (blocks 0, k, 2k, ...) | comma-separated indices, e.g. '0,2,4'; '' or 'none' selects nothing
+        n (int)    -- the number of checkpointable blocks
+    """
+    spec = spec.strip().lower()
+    if spec in ("", "none"):
+        return []
+    if spec == "all":
+        return list(range(n))
+    if spec.startswith("every_"):
+        return list(range(0, n, max(1, int(spec[len("every_") :]))))
+    indices = sorted({int(i) for i in spec.split(",") if i.strip()})
+    for i in indices:
+        if not 0 <= i < n:
+            raise ValueError("grad_checkpoint block index %d is out of range [0, %d)" % (i, n))
+    return indices
+
+
+def set_grad_checkpoint(net, spec):
+    """Enable activation checkpointing for selected blocks of a generator.
+
+    Parameters:
+        net (network) -- a generator created by <define_G>
+        spec (str)    -- which blocks to checkpoint (see <parse_grad_checkpoint>)
+
+    For U-Nets, block i is the UnetSkipConnectionBlock at depth i (0 = outermost); checkpointing a depth also recomputes
+    everything inside it, so shallow depths save the most memory (at the highest recompute cost).
+    For ResNet generators, block i is the i-th ResnetBlock.
+    Checkpointed blocks keep only their input during the forward pass and recompute their activations in backward.
+    The flag is a plain attribute, so checkpoints (state_dicts) are unaffected.
+    """
+    blocks = [m for m in net.modules() if isinstance(m, (UnetSkipConnectionBlock, ResnetBlock))]
+    selected = parse_grad_checkpoint(spec, len(blocks))
+    for i, block in enumerate(blocks):
+        block.grad_checkpoint = i in selected
+    if selected:
+        print(f"gradient checkpointing enabled for {type(net).__name__} blocks {selected}")
+    return selected
+
+
+@contextlib.contextmanager
+def _frozen_norm_stats(module):
+    """Keep BatchNorm running statistics unchanged while a checkpointed block is recomputed.
+
+    The buffers (running_mean, running_var, num_batches_tracked) are saved and restored, which also covers
+    cumulative averaging (momentum=None), where zeroing the momentum would not stop the update.
+    """
+    norms = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.track_running_stats]
+    saved = [(m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone()) for m in norms]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for m, (mean, var, num_batches) in zip(norms, saved):
+                m.running_mean.copy_(mean)
+                m.running_var.copy_(var)
+                m.num_batches_tracked.copy_(num_batches)
+
+
+def checkpoint_forward(module, function, x):
+    """Run function(x) with activation checkpointing if <module> asks for it during training; see <set_grad_checkpoint>"""
+    if not (getattr(module, "grad_checkpoint", False) and module.training and torch.is_grad_enabled()):
+        return function(x)
+    calls = [0]
+    chunk_sizes = [None]
+
+    def run(x):
+        calls[0] += 1
+        if calls[0] == 1:
+            # per-chunk batch norm of a fused call (<split_batch_norm>) is gone by the time backward recomputes the block
+            chunk_sizes[0] = next((m.chunk_sizes for m in module.modules() if getattr(m, "chunk_sizes", None)), None)
+            return function(x)
+        # the recomputation must not update the running statistics a second time, and must normalize the same chunks
+        with _frozen_norm_stats(module), split_batch_norm(module, chunk_sizes[0]) if chunk_sizes[0] else contextlib.nullcontext():
+            return function(x)
+
+    # the non-reentrant variant also restores the RNG state, so Dropout draws the same mask when recomputing
+    return checkpoint(run, x, use_reentrant=False)
+
+
+@contextlib.contextmanager
+def split_batch_norm(net, sizes):
+    """Make the batch norm layers of <net> normalize consecutive batch chunks of the given sizes with separate statistics.
+
+    Parameters:
+        net (network)    -- the network, e.g. a discriminator that runs on several concatenated batches at once
+        sizes (int list) -- the batch size of each chunk
+
+    Each chunk is normalized (and updates the running statistics) exactly as if it were fed to <net> on its own, in order.
+    The sizes are also kept in <chunk_sizes> of each layer while the context is open, so that checkpointed blocks
+    (see <checkpoint_forward>) normalize the same chunks when they are recomputed during backward.
+    """
+    norms = [m for m in net.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+
+    def chunked(forward):
+        return lambda x: torch.cat([forward(chunk) for chunk in torch.split(x, sizes, 0)], 0)
+
+    for m in norms:
+        m.forward = chunked(m.forward)
+        m.chunk_sizes = list(sizes)
+    try:
+        yield
+    finally:
+        for m in norms:
+            del m.forward  # fall back to the class method
+            del m.chunk_sizes
+
+
+def fused_forward(net, inputs):
+    """Run a network once on several batches and return one output per batch.
+
+    Parameters:
+        net (network)        -- the network, e.g. a discriminator or a generator
+        inputs (tensor list) -- batches to process, e.g. [fake_AB.detach(), real_AB]
+
+    The batches are concatenated along the batch dimension, so every conv layer runs once with a larger batch.
+    Batch norm layers keep per-batch statistics (see <split_batch_norm>), so the outputs and losses match separate calls.
+    """
+    sizes = [x.shape[0] for x in inputs]
+    if len(inputs) == 1:
+        return [net(inputs[0])]
+    if is_compiled(net) and any(isinstance(m, nn.modules.batchnorm._BatchNorm) for m in net.modules()):
+        return [net(x) for x in inputs]  # patching the batch norm layers would invalidate the compiled graph on every call
+    with split_batch_norm(net, sizes):
+        output = net(torch.cat(inputs, 0))
+    return torch.split(output, sizes, 0)
+
+
+def is_compiled(net):
+    """Return True if <net> (or the module wrapped by DDP / TiledGenerator) was compiled with torch.compile"""
+    while hasattr(net, "module") and not hasattr(net, "_orig_mod"):
+        net = net.module
+    return hasattr(net, "_orig_mod")
+
+
+def compile_net(net, mode="default", cache_dir=""):
+    """Compile a network with torch.compile.
+
+    Parameters:
+        net (network)    -- the network to compile (before wrapping it with DDP)
+        mode (str)       -- torch.compile mode: default | reduce-overhead | max-autotune | max-autotune-no-cudagraphs
+        cache_dir (str)  -- if set, TorchInductor keeps its compiled graphs and autotuning results in this directory,
+                            so later runs (and other processes) with the same networks and shapes skip recompilation
+
+    Compilation is lazy: the first forward pass for every new input shape triggers it.
+    """
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.abspath(cache_dir)
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+        os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+    return torch.compile(net, mode=mode)
+
+
+def get_generator_stride(net):
+    """Return the total downsampling factor of a generator.
+
+    Parameters:
+        net (network) -- a generator created by <define_G> or loaded from an artifact, optionally wrapped by DDP / torch.compile / TiledGenerator
+
+    Inputs whose height and width are multiples of this value pass through the generator without size mismatches
+    (e.g., 256 for unet_256, 4 for resnet generators).
+    """
+    while hasattr(net, "module") or hasattr(net, "_orig_mod"):
+        if hasattr(net, "generator_stride"):  # a loaded inference artifact (see models/inference.py)
+            return net.generator_stride
+        net = net.module if hasattr(net, "module") else net._orig_mod
+    if isinstance(net, UnetGenerator):
+        return 2 ** sum(1 for m in net.modules() if isinstance(m, UnetSkipConnectionBlock))
+    if isinstance(net, ResnetGenerator):
+        return 4
+    return 1
+
+
+def _tile_starts(length, tile_size, step):
+    """Return the start offsets of overlapping tiles that cover [0, length)"""
+    starts = list(range(0, max(length - tile_size, 0) + 1, step))
+    if starts[-1] + tile_size < length:
+        starts.append(length - tile_size)
+    return starts
+
+
+def _feather_window(tile_size, overlap, device, dtype):
+    """Return a (1, 1, tile_size, tile_size) blending window that ramps up linearly over <overlap> pixels at each border"""
+    window = torch.ones(tile_size, device=device, dtype=dtype)
+    if overlap > 0:
+        ramp = torch.arange(1, overlap + 1, device=device, dtype=dtype) / (overlap + 1)
+        window[:overlap] = ramp
+        window[-overlap:] = ramp.flip(0)
+    return (window[:, None] * window[None, :])[None, None]
+
+
+def tiled_forward(net, input, tile_size=512, overlap=64, tile_batch_size=4, stride=None):
+    """Run a fully convolutional generator over overlapping tiles and blend the seams.
+
+    Parameters:
+        net (network)         -- the generator (e.g., the output of <define_G>)
+        input (tensor)        -- input images of shape (N, C, H, W) with arbitrary H and W
+        tile_size (int)       -- tile size; rounded down to a multiple of the generator's stride (see <get_generator_stride>)
+        overlap (int)         -- number of pixels shared by neighbouring tiles; seams are blended with a linear feathering window
+        tile_batch_size (int) -- number of tile positions passed through the network in one forward call
+        stride (int)          -- the generator's stride; default: <get_generator_stride> (needed for exported generators)
+
+    Returns a tensor of shape (N, output_nc, H, W).
+
+    Peak memory depends on the tile size rather than the image size, so large photos can be processed on CPU-only nodes.
+    Inputs smaller than a tile are padded up to the tile size and cropped back afterwards.
+    Note: with '--norm batch', call net.eval() first; otherwise every tile is normalized with its own statistics.
+    """
+    stride = stride or get_generator_stride(net)
+    tile_size = max(stride, tile_size // stride * stride)
+    overlap = max(0, min(overlap, tile_size // 2))
+    n, _, h, w = input.shape
+
+    # pad inputs that are smaller than a single tile
+    pad_h, pad_w = max(0, tile_size - h), max(0, tile_size - w)
+    if pad_h or pad_w:
+        mode = "reflect" if pad_h < h and pad_w < w else "replicate"
+        input = torch.nn.functional.pad(input, (0, pad_w, 0, pad_h), mode=mode)
+    H, W = input.shape[2:]
+
+    positions = [(y, x) for y in _tile_starts(H, tile_size, tile_size - overlap) for x in _tile_starts(W, tile_size, tile_size - overlap)]
+    output, weight, window = None, None, None
+    for i in range(0, len(positions), tile_batch_size):
+        chunk = positions[i : i + tile_batch_size]
+        tiles = torch.cat([input[:, :, y : y + tile_size, x : x + tile_size] for y, x in chunk], 0)
+        result = net(tiles)
+        if output is None:
+            output = result.new_zeros(n, result.shape[1], H, W)
+            weight = result.new_zeros(1, 1, H, W)
+            window = _feather_window(tile_size, overlap, result.device, result.dtype)
+        for j, (y, x) in enumerate(chunk):
+            output[:, :, y : y + tile_size, x : x + tile_size] += result[j * n : (j + 1) * n] * window
+            weight[:, :, y : y + tile_size, x : x + tile_size] += window
+    output = output / weight
+    return output[:, :, :h, :w]
+
+
 def define_D(input_nc, ndf, netD, n_layers_D=3, norm="batch", init_type="normal", init_gain=0.02):
     """Create a discriminator
 
@@ -265,6 +512,7 @@ class GANLoss(nn.Module):
             the calculated loss.
         """
         if self.gan_mode in ["lsgan", "vanilla"]:
+            prediction = prediction.float()  # compute the loss in fp32 when the discriminator ran under autocast (--amp)
             target_tensor = self.get_target_tensor(prediction, target_is_real)
             loss = self.loss(prediction, target_tensor)
         elif self.gan_mode == "wgangp":
@@ -417,7 +665,7 @@ class ResnetBlock(nn.Module):
 
     def forward(self, x):
         """Forward function (with skip connections)"""
-        out = x + self.conv_block(x)  # add skip connections
+        out = x + checkpoint_forward(self, self.conv_block, x)  # add skip connections
         return out
 
 
@@ -510,9 +758,34 @@ class UnetSkipConnectionBlock(nn.Module):
 
     def forward(self, x):
         if self.outermost:
-            return self.model(x)
+            return checkpoint_forward(self, self.model, x)
         else:  # add skip connections
-            return torch.cat([x, self.model(x)], 1)
+            return torch.cat([x, checkpoint_forward(self, self.model, x)], 1)
+
+
+class TiledGenerator(nn.Module):
+    """Wrap a generator so that its forward pass runs tile by tile (see <tiled_forward>)"""
+
+    def __init__(self, module, tile_size=512, overlap=64, tile_batch_size=4, stride=None):
+        """Construct a tiled generator
+
+        Parameters:
+            module (network)      -- the generator to wrap
+            tile_size (int)       -- tile size
+            overlap (int)         -- number of overlapping pixels between neighbouring tiles
+            tile_batch_size (int) -- number of tiles per forward call
+            stride (int)          -- the generator's stride; default: <get_generator_stride>
+        """
+        super(TiledGenerator, self).__init__()
+        self.module = module
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_batch_size = tile_batch_size
+        self.stride = stride
+
+    def forward(self, input):
+        """Tiled forward"""
+        return tiled_forward(self.module, input, self.tile_size, self.overlap, self.tile_batch_size, self.stride)
 
 
 class NLayerDiscriminator(nn.Module):
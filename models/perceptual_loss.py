@@ -0,0 +1,156 @@
+"""This module implements the VGG19 perceptual loss shared by the pix2pix perceptual models.
+
+Only the part of vgg19.features up to the deepest selected layer is kept, and the target (real) features are
+computed without autograd. For datasets whose preprocessing is deterministic (no random crop or flip), the target
+features can also be cached on disk, keyed by image path, file mtime/size and the preprocessing options.
+Cached features are stored in fp16 per image and grow with the image area: the default layers take about 16MB at 256px
+and 256MB at 1024px, where reading them back costs more than recomputing the truncated VGG. The cache is therefore
+disabled when an image's features would exceed <cache_max_mb>.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torchvision.models as models
+
+# index of each ReLU output in torchvision's vgg19().features
+VGG19_LAYERS = {
+    "relu1_1": 1, "relu1_2": 3,
+    "relu2_1": 6, "relu2_2": 8,
+    "relu3_1": 11, "relu3_2": 13, "relu3_3": 15, "relu3_4": 17,
+    "relu4_1": 20, "relu4_2": 22, "relu4_3": 24, "relu4_4": 26,
+    "relu5_1": 29, "relu5_2": 31, "relu5_3": 33, "relu5_4": 35,
+}  # fmt: skip
+DEFAULT_LAYERS = ["relu1_1", "relu2_1", "relu3_1", "relu4_1", "relu5_1"]
+
+
+def load_vgg19_features(weights_path=None):
+    """Return vgg19().features with ImageNet weights.
+
+    Parameters:
+        weights_path (str) -- optional local file with a state_dict of vgg19 (full model or its 'features' part);
+                              without it, the torchvision weights are downloaded (or taken from the torch hub cache)
+    """
+    if weights_path:
+        vgg = models.vgg19()
+        state_dict = torch.load(weights_path, map_location="cpu", weights_only=True)
+        if any(key.startswith("features.") for key in state_dict):
+            state_dict = {key[len("features.") :]: value for key, value in state_dict.items() if key.startswith("features.")}
+        vgg.features.load_state_dict(state_dict)
+        return vgg.features
+    try:
+        # Try new PyTorch API (>= 0.13)
+        return models.vgg19(weights=models.VGG19_Weights.IMAGENET1K_V1).features
+    except (AttributeError, TypeError):
+        # Try old API with pretrained=True
+        return models.vgg19(pretrained=True).features
+
+
+def parse_perceptual_layers(layers, weights=""):
+    """Parse comma-separated layer names (e.g. 'relu1_1,relu3_1') and optional per-layer weights (e.g. '1,0.5')"""
+    layers = [layer.strip() for layer in layers.split(",") if layer.strip()] if isinstance(layers, str) else list(layers)
+    for layer in layers:
+        if layer not in VGG19_LAYERS:
+            raise NotImplementedError("perceptual layer [%s] is not recognized; choose from %s" % (layer, ", ".join(VGG19_LAYERS)))
+    if isinstance(weights, str):
+        weights = [float(w) for w in weights.split(",") if w.strip()]
+    weights = list(weights) or [1.0] * len(layers)
+    if len(weights) != len(layers):
+        raise ValueError("got %d perceptual weights for %d layers" % (len(weights), len(layers)))
+    return layers, weights
+
+
+class PerceptualLoss(nn.Module):
+    """Weighted L1 distance between VGG19 features of generated and target images.
+
+    Images are expected in [-1, 1] (the generator output range) and are mapped to [0, 1] before VGG.
+    """
+
+    def __init__(self, layers=DEFAULT_LAYERS, weights=None, weights_path=None, cache_dir=None, cache_options=None, cache_max_mb=32):
+        """Initialize the perceptual loss.
+
+        Parameters:
+            layers (str list)      -- VGG19 layers to compare (see VGG19_LAYERS)
+            weights (float list)   -- weight of each layer (default: 1.0 each)
+            weights_path (str)     -- local VGG19 state_dict (see <load_vgg19_features>)
+            cache_dir (str)        -- if set, target features are cached there per image; only valid with deterministic preprocessing
+            cache_options (dict)   -- preprocessing options that affect the target image; part of the cache key
+            cache_max_mb (float)   -- disable the cache if the features of one image take more than this (fp16, on disk); 0 for no limit
+        """
+        super(PerceptualLoss, self).__init__()
+        self.layers, self.weights = parse_perceptual_layers(layers, weights or [])
+        self.indices = [VGG19_LAYERS[layer] for layer in self.layers]
+        features = load_vgg19_features(weights_path)
+        self.vgg = features[: max(self.indices) + 1].eval()  # drop the layers after the deepest one we use
+        for param in self.vgg.parameters():
+            param.requires_grad = False
+
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_max_bytes = cache_max_mb * 1024 * 1024
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            key = {"layers": self.layers, "weights_path": weights_path or "torchvision", "options": cache_options or {}}
+            self.cache_prefix = json.dumps(key, sort_keys=True)
+
+    def train(self, mode=True):
+        # VGG stays in eval mode even when the loss module is put into training mode
+        super(PerceptualLoss, self).train(mode)
+        self.vgg.eval()
+        return self
+
+    def features(self, x):
+        """Return the features of images in [-1, 1] at the selected layers"""
+        x = (x + 1) / 2.0  # [-1, 1] -> [0, 1]
+        if x.shape[1] == 1:  # grayscale -> 3 channels
+            x = x.expand(-1, 3, -1, -1)
+        features = []
+        for i, layer in enumerate(self.vgg):
+            x = layer(x)
+            if i in self.indices:
+                features.append(x)
+        return features
+
+    def _cache_path(self, path):
+        st = os.stat(path)
+        key = f"{self.cache_prefix}\0{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}"
+        return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.pt"
+
+    def target_features(self, real, paths=None):
+        """Return the features of the target images without autograd, using the on-disk cache when enabled.
+
+        Parameters:
+            real (tensor)    -- target images in [-1, 1]
+            paths (str list) -- image path of each target image; needed for the cache
+        """
+        with torch.no_grad():
+            if self.cache_dir is None or paths is None:
+                return self.features(real)
+            cache_paths = [self._cache_path(path) for path in paths]
+            samples = [torch.load(p, map_location=real.device, weights_only=True) if p.exists() else None for p in cache_paths]
+            missing = [i for i, sample in enumerate(samples) if sample is None]
+            if missing:
+                features = self.features(real[missing])
+                sample_bytes = sum(feature[0].numel() * 2 for feature in features)
+                if self.cache_max_bytes > 0 and sample_bytes > self.cache_max_bytes:
+                    print(f"Warning: the cached VGG features would take {sample_bytes / 2**20:.0f}MB per image (limit {self.cache_max_bytes / 2**20:.0f}MB); the feature cache is disabled")
+                    self.cache_dir = None
+                    return features if len(missing) == len(paths) else self.features(real)
+                for j, i in enumerate(missing):
+                    samples[i] = [feature[j].half() for feature in features]  # fp16 halves the disk usage; also used for fresh entries for consistency
+                    tmp_path = cache_paths[i].with_suffix(f".pt.{os.getpid()}.tmp")
+                    torch.save([feature.cpu() for feature in samples[i]], tmp_path)
+                    os.replace(tmp_path, cache_paths[i])
+            return [torch.stack([sample[k] for sample in samples]).float() for k in range(len(self.layers))]
+
+    def forward(self, fake, real, paths=None):
+        """Return the perceptual loss between generated images <fake> and target images <real>"""
+        fake_features = self.features(fake)
+        real_features = self.target_features(real, paths)
+        loss = 0.0
+        for weight, fake_feature, real_feature in zip(self.weights, fake_features, real_features):
+            loss += weight * F.l1_loss(fake_feature.float(), real_feature.float())
+        return loss
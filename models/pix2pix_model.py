@@ -55,7 +55,7 @@ class Pix2PixModel(BaseModel):
             self.model_names = ["G"]
         self.device = opt.device
         # define networks (both generator and discriminator)
-        self.netG = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain)
+        self.netG = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain, getattr(opt, "grad_checkpoint", ""))
 
         if self.isTrain:  # define a discriminator; conditional GANs need to take both input and output images; Therefore, #channels for D is input_nc + output_nc
             self.netD = networks.define_D(opt.input_nc + opt.output_nc, opt.ndf, opt.netD, opt.n_layers_D, opt.norm, opt.init_type, opt.init_gain)
@@ -89,39 +89,50 @@ class Pix2PixModel(BaseModel):
 
     def backward_D(self):
         """Calculate GAN loss for the discriminator"""
-        # Fake; stop backprop to the generator by detaching fake_B
-        fake_AB = torch.cat((self.real_A, self.fake_B), 1)  # we use conditional GANs; we need to feed both input and output to the discriminator
-        pred_fake = self.netD(fake_AB.detach())
-        self.loss_D_fake = self.criterionGAN(pred_fake, False)
-        # Real
-        real_AB = torch.cat((self.real_A, self.real_B), 1)
-        pred_real = self.netD(real_AB)
-        self.loss_D_real = self.criterionGAN(pred_real, True)
-        # combine loss and calculate gradients
-        self.loss_D = (self.loss_D_fake + self.loss_D_real) * 0.5
-        self.loss_D.backward()
+        with self.autocast():
+            # Fake (stop backprop to the generator by detaching fake_B) and real pairs
+            self.fake_AB = torch.cat((self.real_A, self.fake_B), 1)  # we use conditional GANs; we need to feed both input and output to the discriminator
+            real_AB = torch.cat((self.real_A, self.real_B), 1)
+            if self.opt.fused_step:  # one netD forward over [fake; real], with per-half batch norm statistics
+                pred_fake, pred_real = networks.fused_forward(self.netD, [self.fake_AB.detach(), real_AB])
+            else:
+                pred_fake = self.netD(self.fake_AB.detach())
+                pred_real = self.netD(real_AB)
+            self.loss_D_fake = self.criterionGAN(pred_fake, False)
+            self.loss_D_real = self.criterionGAN(pred_real, True)
+            # combine loss
+            self.loss_D = (self.loss_D_fake + self.loss_D_real) * 0.5
+        # calculate gradients
+        self.backward_loss(self.loss_D, self.optimizer_D)
 
     def backward_G(self):
         """Calculate GAN and L1 loss for the generator"""
-        # First, G(A) should fake the discriminator
-        fake_AB = torch.cat((self.real_A, self.fake_B), 1)
-        pred_fake = self.netD(fake_AB)
-        self.loss_G_GAN = self.criterionGAN(pred_fake, True)
-        # Second, G(A) = B
-        self.loss_G_L1 = self.criterionL1(self.fake_B, self.real_B) * self.opt.lambda_L1
-        # combine loss and calculate gradients
-        self.loss_G = self.loss_G_GAN + self.loss_G_L1
-        self.loss_G.backward()
+        with self.autocast():
+            # First, G(A) should fake the discriminator
+            fake_AB = self.fake_AB if self.opt.fused_step else torch.cat((self.real_A, self.fake_B), 1)  # reuse the pair built in <backward_D>
+            pred_fake = self.netD(fake_AB)
+            self.loss_G_GAN = self.criterionGAN(pred_fake, True)
+            # Second, G(A) = B
+            self.loss_G_L1 = self.criterionL1(self.fake_B.float(), self.real_B) * self.opt.lambda_L1
+            # combine loss
+            self.loss_G = self.loss_G_GAN + self.loss_G_L1
+        # calculate gradients
+        self.backward_loss(self.loss_G, self.optimizer_G)
 
     def optimize_parameters(self):
-        self.forward()  # compute fake images: G(A)
+        with self.timer.phase("forward"), self.autocast():
+            self.forward()  # compute fake images: G(A)
         # update D
         self.set_requires_grad(self.netD, True)  # enable backprop for D
         self.optimizer_D.zero_grad()  # set D's gradients to zero
-        self.backward_D()  # calculate gradients for D
-        self.optimizer_D.step()  # update D's weights
+        with self.timer.phase("backward_D"):
+            self.backward_D()  # calculate gradients for D
+        with self.timer.phase("step_D"):
+            self.optimizer_step(self.optimizer_D)  # update D's weights
         # update G
         self.set_requires_grad(self.netD, False)  # D requires no gradients when optimizing G
         self.optimizer_G.zero_grad()  # set G's gradients to zero
-        self.backward_G()  # calculate graidents for G
-        self.optimizer_G.step()  # update G's weights
+        with self.timer.phase("backward_G"):
+            self.backward_G()  # calculate graidents for G
+        with self.timer.phase("step_G"):
+            self.optimizer_step(self.optimizer_G)  # update G's weights
@@ -1,31 +1,7 @@
 import torch
-import torch.nn as nn
 from .base_model import BaseModel
 from . import networks
-import torchvision.models as models
-
-
-class VGGLoss(nn.Module):
-    """Perceptual loss using VGG features"""
-    def __init__(self, device):
-        super(VGGLoss, self).__init__()
-        vgg = models.vgg19(pretrained=True).features
-        self.vgg = vgg.to(device).eval()
-        # Freeze VGG parameters
-        for param in self.vgg.parameters():
-            param.requires_grad = False
-        
-        # Extract features from specific layers
-        self.feature_layers = [1, 6, 11, 20, 29]  # relu1_1, relu2_1, relu3_1, relu4_1, relu5_1
-        self.layer_names = ['relu1_1', 'relu2_1', 'relu3_1', 'relu4_1', 'relu5_1']
-        
-    def forward(self, x):
-        features = []
-        for i, layer in enumerate(self.vgg):
-            x = layer(x)
-            if i in self.feature_layers:
-                features.append(x)
-        return features
+from .perceptual_loss import PerceptualLoss, DEFAULT_LAYERS
 
 
 class Pix2PixModelWithPerceptual(BaseModel):
@@ -46,6 +22,11 @@ class Pix2PixModelWithPerceptual(BaseModel):
             parser.add_argument("--lambda_L1", type=float, default=100.0, help="weight for L1 loss")
             parser.add_argument("--lambda_perceptual", type=float, default=10.0, help="weight for perceptual loss")
             parser.add_argument("--use_perceptual", action="store_true", help="use perceptual loss")
+            parser.add_argument("--perceptual_layers", type=str, default=",".join(DEFAULT_LAYERS), help="comma-separated VGG19 layers for the perceptual loss, e.g. relu1_1,relu2_1,relu3_1")
+            parser.add_argument("--perceptual_weights", type=str, default="", help="comma-separated weight per perceptual layer (default: 1 for each layer)")
+            parser.add_argument("--vgg_weights", type=str, default="", help="local VGG19 state_dict file; if empty, torchvision downloads the ImageNet weights")
+            parser.add_argument("--perceptual_cache_dir", type=str, default="", help="cache the VGG features of real_B on disk (requires deterministic preprocessing: no crop, --no_flip)")
+            parser.add_argument("--perceptual_cache_max_mb", type=float, default=32, help="disable --perceptual_cache_dir if the features of one image exceed this size in MB (about 16MB at 256px and 256MB at 1024px with the default layers); 0 for no limit")
         return parser
 
     def __init__(self, opt):
@@ -64,7 +45,8 @@ class Pix2PixModelWithPerceptual(BaseModel):
         
         # define networks
         self.netG = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, 
-                                     not opt.no_dropout, opt.init_type, opt.init_gain)
+                                     not opt.no_dropout, opt.init_type, opt.init_gain,
+                                     grad_checkpoint=getattr(opt, 'grad_checkpoint', ''))
 
         if self.isTrain:
             # define discriminator
@@ -78,7 +60,12 @@ class Pix2PixModelWithPerceptual(BaseModel):
             # Perceptual loss (VGG)
             self.use_perceptual = getattr(opt, 'use_perceptual', False)
             if self.use_perceptual:
-                self.criterionPerceptual = VGGLoss(self.device)
+                cache_dir = opt.perceptual_cache_dir
+                if cache_dir and ("crop" in opt.preprocess or not opt.no_flip):
+                    print("Warning: --perceptual_cache_dir requires deterministic preprocessing (no crop, --no_flip); the feature cache is disabled")
+                    cache_dir = ""
+                cache_options = {"dataset_mode": opt.dataset_mode, "direction": opt.direction, "preprocess": opt.preprocess, "load_size": opt.load_size, "crop_size": opt.crop_size, "output_nc": opt.output_nc}
+                self.criterionPerceptual = PerceptualLoss(opt.perceptual_layers, opt.perceptual_weights, opt.vgg_weights, cache_dir, cache_options, opt.perceptual_cache_max_mb).to(self.device)
                 self.lambda_perceptual = getattr(opt, 'lambda_perceptual', 10.0)
             else:
                 self.criterionPerceptual = None
@@ -96,6 +83,7 @@ class Pix2PixModelWithPerceptual(BaseModel):
         self.real_A = input["A" if AtoB else "B"].to(self.device)
         self.real_B = input["B" if AtoB else "A"].to(self.device)
         self.image_paths = input["A_paths" if AtoB else "B_paths"]
+        self.target_paths = input["B_paths" if AtoB else "A_paths"]  # keys for the perceptual feature cache
 
     def forward(self):
         """Run forward pass; called by both functions <optimize_parameters> and <test>."""
@@ -103,60 +91,59 @@ class Pix2PixModelWithPerceptual(BaseModel):
 
     def backward_D(self):
         """Calculate GAN loss for the discriminator"""
-        # Fake
-        fake_AB = torch.cat((self.real_A, self.fake_B), 1)
-        pred_fake = self.netD(fake_AB.detach())
-        self.loss_D_fake = self.criterionGAN(pred_fake, False)
-        # Real
-        real_AB = torch.cat((self.real_A, self.real_B), 1)
-        pred_real = self.netD(real_AB)
-        self.loss_D_real = self.criterionGAN(pred_real, True)
-        # combine loss and calculate gradients
-        self.loss_D = (self.loss_D_fake + self.loss_D_real) * 0.5
-        self.loss_D.backward()
+        with self.autocast():
+            # Fake (detached) and real pairs
+            self.fake_AB = torch.cat((self.real_A, self.fake_B), 1)  # we use conditional GANs; we need to feed both input and output to the discriminator
+            real_AB = torch.cat((self.real_A, self.real_B), 1)
+            if self.opt.fused_step:  # one netD forward over [fake; real], with per-half batch norm statistics
+                pred_fake, pred_real = networks.fused_forward(self.netD, [self.fake_AB.detach(), real_AB])
+            else:
+                pred_fake = self.netD(self.fake_AB.detach())
+                pred_real = self.netD(real_AB)
+            self.loss_D_fake = self.criterionGAN(pred_fake, False)
+            self.loss_D_real = self.criterionGAN(pred_real, True)
+            # combine loss
+            self.loss_D = (self.loss_D_fake + self.loss_D_real) * 0.5
+        # calculate gradients
+        self.backward_loss(self.loss_D, self.optimizer_D)
 
     def backward_G(self):
         """Calculate GAN, L1, and Perceptual loss for the generator"""
-        # First, G(A) should fake the discriminator
-        fake_AB = torch.cat((self.real_A, self.fake_B), 1)
-        pred_fake = self.netD(fake_AB)
-        self.loss_G_GAN = self.criterionGAN(pred_fake, True)
-        
-        # Second, L1 loss: G(A) = B
-        self.loss_G_L1 = self.criterionL1(self.fake_B, self.real_B) * self.opt.lambda_L1
-        
-        # Third, Perceptual loss
-        self.loss_G_Perceptual = 0.0
-        if self.use_perceptual and self.criterionPerceptual is not None:
-            # Normalize images to [0, 1] for VGG (VGG expects [0, 1] range)
-            fake_B_norm = (self.fake_B + 1) / 2.0  # [-1, 1] -> [0, 1]
-            real_B_norm = (self.real_B + 1) / 2.0  # [-1, 1] -> [0, 1]
-            
-            # Get VGG features
-            fake_features = self.criterionPerceptual(fake_B_norm)
-            real_features = self.criterionPerceptual(real_B_norm)
-            
-            # Calculate perceptual loss (L1 distance between features)
-            perceptual_loss = 0.0
-            for fake_feat, real_feat in zip(fake_features, real_features):
-                perceptual_loss += torch.nn.functional.l1_loss(fake_feat, real_feat)
-            
-            self.loss_G_Perceptual = perceptual_loss * self.lambda_perceptual
-        
-        # combine loss and calculate gradients
-        self.loss_G = self.loss_G_GAN + self.loss_G_L1 + self.loss_G_Perceptual
-        self.loss_G.backward()
+        with self.autocast():
+            # First, G(A) should fake the discriminator
+            fake_AB = self.fake_AB if self.opt.fused_step else torch.cat((self.real_A, self.fake_B), 1)  # reuse the pair built in <backward_D>
+            pred_fake = self.netD(fake_AB)
+            self.loss_G_GAN = self.criterionGAN(pred_fake, True)
+
+            # Second, L1 loss: G(A) = B
+            self.loss_G_L1 = self.criterionL1(self.fake_B.float(), self.real_B) * self.opt.lambda_L1
+
+            # Third, Perceptual loss
+            self.loss_G_Perceptual = 0.0
+            if self.use_perceptual and self.criterionPerceptual is not None:
+                # L1 distance between VGG features of G(A) and B; the features of B need no gradients (and may come from the cache)
+                self.loss_G_Perceptual = self.criterionPerceptual(self.fake_B, self.real_B, self.target_paths) * self.lambda_perceptual
+
+            # combine loss
+            self.loss_G = self.loss_G_GAN + self.loss_G_L1 + self.loss_G_Perceptual
+        # calculate gradients
+        self.backward_loss(self.loss_G, self.optimizer_G)
 
     def optimize_parameters(self):
-        self.forward()  # compute fake images: G(A)
+        with self.timer.phase("forward"), self.autocast():
+            self.forward()  # compute fake images: G(A)
         # update D
         self.set_requires_grad(self.netD, True)
         self.optimizer_D.zero_grad()
-        self.backward_D()
-        self.optimizer_D.step()
+        with self.timer.phase("backward_D"):
+            self.backward_D()
+        with self.timer.phase("step_D"):
+            self.optimizer_step(self.optimizer_D)
         # update G
         self.set_requires_grad(self.netD, False)
         self.optimizer_G.zero_grad()
-        self.backward_G()
-        self.optimizer_G.step()
+        with self.timer.phase("backward_G"):
+            self.backward_G()
+        with self.timer.phase("step_G"):
+            self.optimizer_step(self.optimizer_G)
 
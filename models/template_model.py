@@ -89,12 +89,16 @@ class TemplateModel(BaseModel):
         """Calculate losses, gradients, and update network weights; called in every training iteration"""
         # caculate the intermediate results if necessary; here self.output has been computed during function <forward>
         # calculate loss given the input and intermediate results
-        self.loss_G = self.criterionLoss(self.output, self.data_B) * self.opt.lambda_regression
-        self.loss_G.backward()  # calculate gradients of network G w.r.t. loss_G
+        with self.autocast():  # forward passes and losses run under autocast with --amp
+            self.loss_G = self.criterionLoss(self.output.float(), self.data_B) * self.opt.lambda_regression
+        self.backward_loss(self.loss_G, self.optimizer)  # calculate gradients of network G w.r.t. loss_G (scaled for fp16 --amp)
 
     def optimize_parameters(self):
         """Update network weights; it will be called in every training iteration."""
-        self.forward()  # first call forward to calculate intermediate results
+        with self.timer.phase("forward"), self.autocast():  # self.timer times named phases with --profile_phases
+            self.forward()  # first call forward to calculate intermediate results
         self.optimizer.zero_grad()  # clear network G's existing gradients
-        self.backward()  # calculate gradients for network G
-        self.optimizer.step()  # update gradients for network G
+        with self.timer.phase("backward_G"):
+            self.backward()  # calculate gradients for network G
+        with self.timer.phase("step_G"):
+            self.optimizer_step(self.optimizer)  # update gradients for network G
@@ -37,7 +37,7 @@ class BaseOptions:
         parser.add_argument("--init_gain", type=float, default=0.02, help="scaling factor for normal, xavier and orthogonal.")
         parser.add_argument("--no_dropout", action="store_true", help="no dropout for the generator")
         # dataset parameters
-        parser.add_argument("--dataset_mode", type=str, default="unaligned", help="chooses how datasets are loaded. [unaligned | aligned | single | colorization]")
+        parser.add_argument("--dataset_mode", type=str, default="unaligned", help="chooses how datasets are loaded. [unaligned | aligned | single | colorization | sharded]")
         parser.add_argument("--direction", type=str, default="AtoB", help="AtoB or BtoA")
         parser.add_argument("--serial_batches", action="store_true", help="if true, takes images in order to make batches, otherwise takes them randomly")
         parser.add_argument("--num_threads", default=4, type=int, help="# threads for loading data")
@@ -47,12 +47,19 @@ class BaseOptions:
         parser.add_argument("--max_dataset_size", type=int, default=float("inf"), help="Maximum number of samples allowed per dataset. If the dataset directory contains more than max_dataset_size, only a subset is loaded.")
         parser.add_argument("--preprocess", type=str, default="resize_and_crop", help="scaling and cropping of images at load time [resize_and_crop | crop | scale_width | scale_width_and_crop | none]")
         parser.add_argument("--no_flip", action="store_true", help="if specified, do not flip the images for data augmentation")
+        parser.add_argument("--image_cache_dir", type=str, default="", help="if set, aligned/unaligned datasets decode every image once into a memory-mapped cache in this directory")
+        parser.add_argument("--image_cache_resized", action="store_true", help="store images in the cache after the deterministic resize step of --preprocess (resize / scale_width / none)")
+        parser.add_argument("--batch_augment", action="store_true", help="aligned/unaligned datasets: load uint8 images and apply crop/flip/normalization to whole batches after collation; resized images must all have the same size")
         parser.add_argument("--display_winsize", type=int, default=256, help="display window size for both visdom and HTML")
         # additional parameters
         parser.add_argument("--epoch", type=str, default="latest", help="which epoch to load? set to latest to use latest cached model")
         parser.add_argument("--load_iter", type=int, default="0", help="which iteration to load? if load_iter > 0, the code will load models by iter_[load_iter]; otherwise, the code will load models by [epoch]")
         parser.add_argument("--verbose", action="store_true", help="if specified, print more debugging information")
         parser.add_argument("--suffix", default="", type=str, help="customized suffix: opt.name = opt.name + suffix: e.g., {model}_{netG}_size{load_size}")
+        # torch.compile parameters
+        parser.add_argument("--compile", action="store_true", help="compile the networks with torch.compile in <BaseModel.setup>")
+        parser.add_argument("--compile_mode", type=str, default="default", choices=["default", "reduce-overhead", "max-autotune", "max-autotune-no-cudagraphs"], help="torch.compile mode for --compile")
+        parser.add_argument("--compile_cache_dir", type=str, default="", help="directory for the compiled-graph cache reused across runs; default: [checkpoints_dir]/compile_cache")
         # wandb parameters
         parser.add_argument("--use_wandb", action="store_true", help="if specified, then init wandb logging")
         parser.add_argument("--wandb_project_name", type=str, default="CycleGAN-and-pix2pix", help="specify wandb project name")
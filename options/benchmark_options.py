@@ -0,0 +1,27 @@
+from .train_options import TrainOptions
+
+
+class BenchmarkOptions(TrainOptions):
+    """This class includes options for benchmark.py.
+
+    It also includes shared options defined in BaseOptions and TrainOptions. Every training option given on the command line
+    (e.g. --batch_size, --num_threads, --amp, --fused_step) is passed on to each benchmarked combination;
+    --model, --netG, --netD, --load_size/--crop_size and --dataroot are set by the benchmark matrix.
+    '--dataroot' is the directory where the synthetic images are generated (reused across runs).
+    """
+
+    def initialize(self, parser):
+        parser = TrainOptions.initialize(self, parser)  # define shared options
+        parser.add_argument('--bench_models', type=str, default='pix2pix,cycle_gan,colorization,pix2pix_with_perceptual', help='comma-separated models to benchmark')
+        parser.add_argument('--bench_netG', type=str, default='unet_128,unet_256,resnet_6blocks,resnet_9blocks', help='comma-separated generator architectures to benchmark')
+        parser.add_argument('--bench_netD', type=str, default='basic,n_layers,pixel', help='comma-separated discriminator architectures to benchmark')
+        parser.add_argument('--bench_sizes', type=str, default='128,256', help='comma-separated crop sizes; the synthetic images are generated at each size')
+        parser.add_argument('--bench_iters', type=int, default=20, help='number of timed training steps per combination')
+        parser.add_argument('--bench_warmup', type=int, default=3, help='number of untimed steps before timing (cuDNN autotuning, allocator warm-up, torch.compile)')
+        parser.add_argument('--bench_images', type=int, default=64, help='number of synthetic images generated per size (and per domain)')
+        parser.add_argument('--bench_output', type=str, default='', help='result JSON file; default: [checkpoints_dir]/[name]/benchmark.json')
+        parser.add_argument('--bench_baseline', type=str, default='', help='result JSON of an earlier run; combinations whose throughput dropped by more than --bench_tolerance are reported and the exit code is 1')
+        parser.add_argument('--bench_tolerance', type=float, default=0.1, help='relative throughput drop (or peak memory increase) against --bench_baseline that counts as a regression')
+        parser.add_argument('--bench_worker', type=str, default='', help='internal: run a single combination and write its result to this file')
+        parser.set_defaults(name='benchmark', phase='train')
+        return parser
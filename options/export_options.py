@@ -0,0 +1,16 @@
+from .test_options import TestOptions
+
+
+class ExportOptions(TestOptions):
+    """This class includes options for export.py.
+
+    It also includes shared options defined in BaseOptions and TestOptions; the generator is created and loaded as in test.py.
+    """
+
+    def initialize(self, parser):
+        parser = TestOptions.initialize(self, parser)  # define shared options
+        parser.add_argument('--export_format', type=str, default='torchscript', choices=['torchscript', 'export'], help='torchscript: traced and frozen TorchScript module | export: torch.export program (requires --eval)')
+        parser.add_argument('--export_path', type=str, default='', help='output file; default: [checkpoints_dir]/[name]/[epoch]_net_G.torchscript.pt (or .pt2)')
+        parser.add_argument('--export_size', type=int, default=0, help='height/width of the example input used for tracing; 0 uses crop_size')
+        parser.set_defaults(phase='export')
+        return parser
@@ -0,0 +1,19 @@
+from .test_options import TestOptions
+
+
+class QuantizeOptions(TestOptions):
+    """This class includes options for quantize.py.
+
+    It also includes shared options defined in BaseOptions and TestOptions; the generator is created and loaded as in test.py,
+    and '--dataroot' points to a folder of input images (loaded with '--dataset_mode single') used for calibration and the drift report.
+    """
+
+    def initialize(self, parser):
+        parser = TestOptions.initialize(self, parser)  # define shared options
+        parser.add_argument('--quant_mode', type=str, default='static', choices=['static', 'dynamic'], help='static: int8 weights and activations calibrated on --num_calib images | dynamic: int8 weights, activation ranges computed per batch')
+        parser.add_argument('--quant_backend', type=str, default='x86', choices=['x86', 'fbgemm', 'qnnpack'], help='quantized engine; x86/fbgemm for x86 servers, qnnpack for ARM')
+        parser.add_argument('--num_calib', type=int, default=32, help='number of images used to calibrate activation ranges (static mode)')
+        parser.add_argument('--num_report', type=int, default=16, help='number of images (after the calibration images) used for the PSNR/SSIM drift report')
+        parser.add_argument('--quant_path', type=str, default='', help='output file; default: [checkpoints_dir]/[name]/[epoch]_net_G_int8_[quant_mode].torchscript.pt')
+        parser.set_defaults(phase='quantize')
+        return parser
@@ -15,6 +15,19 @@ class TestOptions(BaseOptions):
         # Dropout and Batchnorm has different behavioir during training and test.
         parser.add_argument('--eval', action='store_true', help='use eval mode during test time.')
         parser.add_argument('--num_test', type=int, default=50, help='how many test images to run')
+        # batched test mode: by default test.py runs one image at a time without loader workers and saves results synchronously
+        parser.add_argument('--test_batch_size', type=int, default=1, help='number of images per forward pass during test')
+        parser.add_argument('--test_num_threads', type=int, default=0, help='# data loader workers during test')
+        parser.add_argument('--num_save_workers', type=int, default=0, help='if > 0, encode and write result images in this many background threads')
+        # tiled inference for high-resolution images (use with --preprocess none to keep the original resolution)
+        parser.add_argument('--tile_size', type=int, default=0, help='if > 0, run the generator over overlapping tiles of this size; rounded down to a multiple of the generator stride')
+        parser.add_argument('--tile_overlap', type=int, default=64, help='number of overlapping pixels between neighbouring tiles; seams are feather-blended')
+        parser.add_argument('--tile_batch_size', type=int, default=4, help='number of tiles passed through the generator in one forward call')
+        # inference graph optimization (requires --eval)
+        parser.add_argument('--optimize_inference', action='store_true', help='fold batch norm layers into the preceding convolutions and remove Dropout/Identity layers of the generator; verified against the original')
+        parser.add_argument('--optimize_tolerance', type=float, default=1e-4, help='maximum absolute output difference allowed when verifying --optimize_inference')
+        # generator artifacts written by export.py / quantize.py
+        parser.add_argument('--netG_artifact', type=str, default='', help='if set, run this exported (or int8-quantized) generator artifact instead of loading [epoch]_net_G.pth; int8 artifacts run on the CPU')
         # rewrite devalue values
         parser.set_defaults(model='test')
         # To avoid cropping, the load_size should be the same as crop_size
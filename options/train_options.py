@@ -13,11 +13,22 @@ class TrainOptions(BaseOptions):
         parser.add_argument('--display_freq', type=int, default=400, help='frequency of showing training results on screen')
         parser.add_argument('--update_html_freq', type=int, default=1000, help='frequency of saving training results to html')
         parser.add_argument('--print_freq', type=int, default=100, help='frequency of showing training results on console')
+        parser.add_argument('--log_flush_freq', type=int, default=10, help='write loss_log.txt / loss_log.jsonl and send wandb logs every log_flush_freq printed rows (and at the end of every epoch)')
         parser.add_argument('--no_html', action='store_true', help='do not save intermediate training results to [opt.checkpoints_dir]/[opt.name]/web/')
+        parser.add_argument('--html_page_size', type=int, default=50, help='number of epochs on web/index.html; older epochs are moved to archive pages web/index_<n>.html')
+        parser.add_argument('--display_queue_size', type=int, default=4, help='number of pending result images sets written by a background thread; 0 writes them in the training loop')
+        # profiling parameters
+        parser.add_argument('--profile_phases', action='store_true', help='time the phases of each training step (data, set_input, forward, backward_D/G, optimizer steps, visualizer, checkpoint) and log rolling percentiles every print_freq iterations')
+        parser.add_argument('--profile_window', type=int, default=100, help='number of recent steps used for the --profile_phases percentiles')
+        parser.add_argument('--profile_trace', type=str, default='', help="record a torch.profiler trace while total_iters is in <start>:<end>, e.g. 1000:1040 (same unit as print_freq); '' disables")
+        parser.add_argument('--profile_dir', type=str, default='', help='directory for the --profile_trace files; default: [checkpoints_dir]/[name]/profile')
         # network saving and loading parameters
         parser.add_argument('--save_latest_freq', type=int, default=5000, help='frequency of saving the latest results')
         parser.add_argument('--save_epoch_freq', type=int, default=5, help='frequency of saving checkpoints at the end of epochs')
         parser.add_argument('--save_by_iter', action='store_true', help='whether saves model by iteration')
+        parser.add_argument('--async_save', action='store_true', help='write checkpoints in a background thread; the state dicts are copied to CPU memory first')
+        parser.add_argument('--keep_last', type=int, default=0, help='if > 0, delete numbered checkpoints (epochs and iter_*) except the newest keep_last; latest is always kept')
+        parser.add_argument('--keep_every', type=int, default=0, help='if > 0, keep numbered checkpoints whose epoch/iteration is a multiple of keep_every and delete the others not kept by --keep_last; latest is always kept')
         parser.add_argument('--continue_train', action='store_true', help='continue training: load the latest model')
         parser.add_argument('--epoch_count', type=int, default=1, help='the starting epoch count, we save the model by <epoch_count>, <epoch_count>+<save_latest_freq>, ...')
         parser.add_argument('--phase', type=str, default='train', help='train, val, test, etc')
@@ -28,8 +39,13 @@ class TrainOptions(BaseOptions):
         parser.add_argument('--lr', type=float, default=0.0002, help='initial learning rate for adam')
         parser.add_argument('--gan_mode', type=str, default='lsgan', help='the type of GAN objective. [vanilla| lsgan | wgangp]. vanilla GAN loss is the cross-entropy objective used in the original GAN paper.')
         parser.add_argument('--pool_size', type=int, default=50, help='the size of image buffer that stores previously generated images')
+        parser.add_argument('--pool_storage', type=str, default='device', choices=['device', 'cpu'], help='where the image buffer lives: device (training device) | cpu (pinned host memory, saves device memory)')
         parser.add_argument('--lr_policy', type=str, default='linear', help='learning rate policy. [linear | step | plateau | cosine]')
         parser.add_argument('--lr_decay_iters', type=int, default=50, help='multiply by a gamma every lr_decay_iters iterations')
+        parser.add_argument('--amp', action='store_true', help='use automatic mixed precision: run forward passes and losses under autocast')
+        parser.add_argument('--amp_dtype', type=str, default='auto', choices=['auto', 'bf16', 'fp16'], help='autocast dtype for --amp. auto: fp16 (with gradient scaling) on CUDA, bf16 otherwise')
+        parser.add_argument('--grad_checkpoint', type=str, default='', help="recompute generator activations during backward to save memory. '' (off) | all | every_<k> | comma-separated block indices; blocks are U-Net depths (0 = outermost) or ResnetBlocks")
+        parser.add_argument('--fused_step', action='store_true', help='batch network calls within a training step (pix2pix: one discriminator forward over real and fake pairs; cycle_gan: 3 instead of 6 generator calls); losses are unchanged')
 
         self.isTrain = True
         return parser
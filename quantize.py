@@ -0,0 +1,129 @@
+"""학습된 generator를 CPU 추론용 int8 아티팩트로 양자화하는 스크립트.
+
+test.py와 같은 방식으로 '--checkpoints_dir'에서 netG(<epoch>_net_G.pth)를 로드한 뒤 int8로 양자화하고,
+TorchScript 아티팩트로 저장합니다. 저장된 아티팩트는 test.py('--netG_artifact')와
+웹 백엔드(Pix2PixInference(artifact_path=...))에서 바로 로드할 수 있습니다.
+
+양자화 모드:
+    static  -- 가중치와 활성화를 모두 int8로 변환. '--dataroot'의 이미지 '--num_calib'장으로 활성화 범위를 보정하며,
+               Conv+BatchNorm(+ReLU), ConvTranspose+BatchNorm을 먼저 융합합니다 (FX graph mode).
+    dynamic -- 가중치만 미리 int8로 변환하고 활성화 범위는 배치마다 계산. BatchNorm은 conv에 접어 넣습니다. 보정 데이터 불필요.
+
+보정에 사용하지 않은 다음 '--num_report'장으로 fp32 모델 대비 PSNR/SSIM 변화와 이미지당 지연 시간을 측정해
+'<아티팩트>.report.json'에 저장합니다. 정확도 손실과 속도 향상을 비교해 배포 여부를 결정하세요.
+
+양자화된 모델은 항상 eval 모드 정규화(BatchNorm running 통계, dropout 없음)를 사용합니다.
+
+예시:
+    python quantize.py --dataroot ./datasets/facades/testB --name facades_pix2pix --model pix2pix --direction BtoA --eval
+    python quantize.py --dataroot ./datasets/portraits/testA --name portrait_retouch --model test --netG unet_256 --norm batch --eval --quant_mode dynamic
+"""
+
+import json
+import time
+from options.quantize_options import QuantizeOptions  # 양자화 옵션 파서
+from data import create_dataset  # 데이터셋 생성 함수
+from models import create_model  # 모델 생성 함수
+from models.inference import artifact_metadata, export_generator, load_generator_artifact, quantize_generator, unwrap_generator
+from util.metrics import psnr, ssim
+import torch
+
+
+def time_per_image(net, batches):
+    """배치들을 한 번씩 실행했을 때 이미지당 평균 지연 시간(ms)"""
+    with torch.inference_mode():
+        net(batches[0])  # 워밍업
+        start = time.perf_counter()
+        for batch in batches:
+            net(batch)
+        elapsed = time.perf_counter() - start
+    return elapsed / sum(batch.shape[0] for batch in batches) * 1000
+
+
+if __name__ == "__main__":
+    # 양자화 옵션 파싱
+    opt = QuantizeOptions().parse()
+
+    # 양자화 커널은 CPU 전용이므로 모든 작업을 CPU에서 수행
+    opt.device = torch.device("cpu")
+    opt.compile = False
+    opt.tile_size = 0
+    opt.netG_artifact = ""
+    # 보정 이미지는 single 데이터셋으로 순서대로 로드
+    opt.dataset_mode = "single"
+    opt.num_threads = opt.test_num_threads
+    opt.batch_size = opt.test_batch_size
+    opt.serial_batches = True
+    opt.no_flip = True
+    if not opt.eval:
+        print("Warning: int8 artifacts always use eval-mode normalization; compare against test.py with --eval")
+
+    dataset = create_dataset(opt)
+    model = create_model(opt)
+    model.setup(opt)
+    model.eval()
+    netG = unwrap_generator(model.netG)
+
+    # 앞의 --num_calib장은 보정용, 그다음 --num_report장은 리포트용
+    calibration, report = [], []
+    num_calib = opt.num_calib if opt.quant_mode == "static" else 0
+    for data in dataset:
+        batch = data["A"]
+        if sum(b.shape[0] for b in calibration) < num_calib:
+            calibration.append(batch)
+        elif sum(b.shape[0] for b in report) < opt.num_report:
+            report.append(batch)
+        else:
+            break
+    if not report:
+        print("Warning: no images left after calibration; the drift report uses the calibration images")
+        report = calibration
+    if not report:
+        raise RuntimeError(f"Found 0 images in: {opt.dataroot}")
+
+    # 양자화 및 아티팩트 저장
+    print(f"quantizing netG ({opt.netG}) with {opt.quant_mode} int8 quantization ({opt.quant_backend}, {sum(b.shape[0] for b in calibration)} calibration images)")
+    quantized, fused = quantize_generator(netG, opt.quant_mode, calibration, opt.quant_backend)
+    metadata = artifact_metadata(opt, netG)
+    metadata["eval"] = True
+    metadata["quantization"] = {"mode": opt.quant_mode, "backend": opt.quant_backend, "num_calib": sum(b.shape[0] for b in calibration), "fused_batch_norms": fused}
+    path = opt.quant_path or model.save_dir / f"{opt.epoch}_net_G_int8_{opt.quant_mode}.torchscript.pt"
+    path = export_generator(quantized, path, metadata, "torchscript", opt.crop_size)
+    print(f"saved the int8 artifact to {path} ({fused} batch norm layers fused)")
+
+    # 저장된 아티팩트를 다시 로드해서 fp32 모델과 비교
+    artifact, _ = load_generator_artifact(path)
+    psnrs, ssims, max_diff = [], [], 0.0
+    with torch.inference_mode():
+        for batch in report:
+            reference, output = netG(batch), artifact(batch)
+            psnrs += psnr(output, reference).tolist()
+            ssims += ssim(output, reference).tolist()
+            max_diff = max(max_diff, (output - reference).abs().max().item())
+    fp32_ms, int8_ms = time_per_image(netG, report), time_per_image(artifact, report)
+    checkpoint_path = model.save_dir / f"{opt.epoch}_net_G.pth"
+    result = {
+        "artifact": str(path),
+        "quantization": metadata["quantization"],
+        "num_images": len(psnrs),
+        "psnr_mean": sum(psnrs) / len(psnrs),
+        "psnr_min": min(psnrs),
+        "ssim_mean": sum(ssims) / len(ssims),
+        "ssim_min": min(ssims),
+        "max_abs_diff": max_diff,
+        "fp32_ms_per_image": fp32_ms,
+        "int8_ms_per_image": int8_ms,
+        "speedup": fp32_ms / int8_ms,
+        "num_threads": torch.get_num_threads(),
+        "fp32_size_mb": checkpoint_path.stat().st_size / 1024**2 if checkpoint_path.exists() else None,
+        "int8_size_mb": path.stat().st_size / 1024**2,
+    }
+    report_path = path.with_name(path.name + ".report.json")
+    with open(report_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print("----------------- Drift report (int8 vs fp32) ---------------")
+    print(f"PSNR: mean {result['psnr_mean']:.2f} dB, min {result['psnr_min']:.2f} dB over {result['num_images']} images")
+    print(f"SSIM: mean {result['ssim_mean']:.4f}, min {result['ssim_min']:.4f}; max abs diff {max_diff:.4f}")
+    print(f"latency: fp32 {fp32_ms:.1f} ms/image, int8 {int8_ms:.1f} ms/image ({result['speedup']:.2f}x, {result['num_threads']} threads)")
+    print(f"report written to {report_path}")
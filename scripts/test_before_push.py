@@ -1,8 +1,89 @@
 import pytest
 import os
+import sys
 import subprocess
 from pathlib import Path
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def fused_step_losses(tmp_path, monkeypatch, model, fused_step, steps=2, extra_args=()):
+    """Train <model> for a few CPU steps on fixed random inputs.
+
+    Returns the losses of every step and the gradients of every network parameter after the first step.
+    """
+    monkeypatch.syspath_prepend(str(PROJECT_ROOT))
+    import torch
+    from options.train_options import TrainOptions
+    from models import create_model
+
+    argv = ["train.py", "--dataroot", str(tmp_path), "--checkpoints_dir", str(tmp_path), "--name", f"fused_{model}", "--model", model,
+            "--netG", "resnet_6blocks", "--ngf", "8", "--ndf", "8", "--norm", "batch", "--no_dropout", "--pool_size", "0", "--batch_size", "2"]
+    if fused_step:
+        argv.append("--fused_step")
+    argv.extend(extra_args)
+    monkeypatch.setattr(sys, "argv", argv)
+    opt = TrainOptions().parse()
+    opt.device = torch.device("cpu")
+
+    torch.manual_seed(0)  # same initial weights for both runs
+    net = create_model(opt)
+    net.setup(opt)
+    generator = torch.Generator().manual_seed(1)
+    losses, grads = [], {}
+    for step in range(steps):
+        data = {
+            "A": torch.rand(2, 3, 64, 64, generator=generator) * 2 - 1,
+            "B": torch.rand(2, 3, 64, 64, generator=generator) * 2 - 1,
+            "A_paths": ["a0.png", "a1.png"],
+            "B_paths": ["b0.png", "b1.png"],
+        }
+        net.set_input(data)
+        net.optimize_parameters()
+        losses.append(net.get_current_losses())
+        if step == 0:
+            for name in net.model_names:
+                for param_name, param in getattr(net, "net" + name).named_parameters():
+                    if param.grad is not None:
+                        grads[f"{name}.{param_name}"] = param.grad.detach().clone()
+    return losses, grads
+
+
+@pytest.mark.parametrize("grad_checkpoint", ["", "all"])
+@pytest.mark.parametrize("model", ["pix2pix", "cycle_gan"])
+def test_fused_step_matches_unfused(tmp_path, monkeypatch, model, grad_checkpoint):
+    """--fused_step must give the same losses and gradients as separate network calls (batch norm keeps per-chunk
+    statistics, also when checkpointed generator blocks are recomputed during backward)."""
+    import torch
+
+    extra_args = ["--grad_checkpoint", grad_checkpoint] if grad_checkpoint else []
+    unfused, unfused_grads = fused_step_losses(tmp_path, monkeypatch, model, fused_step=False, extra_args=extra_args)
+    fused, fused_grads = fused_step_losses(tmp_path, monkeypatch, model, fused_step=True, extra_args=extra_args)
+    for step, (expected, actual) in enumerate(zip(unfused, fused)):
+        for name in expected:
+            assert actual[name] == pytest.approx(expected[name], rel=1e-4, abs=1e-5), f"step {step}: loss {name} differs with --fused_step"
+    assert unfused_grads.keys() == fused_grads.keys()
+    for name, expected in unfused_grads.items():
+        assert torch.allclose(fused_grads[name], expected, rtol=1e-3, atol=1e-5), f"gradient of {name} differs with --fused_step"
+
+
+@pytest.mark.parametrize("netG", ["unet_128", "resnet_6blocks"])
+def test_optimized_generator_matches_eval(monkeypatch, netG):
+    """Folding batch norms and stripping dropout (--optimize_inference) must not change the eval-mode output."""
+    monkeypatch.syspath_prepend(str(PROJECT_ROOT))
+    import torch
+    from models import networks
+    from models.inference import optimize_generator, verify_generator
+
+    torch.manual_seed(0)
+    net = networks.define_G(3, 3, 8, netG, "batch", True, "normal", 0.02)
+    with torch.no_grad():  # a few training-mode passes so that the running statistics are not the identity
+        for _ in range(3):
+            net(torch.rand(2, 3, 128, 128) * 2 - 1)
+    optimized = optimize_generator(net)
+    assert not any(isinstance(m, (torch.nn.BatchNorm2d, torch.nn.Dropout)) for m in optimized.modules())
+    assert verify_generator(net, optimized, 128, atol=1e-4) <= 1e-4
+
 
 class TestBeforePush:
     """Test suite to ensure basic functionality works before pushing code."""
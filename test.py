@@ -22,6 +22,9 @@ train.py로 모델을 훈련시킨 후, 이 스크립트를 사용하여 모델
     pix2pix 모델 테스트:
         python test.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA
 
+    export.py/quantize.py로 만든 generator 아티팩트로 테스트:
+        python test.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA --netG_artifact ./checkpoints/facades_pix2pix/latest_net_G_int8_static.torchscript.pt
+
 더 많은 테스트 옵션은 options/base_options.py와 options/test_options.py를 참조하세요.
 훈련 및 테스트 팁: https://github.com/junyanz/pytorch-CycleGAN-and-pix2pix/blob/master/docs/tips.md
 자주 묻는 질문: https://github.com/junyanz/pytorch-CycleGAN-and-pix2pix/blob/master/docs/qa.md
@@ -32,7 +35,8 @@ from pathlib import Path
 from options.test_options import TestOptions  # 테스트 옵션 파서
 from data import create_dataset  # 데이터셋 생성 함수
 from models import create_model  # 모델 생성 함수
-from util.visualizer import save_images  # 이미지 저장 함수
+from models.inference import read_artifact_metadata  # 아티팩트 메타데이터 읽기
+from util.visualizer import save_images, split_visuals, AsyncImageSaver  # 이미지 저장 함수
 from util import html  # HTML 생성 유틸리티
 import torch
 
@@ -50,9 +54,13 @@ if __name__ == "__main__":
     # GPU 사용 가능 여부에 따라 디바이스 설정
     opt.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     
+    # int8 양자화 아티팩트(--netG_artifact)는 CPU에서만 실행 가능
+    if opt.netG_artifact and read_artifact_metadata(opt.netG_artifact).get("quantization"):
+        opt.device = torch.device("cpu")
+    
     # 테스트를 위해 일부 파라미터 하드코딩
-    opt.num_threads = 0  # 테스트 코드는 num_threads = 0만 지원
-    opt.batch_size = 1  # 테스트 코드는 batch_size = 1만 지원
+    opt.num_threads = opt.test_num_threads  # 기본값 0; --test_num_threads로 데이터 로더 워커 사용
+    opt.batch_size = opt.test_batch_size  # 기본값 1; --test_batch_size로 배치 단위 추론
     opt.serial_batches = True  # 데이터 셔플링 비활성화; 무작위로 선택된 이미지 결과가 필요하면 이 줄을 주석 처리
     opt.no_flip = True  # 이미지 뒤집기 비활성화; 뒤집힌 이미지 결과가 필요하면 이 줄을 주석 처리
     
@@ -80,9 +88,13 @@ if __name__ == "__main__":
     if opt.eval:
         model.eval()
     
-    # 데이터셋의 각 이미지에 대해 추론 수행
+    # 결과 이미지 저장: --num_save_workers > 0이면 백그라운드 스레드에서 인코딩/저장
+    saver = AsyncImageSaver(opt.num_save_workers) if opt.num_save_workers > 0 else None
+    
+    # 데이터셋의 각 배치에 대해 추론 수행
+    num_done = 0  # 처리한 이미지 수
     for i, data in enumerate(dataset):
-        if i >= opt.num_test:  # opt.num_test 이미지에만 모델 적용
+        if num_done >= opt.num_test:  # opt.num_test 이미지에만 모델 적용
             break
         
         # 데이터 로더에서 데이터 언패킹
@@ -95,14 +107,27 @@ if __name__ == "__main__":
         visuals = model.get_current_visuals()
         
         # 이미지 경로 가져오기
-        img_path = model.get_image_paths()
+        img_paths = model.get_image_paths()
         
-        # 5개마다 진행 상황 출력 및 HTML 파일에 이미지 저장
-        if i % 5 == 0:
-            print(f"processing ({i:04d})-th image... {img_path}")
-        
-        # 이미지를 HTML 웹페이지에 저장
-        save_images(webpage, visuals, img_path, aspect_ratio=opt.aspect_ratio, width=opt.display_winsize)
+        # 배치를 샘플 단위로 나눠서 HTML 웹페이지에 저장
+        for j, img_path in enumerate(img_paths):
+            if num_done >= opt.num_test:
+                break
+            
+            # 5개마다 진행 상황 출력
+            if num_done % 5 == 0:
+                print(f"processing ({num_done:04d})-th image... {[img_path]}")
+            
+            sample_visuals = split_visuals(visuals, j) if len(img_paths) > 1 else visuals
+            if saver is not None:
+                saver.save_images(webpage, sample_visuals, [img_path], aspect_ratio=opt.aspect_ratio, width=opt.display_winsize)
+            else:
+                save_images(webpage, sample_visuals, [img_path], aspect_ratio=opt.aspect_ratio, width=opt.display_winsize)
+            num_done += 1
+    
+    # 백그라운드 저장 작업 완료 대기
+    if saver is not None:
+        saver.close()
     
     # HTML 파일 저장
     webpage.save()
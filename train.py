@@ -6,7 +6,8 @@ You need to specify the dataset ('--dataroot'), experiment name ('--name'), and
 
 It first creates model, dataset, and visualizer given the option.
 It then does standard network training. During the training, it also visualize/save the images, print/save the loss plot, and save models.
-The script supports continue/resume training. Use '--continue_train' to resume your previous training.
+The script supports continue/resume training. Use '--continue_train' to resume your previous training;
+checkpoints saved by this script also restore the optimizers, schedulers, RNG states and the position within the epoch.
 
 Example:
     Train a CycleGAN model:
@@ -24,6 +25,7 @@ from options.train_options import TrainOptions
 from data import create_dataset
 from models import create_model
 from util.visualizer import Visualizer
+from util.profiler import TraceWindow
 from util.util import init_ddp, cleanup_ddp
 
 
@@ -37,8 +39,21 @@ if __name__ == "__main__":
     model = create_model(opt)  # create a model given opt.model and other options
     model.setup(opt)  # regular setup: load and print networks; create schedulers
     visualizer = Visualizer(opt)  # create a visualizer that display/save images and plots
+    timer = model.timer  # per-phase step timing (--profile_phases); a no-op otherwise
+    trace = TraceWindow(opt.profile_trace, opt.profile_dir or f"{opt.checkpoints_dir}/{opt.name}/profile", timer)  # --profile_trace
     total_iters = 0  # the total number of training iterations
-    for epoch in range(opt.epoch_count, opt.n_epochs + opt.n_epochs_decay + 1):
+    start_epoch, resume_iter = opt.epoch_count, 0
+    if model.training_state is not None:  # --continue_train from a checkpoint with a training state: resume at the exact batch
+        start_epoch, resume_iter, total_iters = model.training_state["epoch"], model.training_state["epoch_iter"], model.training_state["total_iters"]
+        if model.training_state.get("data"):
+            dataset.load_state_dict(model.training_state["data"])
+        # the restored epoch and scheduler already include the original --epoch_count; adding a new one would offset them twice
+        saved_epoch_count = model.training_state.get("epoch_count", 1)
+        if opt.epoch_count != saved_epoch_count:
+            print(f"Warning: ignoring --epoch_count {opt.epoch_count}; resuming from the training state (the run started with --epoch_count {saved_epoch_count})")
+            opt.epoch_count = saved_epoch_count  # read by the linear learning rate rule
+        print(f"resuming at epoch {start_epoch}, epoch_iter {resume_iter}, total_iters {total_iters}")
+    for epoch in range(start_epoch, opt.n_epochs + opt.n_epochs_decay + 1):
         epoch_start_time = time.time()  # timer for entire epoch
         iter_data_time = time.time()  # timer for data loading per iteration
         epoch_iter = 0  # the number of training iterations in current epoch, reset to 0 every epoch
@@ -46,32 +61,44 @@ if __name__ == "__main__":
         # Set epoch for DistributedSampler
         if hasattr(dataset, "set_epoch"):
             dataset.set_epoch(epoch)
+        if resume_iter > 0:  # skip the batches trained on before the interruption without loading them
+            dataset.skip(resume_iter // opt.batch_size)
+            epoch_iter, resume_iter = resume_iter, 0
 
         for i, data in enumerate(dataset):  # inner loop within one epoch
             iter_start_time = time.time()  # timer for computation per iteration
+            timer.record("data", iter_start_time - iter_data_time)
+            trace.step(total_iters)
             if total_iters % opt.print_freq == 0:
                 t_data = iter_start_time - iter_data_time
 
             total_iters += opt.batch_size
             epoch_iter += opt.batch_size
-            model.set_input(data)  # unpack data from dataset and apply preprocessing
+            with timer.phase("set_input"):
+                model.set_input(data)  # unpack data from dataset and apply preprocessing
             model.optimize_parameters()  # calculate loss functions, get gradients, update network weights
+            visualizer.add_losses(model.get_current_losses(as_tensors=True))  # accumulated on the device, no synchronization
 
             if total_iters % opt.display_freq == 0:  # display images on visdom and save images to a HTML file
-                save_result = total_iters % opt.update_html_freq == 0
-                model.compute_visuals()
-                visualizer.display_current_results(model.get_current_visuals(), epoch, total_iters, save_result)
+                with timer.phase("visualizer", host=True):
+                    save_result = total_iters % opt.update_html_freq == 0
+                    model.compute_visuals()
+                    visualizer.display_current_results(model.get_current_visuals(), epoch, total_iters, save_result)
 
             if total_iters % opt.print_freq == 0:  # print training losses and save logging information to the disk
-                losses = model.get_current_losses()
+                losses = visualizer.reduce_losses()  # mean losses since the last print over all ranks (one all_reduce, one device sync)
                 t_comp = (time.time() - iter_start_time) / opt.batch_size
-                visualizer.print_current_losses(epoch, epoch_iter, losses, t_comp, t_data)
+                visualizer.print_current_losses(epoch, epoch_iter, losses, t_comp, t_data, total_iters)
                 visualizer.plot_current_losses(total_iters, losses)
+                timings = timer.summary()
+                visualizer.print_current_timings(epoch, epoch_iter, timings)
+                visualizer.plot_current_timings(total_iters, timings)
 
             if total_iters % opt.save_latest_freq == 0:  # cache our latest model every <save_latest_freq> iterations
                 print(f"saving the latest model (epoch {epoch}, total_iters {total_iters})")
                 save_suffix = f"iter_{total_iters}" if opt.save_by_iter else "latest"
-                model.save_networks(save_suffix)
+                with timer.phase("checkpoint", host=True):
+                    model.save_networks(save_suffix, {"epoch": epoch, "epoch_iter": epoch_iter, "total_iters": total_iters, "epoch_count": opt.epoch_count, "data": dataset.state_dict()})
 
             iter_data_time = time.time()
 
@@ -79,9 +106,14 @@ if __name__ == "__main__":
 
         if epoch % opt.save_epoch_freq == 0:  # cache our model every <save_epoch_freq> epochs
             print(f"saving the model at the end of epoch {epoch}, iters {total_iters}")
-            model.save_networks("latest")
-            model.save_networks(epoch)
+            # one snapshot for both tags; the training state points at the start of the next epoch
+            with timer.phase("checkpoint", host=True):
+                model.save_networks(["latest", epoch], {"epoch": epoch + 1, "epoch_iter": 0, "total_iters": total_iters, "epoch_count": opt.epoch_count, "data": dataset.state_dict()})
 
         print(f"End of epoch {epoch} / {opt.n_epochs + opt.n_epochs_decay} \t Time Taken: {time.time() - epoch_start_time:.0f} sec")
+        visualizer.flush()  # write the buffered loss log rows and wandb logs
 
+    trace.close()  # write the trace if training ended inside the --profile_trace window
+    visualizer.close()  # wait for the background image writer
+    model.flush_checkpoints()  # wait for background checkpoint writes (--async_save)
     cleanup_ddp()
@@ -0,0 +1,179 @@
+"""This module implements the checkpoint writer used by <BaseModel.save_networks>.
+
+Saving happens in two steps:
+    1. on the training thread, every state dict is snapshotted to CPU memory (so training can keep updating the weights);
+    2. the files are written (optionally in a background thread) to a temporary name, fsync'ed and renamed over the target,
+       so a crash never leaves a half-written 'latest_net_G.pth' behind.
+Several tags of one snapshot (e.g. 'latest' and the epoch number) are written once and hard-linked.
+
+Retention (--keep_last / --keep_every) deletes old numbered checkpoints ('<epoch>_*' and 'iter_<n>_*') after each save;
+'latest' is never deleted.
+"""
+
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+from pathlib import Path
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"^(iter_)?(\d+)_(net_\w+|amp_scalers|image_pools|training_state)\.pth$")
+
+
+def snapshot(obj):
+    """Return a copy of a (nested) state dict with every tensor copied to CPU memory"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        copy = type(obj)((key, snapshot(value)) for key, value in obj.items())
+        if hasattr(obj, "_metadata"):  # module state dicts carry per-module version info
+            copy._metadata = obj._metadata
+        return copy
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    """torch.save to a temporary file in the same directory, fsync it, then rename it over <path>"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def link_or_copy(src, dst):
+    """Make <dst> an atomic hard link to <src> (a copy if the file system has no hard links)"""
+    dst = Path(dst)
+    tmp_path = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class CheckpointWriter:
+    """Write checkpoint files atomically, optionally in a background thread, and apply a retention policy."""
+
+    def __init__(self, save_dir, async_write=False, keep_last=0, keep_every=0):
+        """Initialize the writer
+
+        Parameters:
+            save_dir (str)     -- checkpoint directory
+            async_write (bool) -- write in a background thread; at most one snapshot waits in the queue, so a slow disk blocks the next save instead of piling up copies in memory
+            keep_last (int)    -- if > 0, keep the newest <keep_last> epoch checkpoints (and iteration checkpoints)
+            keep_every (int)   -- if > 0, keep every checkpoint whose epoch (or iteration) is a multiple of <keep_every>
+        The two policies are independent: a checkpoint is kept if either keeps it. With both at 0 nothing is deleted.
+        """
+        self.save_dir = Path(save_dir)
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.error = None
+        self.queue = None
+        if async_write:
+            self.queue = queue.Queue(maxsize=1)
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+
+    def save(self, tags, files):
+        """Save a snapshot under one or more tags.
+
+        Parameters:
+            tags (list)   -- e.g. ['latest', 5]; file names are '<tag>_<name>'
+            files (dict)  -- maps names (e.g. 'net_G.pth') to state dicts; snapshotted to CPU before this call returns
+        """
+        self._raise_error()
+        job = ([str(tag) for tag in tags], {name: snapshot(state) for name, state in files.items()})
+        if self.queue is None:
+            self._write(*job)
+        else:
+            self.queue.put(job)
+
+    def wait(self):
+        """Block until all queued snapshots are on disk"""
+        if self.queue is not None:
+            self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Flush pending writes and stop the background thread"""
+        if self.queue is not None:
+            self.queue.join()
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("writing a checkpoint failed") from error
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            except Exception as e:  # reported on the training thread by the next save / wait / close
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _write(self, tags, files):
+        first, others = tags[0], tags[1:]
+        for name, state in files.items():
+            atomic_save(state, self.save_dir / f"{first}_{name}")
+            for tag in others:
+                link_or_copy(self.save_dir / f"{first}_{name}", self.save_dir / f"{tag}_{name}")
+        self.prune()
+
+    def prune(self):
+        """Delete numbered checkpoints that the retention policy does not keep"""
+        if self.keep_last <= 0 and self.keep_every <= 0:
+            return
+        checkpoints = {}  # (is_iter, number) -> files
+        for path in self.save_dir.iterdir():
+            match = CHECKPOINT_PATTERN.match(path.name)
+            if match:
+                checkpoints.setdefault((bool(match.group(1)), int(match.group(2))), []).append(path)
+        for is_iter in (False, True):
+            numbers = sorted(number for kind, number in checkpoints if kind == is_iter)
+            keep = set(numbers[-self.keep_last :]) if self.keep_last > 0 else set()
+            if self.keep_every > 0:
+                keep.update(number for number in numbers if number % self.keep_every == 0)
+            for number in numbers:
+                if number not in keep:
+                    for path in checkpoints[(is_iter, number)]:
+                        path.unlink(missing_ok=True)
+
+
+def rng_state():
+    """Return the Python, NumPy and torch (CPU and CUDA) random number generator states"""
+    np_state = np.random.get_state()
+    return {
+        "python": random.getstate(),
+        "numpy": (np_state[0], np_state[1].tolist()) + tuple(np_state[2:]),  # plain lists load with torch.load(weights_only=True)
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    """Restore random number generator states returned by <rng_state>"""
+    random.setstate(tuple(tuple(x) if isinstance(x, list) else x for x in state["python"]))
+    np_state = state["numpy"]
+    np.random.set_state((np_state[0], np.array(np_state[1], dtype=np.uint32)) + tuple(np_state[2:]))
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available() and len(state["cuda"]) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(state["cuda"])
@@ -1,5 +1,7 @@
+import os
 import dominate
 from dominate.tags import meta, h3, table, tr, td, p, a, img, br
+from dominate.util import text
 from pathlib import Path
 
 
@@ -64,11 +66,68 @@ class HTML:
                             br()
                             p(txt)
 
-    def save(self):
-        """save the current content to the HMTL file"""
-        html_file = self.web_dir / "index.html"
-        with open(html_file, "wt") as f:
+    def add_links(self, links):
+        """add a row of text links to the HTML file
+
+        Parameters:
+            links (list) -- a list of (text, href) pairs
+        """
+        with self.doc:
+            with p():
+                for i, (txt, href) in enumerate(links):
+                    if i > 0:
+                        text(" | ")
+                    a(txt, href=href)
+
+    def save(self, filename="index.html"):
+        """save the current content to the HMTL file <web_dir>/<filename>; the file is replaced atomically so that a refreshing browser never sees half a page"""
+        html_file = self.web_dir / filename
+        tmp_file = html_file.with_name(f".{filename}.tmp")
+        with open(tmp_file, "wt") as f:
             f.write(self.doc.render())
+        os.replace(tmp_file, html_file)
+
+
+class EpochIndex:
+    """This class writes the training-results pages: 'index.html' shows the current block of <page_size> epochs (newest first),
+    and every older block is written once to an archive page 'index_<block>.html'.
+
+    Updating the index after an epoch therefore renders at most <page_size> epochs, however long the training runs.
+    Images are expected at <web_dir>/images/epoch<epoch:03d>_<label>.png.
+    """
+
+    def __init__(self, web_dir, title, page_size=50, width=256):
+        """Initialize the EpochIndex class
+
+        Parameters:
+            web_dir (str)    -- the directory that stores the pages and the 'images' folder
+            title (str)      -- the page title
+            page_size (int)  -- the number of epochs per page
+            width (int)      -- the displayed image width
+        """
+        self.web_dir = Path(web_dir)
+        self.title = title
+        self.page_size = page_size
+        self.width = width
+
+    def _write_page(self, filename, first, last, num_blocks, labels, refresh=0):
+        webpage = HTML(self.web_dir, self.title, refresh=refresh)
+        if num_blocks > 0:  # links to the archive pages
+            webpage.add_links([("latest", "index.html")] + [(f"epochs {b * self.page_size + 1}-{(b + 1) * self.page_size}", f"index_{b + 1:03d}.html") for b in range(num_blocks)])
+        for n in range(last, first - 1, -1):
+            webpage.add_header(f"epoch [{n}]")
+            ims = [f"epoch{n:03d}_{label}.png" for label in labels]
+            webpage.add_images(ims, labels, ims, width=self.width)
+        webpage.save(filename)
+
+    def update(self, epoch, labels):
+        """Add <epoch> to the index; <labels> are the visual names of its images"""
+        labels = list(labels)
+        block = (epoch - 1) // self.page_size
+        for b in range(block):  # archive pages of finished blocks (e.g. the previous block, or older ones after --continue_train)
+            if not (self.web_dir / f"index_{b + 1:03d}.html").exists():
+                self._write_page(f"index_{b + 1:03d}.html", b * self.page_size + 1, (b + 1) * self.page_size, block, labels)
+        self._write_page("index.html", block * self.page_size + 1, epoch, block, labels, refresh=1)
 
 
 if __name__ == "__main__":  # we show an example usage here.
@@ -1,4 +1,3 @@
-import random
 import torch
 
 
@@ -7,18 +6,30 @@ class ImagePool:
 
     This buffer enables us to update discriminators using a history of generated images
     rather than the ones produced by the latest generators.
+
+    The images are kept in a single preallocated [pool_size, C, H, W] tensor, either on the training device
+    or in (pinned) CPU memory, and a whole batch is processed with a few gather/scatter operations.
     """
 
-    def __init__(self, pool_size):
+    def __init__(self, pool_size, storage="device"):
         """Initialize the ImagePool class
 
         Parameters:
             pool_size (int) -- the size of image buffer, if pool_size=0, no buffer will be created
+            storage (str)   -- where the buffer lives: device (same device as the queried images) | cpu (pinned memory if CUDA is available)
         """
         self.pool_size = pool_size
-        if self.pool_size > 0:  # create an empty pool
+        self.storage = storage
+        if self.pool_size > 0:  # create an empty pool; the buffer is allocated at the first query
             self.num_imgs = 0
-            self.images = []
+            self.images = None
+
+    def _allocate(self, images):
+        """Allocate the buffer for images shaped like <images>"""
+        if self.storage == "cpu":
+            self.images = torch.empty((self.pool_size,) + images.shape[1:], dtype=images.dtype, pin_memory=torch.cuda.is_available())
+        else:
+            self.images = torch.empty((self.pool_size,) + images.shape[1:], dtype=images.dtype, device=images.device)
 
     def query(self, images):
         """Return an image from the pool.
@@ -34,21 +45,53 @@ class ImagePool:
         """
         if self.pool_size == 0:  # if the buffer size is 0, do nothing
             return images
-        return_images = []
-        for image in images:
-            image = torch.unsqueeze(image.data, 0)
-            if self.num_imgs < self.pool_size:  # if the buffer is not full; keep inserting current images to the buffer
-                self.num_imgs = self.num_imgs + 1
-                self.images.append(image)
-                return_images.append(image)
-            else:
-                p = random.uniform(0, 1)
-                if p > 0.5:  # by 50% chance, the buffer will return a previously stored image, and insert the current image into the buffer
-                    random_id = random.randint(0, self.pool_size - 1)  # randint is inclusive
-                    tmp = self.images[random_id].clone()
-                    self.images[random_id] = image
-                    return_images.append(tmp)
-                else:  # by another 50% chance, the buffer will return the current image
-                    return_images.append(image)
-        return_images = torch.cat(return_images, 0)  # collect all the images and return
+        images = images.detach()
+        if self.images is None or self.images.shape[1:] != images.shape[1:]:
+            if self.images is not None:  # e.g. '--preprocess scale_width' with varying image sizes; restart the history
+                print(f"ImagePool: image size changed from {tuple(self.images.shape[1:])} to {tuple(images.shape[1:])}; resetting the pool")
+            self._allocate(images)
+            self.num_imgs = 0
+        elif self.storage != "cpu" and self.images.device != images.device:  # restored by <load_state_dict> before the first query
+            self.images = self.images.to(images.device)
+
+        n = images.shape[0]
+        return_images = images.clone()
+        # if the buffer is not full; keep inserting current images to the buffer
+        num_fill = min(self.pool_size - self.num_imgs, n)
+        if num_fill > 0:
+            self.images[self.num_imgs : self.num_imgs + num_fill].copy_(images[:num_fill])
+            self.num_imgs += num_fill
+        if num_fill == n:
+            return return_images
+
+        # by 50% chance, the buffer returns a previously stored image and stores the current image instead
+        swap = (torch.rand(n - num_fill) < 0.5).nonzero().flatten() + num_fill
+        if swap.numel() == 0:
+            return return_images
+        slots = torch.randint(0, self.pool_size, (swap.numel(),))
+        if slots.unique().numel() == slots.numel():
+            buffer_slots = slots.to(self.images.device)
+            # index_put needs matching dtypes: the buffer may hold another dtype, e.g. a bf16 pool restored without --amp
+            return_images[swap.to(images.device)] = self.images[buffer_slots].to(images.device, images.dtype, non_blocking=True)
+            self.images[buffer_slots] = images[swap.to(images.device)].to(self.images.device, self.images.dtype)
+        else:  # two images picked the same slot: handle them one by one so that the later one sees the earlier one's insert
+            for i, slot in zip(swap.tolist(), slots.tolist()):
+                return_images[i] = self.images[slot].to(images.device, images.dtype)
+                self.images[slot] = images[i].to(self.images.device, self.images.dtype)
         return return_images
+
+    def state_dict(self):
+        """Return the pool contents so that a resumed run keeps its image history"""
+        if self.pool_size == 0 or self.images is None:
+            return {"num_imgs": 0, "images": None}
+        return {"num_imgs": self.num_imgs, "images": self.images[: self.num_imgs].cpu().clone()}
+
+    def load_state_dict(self, state):
+        """Restore the pool contents saved by <state_dict>"""
+        if self.pool_size == 0 or state["images"] is None:
+            return
+        images = state["images"][: self.pool_size]
+        if self.images is None or self.images.shape[1:] != images.shape[1:]:
+            self._allocate(images)  # on the CPU; moved to the training device by the first <query> if needed
+        self.images[: images.shape[0]].copy_(images)
+        self.num_imgs = images.shape[0]
@@ -0,0 +1,43 @@
+"""This module contains image similarity metrics (PSNR, SSIM) for generator outputs.
+
+Both functions take image batches in the generator output range [-1, 1] and return one value per image,
+so they can compare, e.g., an optimized generator against the fp32 reference.
+"""
+
+import torch
+import torch.nn.functional as F
+
+
+def psnr(x, y, data_range=2.0):
+    """Return the peak signal-to-noise ratio (dB) of each image pair in the batches <x> and <y> (N, C, H, W)"""
+    mse = (x.float() - y.float()).pow(2).flatten(1).mean(1)
+    return 10 * torch.log10(data_range**2 / mse.clamp_min(1e-12))
+
+
+def _gaussian_window(size, sigma, channels, device):
+    coords = torch.arange(size, dtype=torch.float32, device=device) - (size - 1) / 2
+    g = torch.exp(-(coords**2) / (2 * sigma**2))
+    g = g / g.sum()
+    return (g[:, None] * g[None, :]).expand(channels, 1, size, size).contiguous()
+
+
+def ssim(x, y, data_range=2.0, window_size=11, sigma=1.5):
+    """Return the structural similarity of each image pair in the batches <x> and <y> (N, C, H, W).
+
+    Uses the standard 11x11 Gaussian window (sigma 1.5), computed per channel and averaged.
+    """
+    x, y = x.float(), y.float()
+    channels = x.shape[1]
+    window_size = min(window_size, x.shape[2], x.shape[3])
+    window = _gaussian_window(window_size, sigma, channels, x.device)
+    c1, c2 = (0.01 * data_range) ** 2, (0.03 * data_range) ** 2
+
+    def blur(t):
+        return F.conv2d(t, window, groups=channels)
+
+    mu_x, mu_y = blur(x), blur(y)
+    sigma_x = blur(x * x) - mu_x**2
+    sigma_y = blur(y * y) - mu_y**2
+    sigma_xy = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / ((mu_x**2 + mu_y**2 + c1) * (sigma_x + sigma_y + c2))
+    return ssim_map.flatten(1).mean(1)
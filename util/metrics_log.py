@@ -0,0 +1,119 @@
+"""This module implements the buffered training log used by <Visualizer>.
+
+Losses are accumulated every iteration as detached tensors on the training device (no host synchronization),
+and their means are reduced across DDP ranks with a single all_reduce when they are printed. The printed rows are
+kept in memory and written in batches: one line per row to 'loss_log.txt' (human-readable, as before) and one JSON
+object per row to 'loss_log.jsonl'. wandb logging goes through the same buffer, so each flush sends one
+wandb.log call per step.
+
+    columns = read_metrics_log("checkpoints/facades_pix2pix/loss_log.jsonl")
+    plt.plot(columns["total_iters"], columns["G_GAN"])
+"""
+
+import json
+from collections import OrderedDict
+from pathlib import Path
+import torch
+import torch.distributed as dist
+
+
+class MetricsBuffer:
+    """Accumulate losses on the device and write log rows (text, JSONL and wandb) in batches."""
+
+    def __init__(self, device, log_dir=None, flush_every=10, wandb_run=None):
+        """Initialize the MetricsBuffer class
+
+        Parameters:
+            device            -- the device that the loss tensors live on
+            log_dir (str)     -- directory of 'loss_log.txt' and 'loss_log.jsonl'; None on ranks that do not write logs
+            flush_every (int) -- write the pending rows after this many rows (and on <flush>)
+            wandb_run         -- the wandb run that rows are logged to, or None
+        """
+        self.device = device
+        self.log_dir = Path(log_dir) if log_dir is not None else None
+        self.flush_every = max(1, flush_every)
+        self.wandb_run = wandb_run
+        self.sums = OrderedDict()  # loss name -> running sum (device tensor or number)
+        self.count = 0
+        self.lines, self.rows = [], []
+        self.wandb_rows = OrderedDict()  # step -> values, merged per step
+
+    def add(self, losses):
+        """Add the losses of one iteration; tensors stay on the device, so this does not synchronize"""
+        for name, value in losses.items():
+            if isinstance(value, torch.Tensor):
+                value = value.detach().float()
+                if isinstance(self.sums.get(name), torch.Tensor):
+                    self.sums[name].add_(value)
+                else:
+                    self.sums[name] = value + self.sums.get(name, 0.0)  # a new tensor: never an alias of the model's loss
+            else:
+                self.sums[name] = self.sums.get(name, 0.0) + float(value)
+        self.count += 1
+
+    def reduce(self):
+        """Return the mean of every loss since the last call, averaged over all DDP ranks, and reset the sums.
+
+        All ranks must call this at the same iteration: it runs one all_reduce and one device-to-host copy.
+        """
+        if self.count == 0:
+            return OrderedDict()
+        values = torch.stack([torch.as_tensor(v, dtype=torch.float32, device=self.device) for v in self.sums.values()]) / self.count
+        if dist.is_initialized():
+            dist.all_reduce(values)
+            values /= dist.get_world_size()
+        means = OrderedDict(zip(self.sums.keys(), values.tolist()))
+        self.sums, self.count = OrderedDict(), 0
+        return means
+
+    def write(self, line=None, row=None):
+        """Queue a text line for 'loss_log.txt' and/or a row (dict) for 'loss_log.jsonl'"""
+        if self.log_dir is None:
+            return
+        if line is not None:
+            self.lines.append(line)
+        if row is not None:
+            self.rows.append(row)
+        if max(len(self.lines), len(self.rows)) >= self.flush_every:
+            self.flush()
+
+    def log_wandb(self, values, step):
+        """Queue values (numbers or wandb media) for wandb at <step>"""
+        if self.wandb_run is None:
+            return
+        self.wandb_rows.setdefault(step, {}).update(values)
+        if len(self.wandb_rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write all pending rows"""
+        if self.lines:
+            with open(self.log_dir / "loss_log.txt", "a") as log_file:
+                log_file.write("".join(f"{line}\n" for line in self.lines))
+            self.lines = []
+        if self.rows:
+            with open(self.log_dir / "loss_log.jsonl", "a") as log_file:
+                log_file.write("".join(json.dumps(row) + "\n" for row in self.rows))
+            self.rows = []
+        if self.wandb_rows:
+            for step in sorted(self.wandb_rows):  # wandb drops rows whose step is smaller than the last logged one
+                self.wandb_run.log(self.wandb_rows[step], step=step)
+            self.wandb_rows = OrderedDict()
+
+
+def read_metrics_log(path):
+    """Read a 'loss_log.jsonl' file into columns: {name: list of values}, with None where a row lacks the name"""
+    columns = OrderedDict()
+    num_rows = 0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for name in row:
+                if name not in columns:
+                    columns[name] = [None] * num_rows
+            for name, column in columns.items():
+                column.append(row.get(name))
+            num_rows += 1
+    return columns
@@ -0,0 +1,140 @@
+"""This module implements the training-step instrumentation used by train.py (--profile_phases, --profile_trace).
+
+<StepTimer> times named phases of every step (e.g. 'forward', 'backward_D', 'step_G', 'set_input', 'visualizer')
+and keeps the last <window> durations of each phase for rolling percentiles. On CUDA, device phases are timed with
+CUDA events that are only read when a summary is requested, so timing does not add a synchronization per phase;
+host phases (data loading, image and checkpoint I/O) use the wall clock.
+
+<TraceWindow> records a torch.profiler trace for a range of iterations and writes it as a Chrome trace
+(open it in chrome://tracing or https://ui.perfetto.dev); the StepTimer phases show up as named ranges in the trace.
+"""
+
+import contextlib
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+import numpy as np
+import torch
+import torch.distributed as dist
+
+
+class StepTimer:
+    """Time named phases of training steps and keep rolling percentiles; a no-op unless enabled."""
+
+    def __init__(self, device, enabled=False, window=100):
+        """Initialize the StepTimer class
+
+        Parameters:
+            device          -- the training device; CUDA devices are timed with CUDA events
+            enabled (bool)  -- if False, <phase> and <record> do nothing
+            window (int)    -- number of recent durations kept per phase for the percentiles
+        """
+        self.enabled = enabled
+        self.window = window
+        self.use_events = torch.device(device).type == "cuda"
+        self.times = OrderedDict()  # phase name -> deque of durations (ms)
+        self.pending = []  # (name, start event, end event) not read yet
+        self.tracing = False  # set by <TraceWindow>: also mark phases in the torch.profiler trace
+
+    @contextlib.contextmanager
+    def phase(self, name, host=False):
+        """Time the enclosed block as phase <name>.
+
+        Parameters:
+            name (str)   -- phase name; repeated phases in one step are recorded separately
+            host (bool)  -- time with the wall clock even on CUDA (for blocks that wait on the host, e.g. file I/O)
+        """
+        if not self.enabled:
+            yield
+            return
+        with torch.profiler.record_function(name) if self.tracing else contextlib.nullcontext():
+            if self.use_events and not host:
+                start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+                start.record()
+                yield
+                end.record()
+                self.pending.append((name, start, end))
+                if len(self.pending) >= 64 * self.window:  # bound the number of live events if no summary is requested
+                    self._read_events()
+            else:
+                start = time.perf_counter()
+                yield
+                self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Record a duration measured elsewhere (e.g. the data loading time of train.py)"""
+        if self.enabled:
+            self.times.setdefault(name, deque(maxlen=self.window)).append(seconds * 1000)
+
+    def _read_events(self):
+        if self.pending:
+            self.pending[-1][2].synchronize()
+            for name, start, end in self.pending:
+                self.times.setdefault(name, deque(maxlen=self.window)).append(start.elapsed_time(end))
+            self.pending = []
+
+    def summary(self):
+        """Return {phase: {'mean', 'p50', 'p90', 'p99'}} in milliseconds over the recent durations of each phase"""
+        if not self.enabled:
+            return OrderedDict()
+        self._read_events()
+        summary = OrderedDict()
+        for name, times in self.times.items():
+            times = np.array(times)
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            summary[name] = {"mean": float(times.mean()), "p50": float(p50), "p90": float(p90), "p99": float(p99)}
+        return summary
+
+
+class TraceWindow:
+    """Record a torch.profiler trace while total_iters is in [start, end)."""
+
+    def __init__(self, trace_range, trace_dir, timer=None):
+        """Initialize the TraceWindow class
+
+        Parameters:
+            trace_range (str)  -- '<start>:<end>' in total_iters (the unit of --print_freq); '' disables tracing
+            trace_dir (str)    -- directory for the trace files
+            timer (StepTimer)  -- its phases are marked in the trace
+        """
+        self.start, self.end = (int(x) for x in trace_range.split(":")) if trace_range else (0, 0)
+        if trace_range and self.end <= self.start:
+            raise ValueError("--profile_trace needs <start>:<end> with end > start, got %s" % trace_range)
+        self.trace_dir = Path(trace_dir)
+        self.timer = timer
+        self.profiler = None
+        self.done = not trace_range
+
+    def step(self, total_iters):
+        """Start or stop the trace; call at the beginning of every iteration"""
+        if self.done:
+            return
+        if self.profiler is None and self.start <= total_iters < self.end:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self.profiler.start()
+            if self.timer is not None:
+                self.timer.tracing = True
+            print(f"profiler: tracing from total_iters {total_iters}")
+        elif self.profiler is not None and total_iters >= self.end:
+            self.close()
+
+    def close(self):
+        """Stop a running trace and write it to <trace_dir>"""
+        if self.profiler is None:
+            return
+        self.profiler.stop()
+        if self.timer is not None:
+            self.timer.tracing = False
+        rank = dist.get_rank() if dist.is_initialized() else 0
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        trace_path = self.trace_dir / f"trace_{self.start}-{self.end}_rank{rank}.json"
+        self.profiler.export_chrome_trace(str(trace_path))
+        sort_by = "cuda_time_total" if torch.cuda.is_available() else "cpu_time_total"
+        with open(trace_path.with_suffix(".txt"), "w") as f:
+            f.write(self.profiler.key_averages().table(sort_by=sort_by, row_limit=50))
+        print(f"profiler: trace written to {trace_path}")
+        self.profiler = None
+        self.done = True
@@ -2,7 +2,13 @@ import numpy as np
 import sys
 import ntpath
 import time
+import queue
+import threading
+import torch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from . import util, html
+from .metrics_log import MetricsBuffer
 from pathlib import Path
 import wandb
 import os
@@ -37,6 +43,120 @@ def save_images(webpage, visuals, image_path, aspect_ratio=1.0, width=256):
     webpage.add_images(ims, txts, links, width=width)
 
 
+def split_visuals(visuals, index):
+    """Return the visuals of a single sample from a batch.
+
+    Parameters:
+        visuals (OrderedDict) -- an ordered dictionary that stores (name, images (either tensor or numpy) ) pairs
+        index (int)           -- index of the sample in the batch
+
+    Tensors and batched numpy images (N x H x W x C, e.g. the RGB outputs of the colorization model) are sliced along
+    the batch dimension; other numpy images are returned unchanged.
+    """
+    return OrderedDict((label, im[index : index + 1] if isinstance(im, torch.Tensor) or (isinstance(im, np.ndarray) and im.ndim == 4) else im) for label, im in visuals.items())
+
+
+class AsyncImageSaver:
+    """This class saves test results like <save_images>, but encodes the images in background threads.
+
+    The caller only copies the visuals to the CPU; <tensor2im>, PNG encoding and the HTML updates run off the main thread.
+    Images are encoded by a pool of <num_workers> threads, while HTML rows are added by a single thread so that
+    the page keeps the submission order. At most <max_pending> images are queued at once to bound memory.
+    """
+
+    def __init__(self, num_workers=4, max_pending=None):
+        """Initialize the AsyncImageSaver class
+
+        Parameters:
+            num_workers (int) -- the number of threads that encode and write images
+            max_pending (int) -- the maximum number of images waiting to be written; default: 4 * num_workers
+        """
+        self.image_pool = ThreadPoolExecutor(max_workers=num_workers)
+        self.html_pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = threading.BoundedSemaphore(max_pending or 4 * num_workers)
+        self.futures = []
+
+    def _write_image(self, im_data, save_path, aspect_ratio):
+        try:
+            util.save_image(util.tensor2im(im_data), save_path, aspect_ratio=aspect_ratio)
+        finally:
+            self.pending.release()
+
+    @staticmethod
+    def _add_to_page(webpage, name, ims, txts, width):
+        webpage.add_header(name)
+        webpage.add_images(ims, txts, ims, width=width)
+
+    def save_images(self, webpage, visuals, image_path, aspect_ratio=1.0, width=256):
+        """Queue images to be saved to the disk and added to the HTML file (same arguments as <save_images>)."""
+        image_dir = webpage.get_image_dir()
+        name = Path(image_path[0]).stem
+
+        ims, txts = [], []
+        for label, im_data in visuals.items():
+            if isinstance(im_data, torch.Tensor):
+                im_data = im_data.detach().cpu()
+            image_name = f"{name}_{label}.png"
+            self.pending.acquire()
+            self.futures.append(self.image_pool.submit(self._write_image, im_data, image_dir / image_name, aspect_ratio))
+            ims.append(image_name)
+            txts.append(label)
+        self.futures.append(self.html_pool.submit(self._add_to_page, webpage, name, ims, txts, width))
+        self.futures = [f for f in self.futures if not f.done() or f.exception() is not None]
+
+    def close(self):
+        """Wait until all queued images are written; re-raise the first error, if any."""
+        self.image_pool.shutdown(wait=True)
+        self.html_pool.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+
+class BackgroundWriter:
+    """This class runs jobs (e.g. PNG encoding and HTML updates) in one background thread, in submission order.
+
+    At most <max_pending> jobs wait in the queue; <submit> blocks when it is full, which bounds the memory held by queued images.
+    An error in a job is re-raised by the next <submit> or by <close>.
+    """
+
+    def __init__(self, max_pending=4):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args = job
+                fn(*args)
+            except Exception as e:  # reported on the training thread by the next submit / close
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("writing training results failed") from error
+
+    def submit(self, fn, *args):
+        """Queue fn(*args)"""
+        self._raise_error()
+        self.queue.put((fn, args))
+
+    def close(self):
+        """Wait for the queued jobs and stop the thread"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+
+
 class Visualizer:
     """This class includes several functions that can display/save images and print/save logging information.
 
@@ -76,11 +196,22 @@ class Visualizer:
             self.img_dir = self.web_dir / "images"
             print(f"create web directory {self.web_dir}...")
             util.mkdirs([self.web_dir, self.img_dir])
+            self.index = html.EpochIndex(self.web_dir, f"Experiment name = {opt.name}", getattr(opt, "html_page_size", 50), self.win_size)
+            queue_size = getattr(opt, "display_queue_size", 0)
+            self.writer = BackgroundWriter(queue_size) if queue_size > 0 else None  # PNG encoding and index updates off the training thread
         # create a logging file to store training losses
         self.log_name = Path(opt.checkpoints_dir) / opt.name / "loss_log.txt"
         with open(self.log_name, "a") as log_file:
             now = time.strftime("%c")
             log_file.write(f"================ Training Loss ({now}) ================\n")
+        # losses are accumulated on the device; log rows and wandb logs are written in batches (only on the main process)
+        is_main = not dist.is_initialized() or dist.get_rank() == 0
+        self.metrics = MetricsBuffer(
+            getattr(opt, "device", "cpu"),
+            log_dir=self.log_name.parent if is_main else None,
+            flush_every=getattr(opt, "log_flush_freq", 1),
+            wandb_run=self.wandb_run if self.use_wandb else None,
+        )
 
     def reset(self):
         """Reset the self.saved status"""
@@ -101,35 +232,53 @@ class Visualizer:
         if "LOCAL_RANK" in os.environ and dist.is_initialized() and dist.get_rank() != 0:
             return
 
-        if self.use_wandb:
+        save_html = self.use_html and (save_result or not self.saved)  # save images to an HTML file if they haven't been saved.
+        if not self.use_wandb and not save_html:
+            return
+        # copy the first image of each visual to the CPU once; encoding and writing use the copies
+        visuals = OrderedDict((label, image[:1].detach().to("cpu", copy=True) if isinstance(image, torch.Tensor) else image) for label, image in visuals.items())
+
+        if self.use_wandb:  # logged from this thread so that wandb steps stay in order
             ims_dict = {}
             for label, image in visuals.items():
                 image_numpy = util.tensor2im(image)
                 wandb_image = wandb.Image(image_numpy, caption=f"{label} - Step {total_iters}")
                 ims_dict[f"results/{label}"] = wandb_image
-            self.wandb_run.log(ims_dict, step=total_iters)
+            self.metrics.log_wandb(ims_dict, total_iters)
 
-        if self.use_html and (save_result or not self.saved):  # save images to an HTML file if they haven't been saved.
+        if save_html:
             self.saved = True
-            # save images to the disk
-            for label, image in visuals.items():
-                image_numpy = util.tensor2im(image)
-                img_path = self.img_dir / f"epoch{epoch:03d}_{label}.png"
-                util.save_image(image_numpy, img_path)
-
-            # update website
-            webpage = html.HTML(self.web_dir, f"Experiment name = {self.name}", refresh=1)
-            for n in range(epoch, 0, -1):
-                webpage.add_header(f"epoch [{n}]")
-                ims, txts, links = [], [], []
-
-                for label, image in visuals.items():
-                    img_path = f"epoch{n:03d}_{label}.png"
-                    ims.append(img_path)
-                    txts.append(label)
-                    links.append(img_path)
-                webpage.add_images(ims, txts, links, width=self.win_size)
-            webpage.save()
+            if self.writer is not None:
+                self.writer.submit(self._save_results, visuals, epoch)
+            else:
+                self._save_results(visuals, epoch)
+
+    def _save_results(self, visuals, epoch):
+        """Save the images of <epoch> to the disk and add the epoch to the website"""
+        for label, image in visuals.items():
+            image_numpy = util.tensor2im(image)
+            img_path = self.img_dir / f"epoch{epoch:03d}_{label}.png"
+            util.save_image(image_numpy, img_path)
+        self.index.update(epoch, visuals.keys())
+
+    def close(self):
+        """Wait until the queued results are written and write the buffered logs"""
+        if getattr(self, "writer", None) is not None:
+            self.writer.close()
+            self.writer = None
+        self.metrics.flush()
+
+    def add_losses(self, losses):
+        """Accumulate the losses of one iteration (e.g. model.get_current_losses(as_tensors=True)) without synchronizing the device"""
+        self.metrics.add(losses)
+
+    def reduce_losses(self):
+        """Return the mean losses since the last call, averaged over all DDP ranks; must be called on every rank"""
+        return self.metrics.reduce()
+
+    def flush(self):
+        """Write the buffered log rows and wandb logs"""
+        self.metrics.flush()
 
     def plot_current_losses(self, total_iters, losses):
         """Log current losses to wandb
@@ -143,9 +292,38 @@ class Visualizer:
             return
 
         if self.use_wandb:
-            self.wandb_run.log(losses, step=total_iters)
+            self.metrics.log_wandb(losses, total_iters)  # sent with the next flush
+
+    def print_current_timings(self, epoch, iters, timings):
+        """print the rolling step-phase percentiles of --profile_phases on console; also save them to the loss log
 
-    def print_current_losses(self, epoch, iters, losses, t_comp, t_data):
+        Parameters:
+            epoch (int) -- current epoch
+            iters (int) -- current training iteration during this epoch
+            timings (OrderedDict) -- {phase: {'mean', 'p50', 'p90', 'p99'}} in milliseconds (see <StepTimer.summary>)
+        """
+        if not timings:
+            return
+        local_rank = int(os.environ.get("LOCAL_RANK", 0))
+        message = f"[Rank {local_rank}] (epoch: {epoch}, iters: {iters}) phase ms p50/p90/p99"
+        for name, t in timings.items():
+            message += f", {name}: {t['p50']:.1f}/{t['p90']:.1f}/{t['p99']:.1f}"
+        message += "\n"
+        print(message)
+
+        row = {"epoch": epoch, "iters": iters, "time": time.time()}
+        row.update((f"timing/{name}_{k}", v) for name, t in timings.items() for k, v in t.items())
+        self.metrics.write(message, row)
+
+    def plot_current_timings(self, total_iters, timings):
+        """Log the step-phase percentiles to wandb as 'timing/<phase>_p50' etc."""
+        if dist.is_initialized() and dist.get_rank() != 0:
+            return
+
+        if self.use_wandb and timings:
+            self.metrics.log_wandb({f"timing/{name}_{k}": v for name, t in timings.items() for k, v in t.items()}, total_iters)
+
+    def print_current_losses(self, epoch, iters, losses, t_comp, t_data, total_iters=None):
         """print current losses on console; also save the losses to the disk
 
         Parameters:
@@ -154,6 +332,9 @@ class Visualizer:
             losses (OrderedDict) -- training losses stored in the format of (name, float) pairs
             t_comp (float) -- computational time per data point (normalized by batch_size)
             t_data (float) -- data loading time per data point (normalized by batch_size)
+            total_iters (int) -- total number of training iterations, stored in loss_log.jsonl
+
+        The message is added to the buffered loss_log.txt / loss_log.jsonl, which are written every --log_flush_freq rows.
         """
         local_rank = int(os.environ.get("LOCAL_RANK", 0))
         message = f"[Rank {local_rank}] (epoch: {epoch}, iters: {iters}, time: {t_comp:.3f}, data: {t_data:.3f}) "
@@ -162,7 +343,7 @@ class Visualizer:
         message += "\n"
         print(message)  # print the message on ALL ranks with rank info
 
-        # Only save to log file on main process (rank 0)
-        if local_rank == 0:
-            with open(self.log_name, "a") as log_file:
-                log_file.write(f"{message}\n")  # save the message
+        # only the main process (rank 0) has a log directory; other ranks ignore the rows
+        row = {"epoch": epoch, "iters": iters, "total_iters": total_iters, "time": time.time(), "t_comp": t_comp, "t_data": t_data}
+        row.update(losses)
+        self.metrics.write(message, row)
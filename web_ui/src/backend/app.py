@@ -1,17 +1,69 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import io
 import base64
+import json
 import os
+import threading
 from pathlib import Path
 from pix2pix_inference import Pix2PixInference
+from batch_scheduler import BatchScheduler
+from model_cache import ModelCache
 
 app = Flask(__name__, static_folder='../build', static_url_path='')
-CORS(app)  # React 앱에서 API 호출 허용
+CORS(app, expose_headers=['X-Model-Info'])  # React 앱에서 API 호출 허용
+
+# 모델별 요청 배칭 스케줄러 (캐시 키 -> BatchScheduler)
+# RESTORE_MAX_BATCH_SIZE=1 이면 배칭 없이 요청마다 바로 추론
+batch_schedulers = {}
+MAX_BATCH_SIZE = int(os.environ.get('RESTORE_MAX_BATCH_SIZE', 4))
+MAX_WAIT_MS = float(os.environ.get('RESTORE_MAX_WAIT_MS', 10))
+batch_schedulers_lock = threading.Lock()
+
+
+def get_batch_scheduler(cache_key, model):
+    """캐시 키에 해당하는 배칭 스케줄러 반환 (없으면 생성, 배칭 비활성화 시 None)
+
+    model이 이미 캐시에서 제거된 경우에도 None을 반환합니다 (요청은 model.infer로 직접 처리).
+    캐시 확인과 등록을 batch_schedulers_lock 안에서 하므로, 제거 콜백(on_model_evicted)은
+    등록이 끝난 뒤에 실행되어 새로 만든 스케줄러를 종료합니다.
+    """
+    if MAX_BATCH_SIZE <= 1:
+        return None
+    with batch_schedulers_lock:
+        if model_cache.peek(cache_key) is not model:
+            # get_or_load 이후 다른 요청의 로드로 제거된 모델: 스케줄러를 만들면 종료되지 않고 모델 메모리가 남음
+            return None
+        scheduler = batch_schedulers.get(cache_key)
+        if scheduler is not None and scheduler.model is not model:
+            # 캐시에서 제거 후 다시 로드된 모델: 이전 스케줄러는 종료
+            scheduler.close()
+            scheduler = None
+        if scheduler is None:
+            scheduler = BatchScheduler(model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
+            batch_schedulers[cache_key] = scheduler
+        return scheduler
+
+
+def on_model_evicted(cache_key, model):
+    """캐시에서 제거된 모델의 배칭 스케줄러 종료"""
+    with batch_schedulers_lock:
+        scheduler = batch_schedulers.pop(cache_key, None)
+    if scheduler is not None:
+        scheduler.close()
+
+
+# 모델 캐시 (한 번 로드한 모델을 재사용, LRU로 개수/메모리 제한)
+# MODEL_CACHE_MAX_ENTRIES / MODEL_CACHE_MAX_MB 가 0이면 해당 제한 없음
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get('MODEL_CACHE_MAX_ENTRIES', 4))
+MODEL_CACHE_MAX_MB = float(os.environ.get('MODEL_CACHE_MAX_MB', 0))
+model_cache = ModelCache(
+    max_entries=MODEL_CACHE_MAX_ENTRIES,
+    max_bytes=int(MODEL_CACHE_MAX_MB * 1024 * 1024),
+    on_evict=on_model_evicted
+)
 
-# 모델 캐시 (한 번 로드한 모델을 재사용)
-model_cache = {}
 
 # React 앱 서빙
 @app.route('/')
@@ -31,6 +83,98 @@ def serve_static_files(path):
         # SPA를 위해 모든 경로를 index.html로 리다이렉트
         return send_from_directory(app.static_folder, 'index.html')
 
+def parse_bool(value):
+    """쿼리 문자열/폼 값('true', '1', 'false' 등)을 bool로 변환"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def get_restore_model(params):
+    """요청 파라미터에 해당하는 모델을 캐시에서 가져오거나 로드
+
+    Args:
+        params: 모델 설정 파라미터 (JSON 객체 또는 쿼리 문자열/폼 필드)
+
+    Returns:
+        (cache_key, model) 튜플
+    """
+    # 모델 설정 파라미터
+    model_name = params.get('model_name', 'portrait_retouch_reverse')
+    model_type = params.get('model_type', 'test')
+    direction = params.get('direction', 'AtoB')
+    epoch = params.get('epoch', 'latest')
+    netG = params.get('netG', 'unet_256')
+    norm = params.get('norm', 'batch')
+    load_size = int(params.get('load_size', 1024))
+    crop_size = int(params.get('crop_size', 1024))
+    preprocess = params.get('preprocess', 'resize_and_crop')
+    no_dropout = parse_bool(params.get('no_dropout', True))
+    tile_size = int(params.get('tile_size', 0))
+    tile_overlap = int(params.get('tile_overlap', 64))
+    optimize_inference = parse_bool(params.get('optimize_inference', False))
+    # export.py로 만든 아티팩트 파일 이름 (checkpoints/<model_name>/ 안의 파일만 허용, 지정 시 체크포인트 대신 사용)
+    artifact = params.get('artifact') or None
+    if artifact:
+        if Path(artifact).name != artifact or Path(model_name).name != model_name:
+            raise ValueError(f"잘못된 아티팩트 이름입니다: {artifact}")
+        artifact = str(Path('checkpoints') / model_name / artifact)
+    
+    # 모델 캐시 키 생성
+    cache_key = f"artifact_{artifact}" if artifact else f"{model_name}_{model_type}_{direction}_{epoch}"
+    if tile_size > 0:
+        cache_key += f"_tile{tile_size}_{tile_overlap}"
+    if optimize_inference and not artifact:
+        cache_key += "_optimized"
+    
+    # 모델 로드 (캐시 사용, 같은 키의 동시 로드는 한 번만 수행)
+    def load():
+        print(f"새 모델 로드: {cache_key}")
+        model = Pix2PixInference(
+            model_name=model_name,
+            model_type=model_type,
+            direction=direction,
+            epoch=epoch,
+            netG=netG,
+            norm=norm,
+            load_size=load_size,
+            crop_size=crop_size,
+            preprocess=preprocess,
+            no_dropout=no_dropout,
+            tile_size=tile_size,
+            tile_overlap=tile_overlap,
+            artifact_path=artifact,
+            optimize_inference=optimize_inference
+        )
+        model.load_model()
+        return model
+    
+    return cache_key, model_cache.get_or_load(cache_key, load)
+
+
+def run_restore(cache_key, model, input_image):
+    """이미지 추론 수행 후 RGB PIL Image 반환 (동시 요청은 스케줄러에서 하나의 배치로 묶임)"""
+    scheduler = get_batch_scheduler(cache_key, model)
+    
+    print(f"[INFO] 이미지 추론 시작: {input_image.size}, mode: {input_image.mode}")
+    try:
+        if scheduler is not None:
+            restored_image = scheduler.submit(input_image)
+        else:
+            restored_image = model.infer(input_image)
+        print(f"[INFO] 이미지 추론 완료: {restored_image.size}, mode: {restored_image.mode}")
+    except Exception as e:
+        import traceback
+        print(f"[ERROR] 추론 중 오류: {traceback.format_exc()}")
+        raise
+    
+    # RGB 모드로 변환 (RGBA나 다른 모드일 경우)
+    if restored_image.mode != 'RGB':
+        print(f"[WARNING] 이미지 모드 변환: {restored_image.mode} -> RGB")
+        restored_image = restored_image.convert('RGB')
+    return restored_image
+
+
 @app.route('/api/restore', methods=['POST'])
 def restore_image():
     try:
@@ -39,18 +183,6 @@ def restore_image():
         image_data = data.get('image')
         params = data.get('params', {})
         
-        # 모델 설정 파라미터
-        model_name = params.get('model_name', 'portrait_retouch_reverse')
-        model_type = params.get('model_type', 'test')
-        direction = params.get('direction', 'AtoB')
-        epoch = params.get('epoch', 'latest')
-        netG = params.get('netG', 'unet_256')
-        norm = params.get('norm', 'batch')
-        load_size = params.get('load_size', 1024)
-        crop_size = params.get('crop_size', 1024)
-        preprocess = params.get('preprocess', 'resize_and_crop')
-        no_dropout = params.get('no_dropout', True)
-        
         if not image_data:
             return jsonify({'error': '이미지가 없습니다'}), 400
         
@@ -62,45 +194,11 @@ def restore_image():
         image_bytes = base64.b64decode(image_data)
         input_image = Image.open(io.BytesIO(image_bytes))
         
-        # 모델 캐시 키 생성
-        cache_key = f"{model_name}_{model_type}_{direction}_{epoch}"
-        
-        # 모델 로드 (캐시 사용)
-        if cache_key not in model_cache:
-            print(f"새 모델 로드: {cache_key}")
-            model = Pix2PixInference(
-                model_name=model_name,
-                model_type=model_type,
-                direction=direction,
-                epoch=epoch,
-                netG=netG,
-                norm=norm,
-                load_size=load_size,
-                crop_size=crop_size,
-                preprocess=preprocess,
-                no_dropout=no_dropout
-            )
-            model.load_model()
-            model_cache[cache_key] = model
-        else:
-            model = model_cache[cache_key]
-        
-        # 이미지 추론 수행
-        print(f"[INFO] 이미지 추론 시작: {input_image.size}, mode: {input_image.mode}")
-        try:
-            restored_image = model.infer(input_image)
-            print(f"[INFO] 이미지 추론 완료: {restored_image.size}, mode: {restored_image.mode}")
-        except Exception as e:
-            import traceback
-            print(f"[ERROR] 추론 중 오류: {traceback.format_exc()}")
-            raise
+        cache_key, model = get_restore_model(params)
+        restored_image = run_restore(cache_key, model, input_image)
         
         # 결과 이미지를 base64로 인코딩
         buffered = io.BytesIO()
-        # RGB 모드로 변환 (RGBA나 다른 모드일 경우)
-        if restored_image.mode != 'RGB':
-            print(f"[WARNING] 이미지 모드 변환: {restored_image.mode} -> RGB")
-            restored_image = restored_image.convert('RGB')
         restored_image.save(buffered, format="PNG")
         img_str = base64.b64encode(buffered.getvalue()).decode()
         print(f"[INFO] 이미지 인코딩 완료: {len(img_str)} bytes")
@@ -119,6 +217,74 @@ def restore_image():
         print(f"오류 발생: {error_trace}")
         return jsonify({'error': f'이미지 복원 중 오류 발생: {str(e)}'}), 500
 
+# 바이너리 응답 포맷: format 파라미터 -> (PIL 포맷, MIME 타입)
+BINARY_OUTPUT_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+@app.route('/api/restore/binary', methods=['POST'])
+def restore_image_binary():
+    """base64/JSON 없이 이미지 바이트를 주고받는 복원 API
+
+    입력:
+        - multipart/form-data 의 'image' 파일 필드 (다른 폼 필드는 모델 파라미터로 사용), 또는
+        - 요청 본문 전체가 이미지 바이트 (Content-Type: image/*)
+        모델 파라미터(model_name, epoch 등)는 쿼리 문자열로도 전달할 수 있습니다.
+        format: png(기본) | webp | jpeg, quality: 손실 포맷의 품질 (1~100, 기본 90)
+
+    출력:
+        이미지 바이트 (Content-Type은 format에 따름), 모델 정보는 X-Model-Info 헤더 (JSON)
+    """
+    try:
+        params = request.args.to_dict()
+        if request.files:
+            params.update(request.form.to_dict())
+            upload = request.files.get('image')
+            if upload is None:
+                return jsonify({'error': "multipart 요청에 'image' 필드가 없습니다"}), 400
+            image_bytes = upload.read()
+        else:
+            image_bytes = request.get_data()
+        
+        if not image_bytes:
+            return jsonify({'error': '이미지가 없습니다'}), 400
+        
+        output_format = params.get('format', 'png').lower()
+        if output_format not in BINARY_OUTPUT_FORMATS:
+            return jsonify({'error': f"지원하지 않는 출력 포맷입니다: {output_format}. 사용 가능한 포맷: {list(BINARY_OUTPUT_FORMATS.keys())}"}), 400
+        pil_format, mimetype = BINARY_OUTPUT_FORMATS[output_format]
+        quality = min(max(int(params.get('quality', 90)), 1), 100)
+        
+        try:
+            input_image = Image.open(io.BytesIO(image_bytes))
+            input_image.load()  # 손상된 이미지는 추론 전에 여기서 오류 발생
+        except (UnidentifiedImageError, OSError) as e:
+            return jsonify({'error': f'이미지를 읽을 수 없습니다: {str(e)}'}), 400
+        
+        cache_key, model = get_restore_model(params)
+        restored_image = run_restore(cache_key, model, input_image)
+        
+        buffered = io.BytesIO()
+        if pil_format == 'PNG':
+            restored_image.save(buffered, format=pil_format)
+        else:
+            restored_image.save(buffered, format=pil_format, quality=quality)
+        
+        response = Response(buffered.getvalue(), mimetype=mimetype)
+        response.headers['X-Model-Info'] = json.dumps(model.get_model_info())
+        return response
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"오류 발생: {error_trace}")
+        return jsonify({'error': f'이미지 복원 중 오류 발생: {str(e)}'}), 500
+
 @app.route('/api/models', methods=['GET'])
 def get_available_models():
     """사용 가능한 체크포인트 목록 반환"""
@@ -240,10 +406,14 @@ def get_available_models():
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    with batch_schedulers_lock:
+        schedulers = dict(batch_schedulers)
     return jsonify({
         'status': 'ok',
-        'loaded_models': list(model_cache.keys())
+        'loaded_models': model_cache.keys(),
+        'model_cache': model_cache.stats(),
+        'batching': {key: scheduler.stats() for key, scheduler in schedulers.items()}
     })
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
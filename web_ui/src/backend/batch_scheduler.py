@@ -0,0 +1,124 @@
+"""
+동시 요청을 모아서 한 번의 forward로 처리하는 마이크로 배칭 스케줄러
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    """캐시된 모델 하나에 대한 요청 배칭 큐
+
+    요청 스레드는 submit()으로 이미지를 넣고 결과를 기다립니다.
+    백그라운드 워커는 첫 요청이 도착한 뒤 최대 max_wait_ms 동안(또는 max_batch_size개가 찰 때까지)
+    요청을 모아 model.infer_batch()를 한 번 호출하고, 결과를 각 요청에 돌려줍니다.
+    배치 추론이 실패하면 요청을 한 장씩 다시 처리하므로, 실패는 원인이 된 요청에만 전달됩니다.
+    같은 크기로 전처리된 입력은 infer_batch 안에서 하나의 netG forward로 묶입니다.
+    """
+
+    def __init__(self, model, max_batch_size=4, max_wait_ms=10):
+        """
+        Args:
+            model: infer_batch(images)를 제공하는 추론 객체 (예: Pix2PixInference)
+            max_batch_size: 한 번에 묶을 최대 요청 수
+            max_wait_ms: 첫 요청 이후 추가 요청을 기다리는 최대 시간 (밀리초)
+        """
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        # 통계 (/api/health에서 확인용)
+        self.num_requests = 0
+        self.num_batches = 0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, image, timeout=None):
+        """이미지 한 장을 큐에 넣고 추론 결과(PIL Image)를 반환
+
+        Args:
+            image: 입력 PIL Image
+            timeout: 결과를 기다리는 최대 시간 (초, None이면 무제한)
+        """
+        future = Future()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put((image, future))
+        if closed:
+            # 모델이 캐시에서 제거되는 중: 배칭 없이 바로 추론
+            return self.model.infer_batch([image])[0]
+        return future.result(timeout=timeout)
+
+    def close(self):
+        """워커 스레드 종료 (남은 요청은 처리 후 종료)"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def stats(self):
+        """배칭 통계 반환"""
+        return {
+            'requests': self.num_requests,
+            'batches': self.num_batches,
+            'avg_batch_size': (self.num_requests / self.num_batches) if self.num_batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'pending': self._queue.qsize(),
+        }
+
+    def _collect(self, first):
+        """첫 요청 이후 max_wait 동안 추가 요청을 모음"""
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:  # close() 신호
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, stop = self._collect(item)
+
+            # 이미 취소된 요청은 건너뜀
+            batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+            if stop:
+                break
+
+    def _process(self, batch):
+        images = [image for image, _ in batch]
+        try:
+            results = self.model.infer_batch(images)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # 손상된 이미지 등 한 요청의 오류가 같은 배치의 다른 요청을 실패시키지 않도록 한 장씩 다시 처리
+            for item in batch:
+                self._process([item])
+            return
+        self.num_requests += len(batch)
+        self.num_batches += 1
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
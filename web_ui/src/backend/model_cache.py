@@ -0,0 +1,172 @@
+"""
+메모리 한도를 가진 LRU 모델 캐시
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def model_memory_bytes(model):
+    """모델이 차지하는 파라미터/버퍼 바이트 수 계산
+
+    memory_bytes()를 제공하는 객체(예: Pix2PixInference)는 그 값을 사용하고,
+    torch.nn.Module은 parameters()와 buffers()를 직접 합산합니다.
+    """
+    if hasattr(model, 'memory_bytes'):
+        return int(model.memory_bytes())
+    if hasattr(model, 'parameters') and hasattr(model, 'buffers'):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    return 0
+
+
+class ModelCache:
+    """최대 개수/최대 바이트 제한이 있는 LRU 캐시
+
+    - 가장 오래 사용되지 않은 모델부터 제거합니다 (방금 로드한 모델은 제거하지 않음).
+    - 같은 키에 대한 동시 요청은 한 번만 load 하고 나머지는 그 결과를 기다립니다 (single-flight).
+    - 키별 hit/miss/load 시간 통계를 유지합니다 (캐시에서 제거된 뒤에도 유지).
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, on_evict=None, size_fn=model_memory_bytes):
+        """
+        Args:
+            max_entries: 최대 모델 수 (None 또는 0이면 무제한)
+            max_bytes: 최대 메모리 (바이트, None 또는 0이면 무제한)
+            on_evict: 모델이 캐시에서 제거될 때 호출되는 콜백 on_evict(key, model)
+            size_fn: 모델 메모리 크기 계산 함수
+        """
+        self.max_entries = max_entries or None
+        self.max_bytes = max_bytes or None
+        self.on_evict = on_evict
+        self.size_fn = size_fn
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (model, bytes)
+        self._loading = {}  # key -> Future (로드 중인 키)
+        self._stats = {}
+        self.total_bytes = 0
+
+    def _key_stats(self, key):
+        if key not in self._stats:
+            self._stats[key] = {'hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'evictions': 0, 'last_load_time': 0.0, 'total_load_time': 0.0, 'bytes': 0}
+        return self._stats[key]
+
+    def get_or_load(self, key, loader):
+        """캐시된 모델을 반환하거나, 없으면 loader()로 로드해서 캐시에 저장
+
+        Args:
+            key: 캐시 키
+            loader: 인자 없이 호출하면 로드된 모델을 반환하는 함수
+
+        Returns:
+            캐시된 모델
+        """
+        with self._lock:
+            stats = self._key_stats(key)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                stats['hits'] += 1
+                return self._entries[key][0]
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = Future()
+                self._loading[key] = pending
+                stats['misses'] += 1
+            else:
+                stats['hits'] += 1
+
+        if not owner:
+            # 다른 요청이 이미 로드 중: 결과만 기다림
+            return pending.result()
+
+        start_time = time.perf_counter()
+        try:
+            model = loader()
+            size = self.size_fn(model)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(key, None)
+                stats['load_errors'] += 1
+            pending.set_exception(e)
+            raise
+        load_time = time.perf_counter() - start_time
+
+        with self._lock:
+            self._entries[key] = (model, size)
+            self.total_bytes += size
+            self._loading.pop(key, None)
+            stats['loads'] += 1
+            stats['last_load_time'] = load_time
+            stats['total_load_time'] += load_time
+            stats['bytes'] = size
+            evicted = self._evict_locked()
+        pending.set_result(model)
+
+        self._notify_evicted(evicted)
+        return model
+
+    def _evict_locked(self):
+        """한도를 넘으면 LRU 순서로 제거 (lock을 잡은 상태에서 호출)"""
+        evicted = []
+        while len(self._entries) > 1 and ((self.max_entries is not None and len(self._entries) > self.max_entries) or (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            key, (model, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self._stats[key]['evictions'] += 1
+            evicted.append((key, model))
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        for key, model in evicted:
+            print(f"[INFO] 모델 캐시에서 제거: {key}")
+            if self.on_evict is not None:
+                self.on_evict(key, model)
+
+    def evict(self, key):
+        """특정 키를 캐시에서 제거"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            model, size = self._entries.pop(key)
+            self.total_bytes -= size
+            self._stats[key]['evictions'] += 1
+        self._notify_evicted([(key, model)])
+        return True
+
+    def peek(self, key):
+        """캐시에 있는 모델을 반환 (없으면 None, LRU 순서와 통계는 바꾸지 않음)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def keys(self):
+        """현재 캐시에 있는 키 목록 (오래된 순)"""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """캐시 전체 및 키별 통계 반환"""
+        with self._lock:
+            models = {}
+            for key, stats in self._stats.items():
+                entry = dict(stats)
+                entry['resident'] = key in self._entries
+                entry['loading'] = key in self._loading
+                models[key] = entry
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'models': models,
+            }
@@ -4,16 +4,18 @@
 import sys
 import os
 from pathlib import Path
+from types import SimpleNamespace
 
 # 프로젝트 루트를 Python 경로에 추가
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
 import torch
-import numpy as np
 from PIL import Image
 from options.test_options import TestOptions
 from models import create_model
+from models.inference import load_generator_artifact, read_artifact_metadata
+from models.networks import TiledGenerator
 from data.base_dataset import get_transform
 from util.util import tensor2im
 
@@ -30,7 +32,11 @@ class Pix2PixInference:
                  load_size=1024,
                  crop_size=1024,
                  preprocess='resize_and_crop',
-                 no_dropout=True):
+                 no_dropout=True,
+                 tile_size=0,
+                 tile_overlap=64,
+                 artifact_path=None,
+                 optimize_inference=False):
         """
         Args:
             model_name: 체크포인트 이름 (예: 'portrait_retouch_reverse')
@@ -43,6 +49,13 @@ class Pix2PixInference:
             crop_size: 이미지 크롭 크기
             preprocess: 전처리 방법
             no_dropout: 드롭아웃 비활성화 여부
+            tile_size: 0보다 크면 이 크기의 타일 단위로 추론 (고해상도 입력용, preprocess='none'과 함께 사용)
+            tile_overlap: 인접 타일 간 겹치는 픽셀 수 (경계는 feathering으로 블렌딩)
+            artifact_path: export.py 또는 quantize.py로 만든 아티팩트 경로 (*.torchscript.pt 또는 *.pt2).
+                지정하면 create_model과 옵션 파싱 없이 아티팩트를 바로 로드하고,
+                netG/norm/preprocess/load_size/crop_size는 아티팩트 메타데이터 값을 사용
+            optimize_inference: BatchNorm을 conv에 접어 넣고 Dropout/Identity 레이어를 제거한 netG 사용
+                (원본과 수치 검증 후 적용, eval 모드 전용)
         """
         self.model_name = model_name
         self.model_type = model_type
@@ -54,8 +67,15 @@ class Pix2PixInference:
         self.crop_size = crop_size
         self.preprocess = preprocess
         self.no_dropout = no_dropout
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.artifact_path = artifact_path
+        self.optimize_inference = optimize_inference
         
         self.model = None
+        self.generator = None  # 추론에 사용하는 netG (체크포인트 모델의 netG 또는 아티팩트)
+        self.metadata = None  # 아티팩트 메타데이터
+        self.opt = None
         self.device = None
         self.transform = None
         
@@ -86,7 +106,11 @@ class Pix2PixInference:
                 '--batch_size', '1',
                 '--num_threads', '0',
                 '--eval',  # eval 모드 활성화 (test.py와 동일)
+                '--tile_size', str(self.tile_size),  # 0보다 크면 model.setup에서 netG를 TiledGenerator로 감쌈
+                '--tile_overlap', str(self.tile_overlap),
             ]
+            if self.optimize_inference:
+                sys.argv.append('--optimize_inference')  # model.setup에서 BN folding 후 원본과 비교 검증
             
             # 옵션 객체 생성
             test_options = TestOptions()
@@ -108,13 +132,46 @@ class Pix2PixInference:
         
         return opt
     
+    def _load_artifact(self):
+        """export.py/quantize.py로 만든 아티팩트 로드 (create_model, 옵션 파싱 생략)"""
+        artifact_path = Path(self.artifact_path)
+        if not artifact_path.is_absolute():
+            artifact_path = PROJECT_ROOT / artifact_path
+        if not artifact_path.exists():
+            raise FileNotFoundError(f"아티팩트 파일을 찾을 수 없습니다: {artifact_path}")
+        
+        # int8 양자화 아티팩트는 CPU 전용
+        quantized = bool(read_artifact_metadata(artifact_path).get("quantization"))
+        self.device = torch.device("cuda:0" if torch.cuda.is_available() and not quantized else "cpu")
+        generator, metadata = load_generator_artifact(artifact_path, self.device)
+        self.metadata = metadata
+        
+        # 정규화 모드는 export 시점에 고정되어 있으므로 eval()을 호출하지 않음
+        if self.tile_size > 0:
+            generator = TiledGenerator(generator, self.tile_size, self.tile_overlap, stride=metadata.get("stride", 1))
+        self.generator = generator
+        
+        # get_transform에 필요한 전처리 옵션만 메타데이터에서 구성
+        self.preprocess = metadata.get("preprocess", self.preprocess)
+        self.load_size = metadata.get("load_size", self.load_size)
+        self.crop_size = metadata.get("crop_size", self.crop_size)
+        self.opt = SimpleNamespace(preprocess=self.preprocess, load_size=self.load_size, crop_size=self.crop_size, no_flip=True)
+        self.transform = get_transform(self.opt, grayscale=(metadata.get("input_nc", 3) == 1))
+        
+        print(f"아티팩트 로드 완료: {artifact_path} (format: {metadata.get('format')}, device: {self.device}, eval: {metadata.get('eval')})")
+    
     def load_model(self):
         """모델 로드"""
-        if self.model is not None:
+        if self.generator is not None:
             return  # 이미 로드됨
+        
+        if self.artifact_path:
+            self._load_artifact()
+            return
             
         try:
             opt = self._create_options()
+            self.opt = opt
             self.device = opt.device
             
             # 체크포인트 디렉토리를 절대 경로로 변환
@@ -182,6 +239,7 @@ class Pix2PixInference:
             # 체크포인트가 실제로 로드되었는지 확인
             if not hasattr(self.model, 'netG') or self.model.netG is None:
                 raise RuntimeError("모델이 제대로 로드되지 않았습니다.")
+            self.generator = self.model.netG
             
             # eval 모드 설정 (opt.eval이 True이면 이미 설정됨)
             if opt.eval:
@@ -210,7 +268,7 @@ class Pix2PixInference:
         if image.mode != 'RGB':
             image = image.convert('RGB')
         
-        # 변환 적용
+        # 변환 적용 (load_model에서 한 번 만든 transform 재사용)
         tensor = self.transform(image)
         
         # 배치 차원 추가 (1, C, H, W)
@@ -219,53 +277,75 @@ class Pix2PixInference:
         return tensor.to(self.device)
     
     def postprocess_image(self, tensor: torch.Tensor) -> Image.Image:
-        """모델 출력 Tensor를 PIL Image로 변환
+        """모델 출력 Tensor를 PIL Image로 변환 (util.tensor2im과 동일한 스케일링)
         
         Args:
             tensor: 모델 출력 텐서 (배치 차원 포함 가능)
         """
-        # 디버깅: 텐서 정보 출력
-        print(f"[DEBUG] postprocess_image - tensor shape: {tensor.shape}, dtype: {tensor.dtype}")
-        
-        # 텐서가 Variable이나 다른 래퍼에 감싸져 있을 수 있음
-        if hasattr(tensor, 'data'):
-            tensor = tensor.data
-        if hasattr(tensor, 'cpu'):
-            tensor = tensor.cpu()
-        if hasattr(tensor, 'float'):
-            tensor = tensor.float()
+        tensor = tensor.detach()
         
         # 배치 차원이 있으면 첫 번째 배치만 사용
-        if len(tensor.shape) == 4:
+        if tensor.dim() == 4:
             tensor = tensor[0]
         
-        print(f"[DEBUG] postprocess_image - processed tensor shape: {tensor.shape}")
-        print(f"[DEBUG] postprocess_image - tensor min: {tensor.min().item():.4f}, max: {tensor.max().item():.4f}, mean: {tensor.mean().item():.4f}")
-        
-        # (C, H, W) -> (H, W, C)로 transpose
-        if tensor.shape[0] == 1:  # grayscale to RGB
+        # grayscale to RGB
+        if tensor.shape[0] == 1:
             tensor = tensor.repeat(3, 1, 1)
         
-        image_numpy = tensor.numpy()
-        image_numpy = np.transpose(image_numpy, (1, 2, 0))
+        # [-1, 1] 범위를 [0, 255]로 변환한 뒤 (C, H, W) -> (H, W, C)
+        tensor = ((tensor.float() + 1.0) / 2.0 * 255.0).clamp_(0, 255)
+        image_numpy = tensor.permute(1, 2, 0).to(torch.uint8).cpu().numpy()
         
-        # [-1, 1] 범위를 [0, 255]로 변환
-        image_numpy = (image_numpy + 1.0) / 2.0 * 255.0
-        image_numpy = np.clip(image_numpy, 0, 255).astype(np.uint8)
+        return Image.fromarray(image_numpy, mode='RGB')
+    
+    def get_generator(self) -> torch.nn.Module:
+        """추론에 사용할 generator 반환 (DDP/torch.compile 래퍼 제거 없이 그대로 사용)"""
+        if self.generator is None:
+            self.load_model()
+        return self.generator
+    
+    def infer_tensor(self, batch: torch.Tensor) -> torch.Tensor:
+        """전처리된 (N, C, H, W) 텐서에 generator를 직접 실행
         
-        print(f"[DEBUG] postprocess_image - image_numpy shape: {image_numpy.shape}, dtype: {image_numpy.dtype}")
-        print(f"[DEBUG] postprocess_image - image_numpy min: {image_numpy.min()}, max: {image_numpy.max()}, mean: {image_numpy.mean():.2f}")
+        옵션 파서, 데이터셋, 임시 파일을 거치지 않고 netG만 호출합니다.
+        """
+        netG = self.get_generator()
+        with torch.inference_mode():
+            return netG(batch.to(self.device))
+    
+    def infer_batch(self, images) -> list:
+        """여러 PIL Image를 한 번에 추론
         
-        # PIL Image로 변환
-        image_pil = Image.fromarray(image_numpy, mode='RGB')
+        같은 크기로 전처리된 이미지끼리 묶어서 하나의 forward로 실행하고,
+        입력 순서대로 결과를 돌려줍니다.
         
-        print(f"[DEBUG] postprocess_image - PIL Image size: {image_pil.size}, mode: {image_pil.mode}")
+        Args:
+            images: 입력 PIL Image 리스트
+            
+        Returns:
+            변환된 PIL Image 리스트
+        """
+        if self.generator is None:
+            self.load_model()
+        
+        tensors = [self.preprocess_image(image) for image in images]
+        
+        # 전처리 후 크기가 같은 입력끼리 그룹화
+        groups = {}
+        for i, tensor in enumerate(tensors):
+            groups.setdefault(tuple(tensor.shape[1:]), []).append(i)
         
-        return image_pil
+        outputs = [None] * len(tensors)
+        for indices in groups.values():
+            batch = torch.cat([tensors[i] for i in indices], 0)
+            result = self.infer_tensor(batch)
+            for j, i in enumerate(indices):
+                outputs[i] = self.postprocess_image(result[j])
+        return outputs
     
     def infer(self, image: Image.Image) -> Image.Image:
         """
-        이미지에 모델 추론 수행 (test.py와 동일한 방식)
+        이미지에 모델 추론 수행 (메모리 내 처리, 디스크 I/O 없음)
         
         Args:
             image: 입력 PIL Image
@@ -273,133 +353,24 @@ class Pix2PixInference:
         Returns:
             변환된 PIL Image
         """
-        if self.model is None:
-            self.load_model()
-        
-        # 임시 디렉토리에 이미지 저장 (test.py가 데이터셋에서 읽을 수 있도록)
-        import tempfile
-        import uuid
-        
-        temp_dir = PROJECT_ROOT / 'test_images' / 'web_ui_temp'
-        temp_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 고유한 파일명 생성
-        temp_image_name = f"web_ui_{uuid.uuid4().hex[:8]}.png"
-        temp_image_path = temp_dir / temp_image_name
-        
-        # 이미지 저장
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        image.save(temp_image_path)
-        
-        try:
-            # test.py와 동일한 방식으로 데이터셋 생성
-            from data import create_dataset
-            
-            # 옵션 재생성 (dataroot를 임시 디렉토리로 설정)
-            # 주의: 이미 모델이 로드되어 있으므로, 옵션만 재생성 (모델은 재생성하지 않음)
-            opt = self._create_options()
-            opt.dataroot = str(temp_dir)
-            opt.num_test = 1  # 단일 이미지만 처리
-            
-            # 체크포인트 경로 확인 (디버깅)
-            save_dir = Path(opt.checkpoints_dir) / opt.name
-            load_filename = f"{opt.epoch}_net_G.pth"
-            load_path = save_dir / load_filename
-            print(f"[DEBUG] 체크포인트 경로 확인: {load_path}")
-            print(f"[DEBUG] 체크포인트 존재: {load_path.exists()}")
-            if not load_path.exists():
-                # latest 파일 확인
-                latest_path = save_dir / "latest_net_G.pth"
-                print(f"[DEBUG] latest 체크포인트 확인: {latest_path}")
-                print(f"[DEBUG] latest 체크포인트 존재: {latest_path.exists()}")
-                if latest_path.exists() and opt.epoch != 'latest':
-                    print(f"[WARNING] {load_path}를 찾을 수 없습니다. latest를 사용합니다.")
-                    opt.epoch = 'latest'
-            
-            # 데이터셋 생성
-            dataset = create_dataset(opt)
-            
-            # 데이터셋에서 첫 번째 이미지 가져오기
-            data = next(iter(dataset))
-            
-            # 모델 입력 설정
-            self.model.set_input(data)
-            
-            # 추론 실행 (test.py와 동일)
-            self.model.test()
-            
-            # 결과 가져오기
-            visuals = self.model.get_current_visuals()
-            print(f"[DEBUG] infer - visuals keys: {list(visuals.keys())}")
-            
-            # test.py는 save_images를 사용하지만, 우리는 직접 처리
-            # fake 또는 fake_B 이미지 가져오기
-            if 'fake' in visuals:
-                output_tensor = visuals['fake']
-                print(f"[DEBUG] infer - using 'fake', shape: {output_tensor.shape}, dtype: {output_tensor.dtype}")
-            elif 'fake_B' in visuals:
-                output_tensor = visuals['fake_B']
-                print(f"[DEBUG] infer - using 'fake_B', shape: {output_tensor.shape}, dtype: {output_tensor.dtype}")
-            else:
-                available_keys = list(visuals.keys())
-                print(f"[ERROR] infer - available keys: {available_keys}")
-                for key, value in visuals.items():
-                    if isinstance(value, torch.Tensor):
-                        print(f"[ERROR] infer - {key}: shape={value.shape}, dtype={value.dtype}, min={value.min().item():.4f}, max={value.max().item():.4f}")
-                raise ValueError(f"모델 출력에서 결과 이미지를 찾을 수 없습니다. 사용 가능한 키: {available_keys}")
-            
-            # test.py의 save_images와 동일한 방식으로 변환
-            # tensor2im 함수를 직접 구현 (test.py와 동일)
-            print(f"[DEBUG] infer - output_tensor shape: {output_tensor.shape}, dtype: {output_tensor.dtype}")
-            print(f"[DEBUG] infer - tensor min: {output_tensor.min().item():.4f}, max: {output_tensor.max().item():.4f}, mean: {output_tensor.mean().item():.4f}")
-            
-            # tensor2im과 동일한 로직
-            # 텐서를 CPU로 이동하고 numpy로 변환
-            if hasattr(output_tensor, 'data'):
-                image_tensor = output_tensor.data
-            else:
-                image_tensor = output_tensor
-            
-            # 배치 차원 처리
-            if len(image_tensor.shape) == 4:
-                image_tensor = image_tensor[0]  # 첫 번째 배치만 사용
-            elif len(image_tensor.shape) == 3:
-                pass  # 이미 배치 차원이 없음
-            else:
-                raise ValueError(f"Unexpected tensor shape: {image_tensor.shape}")
-            
-            # CPU로 이동하고 float로 변환 후 numpy로 변환
-            image_numpy = image_tensor.cpu().float().numpy()
-            
-            # grayscale to RGB
-            if image_numpy.shape[0] == 1:
-                image_numpy = np.tile(image_numpy, (3, 1, 1))
-            
-            # (C, H, W) -> (H, W, C)로 transpose
-            image_numpy = np.transpose(image_numpy, (1, 2, 0))
-            
-            # [-1, 1] 범위를 [0, 255]로 변환
-            image_numpy = (image_numpy + 1.0) / 2.0 * 255.0
-            image_numpy = np.clip(image_numpy, 0, 255).astype(np.uint8)
-            
-            print(f"[DEBUG] infer - image_numpy shape: {image_numpy.shape}, dtype: {image_numpy.dtype}")
-            print(f"[DEBUG] infer - image_numpy min: {image_numpy.min()}, max: {image_numpy.max()}, mean: {image_numpy.mean():.2f}")
-            
-            # PIL Image로 변환
-            output_image = Image.fromarray(image_numpy, mode='RGB')
-            
-            print(f"[DEBUG] infer - final PIL Image: size={output_image.size}, mode={output_image.mode}")
-            
-            return output_image
-            
-        finally:
-            # 임시 파일 정리
-            try:
-                if temp_image_path.exists():
-                    temp_image_path.unlink()
-            except:
-                pass
+        return self.infer_batch([image])[0]
+    
+    def memory_bytes(self) -> int:
+        """로드된 네트워크의 파라미터/버퍼가 차지하는 바이트 수 (캐시 메모리 계산용)"""
+        if self.generator is None:
+            return 0
+        nets = [self.generator]
+        if self.model is not None:
+            nets = [getattr(self.model, "net" + name) for name in self.model.model_names if isinstance(name, str)]
+        total = 0
+        for net in nets:
+            for tensor in list(net.parameters()) + list(net.buffers()):
+                total += tensor.numel() * tensor.element_size()
+        if total == 0 and self.artifact_path:
+            # freeze된 TorchScript는 가중치를 상수로 가지고 있어 parameters()가 비어 있음; 파일 크기로 근사
+            artifact_path = Path(self.artifact_path)
+            total = (artifact_path if artifact_path.is_absolute() else PROJECT_ROOT / artifact_path).stat().st_size
+        return total
     
     def get_model_info(self):
         """모델 정보 반환"""
@@ -409,6 +380,7 @@ class Pix2PixInference:
             'direction': self.direction,
             'epoch': self.epoch,
             'device': str(self.device) if self.device else 'not loaded',
-            'loaded': self.model is not None
+            'loaded': self.generator is not None,
+            'artifact': str(self.artifact_path) if self.artifact_path else None
         }
 